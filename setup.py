@@ -1,10 +1,12 @@
 from setuptools import setup
 
 base_requirements = [
-    'protobuf', 'ModestMaps', 'uritemplate', 'requests', 'httmock', 'mock'
+    'protobuf', 'ModestMaps', 'uritemplate', 'requests', 'httmock', 'mock',
     ]
 
-webserver_requirements = ['flask', 'Flask-Cors', 'gunicorn']
+webserver_requirements = ['flask', 'Flask-Cors', 'gunicorn', 'Brotli']
+
+speedups_requirements = ['numpy']
 
 dataframe_requirements = [
     'geopandas', 'mercantile', 'Rtree', 'Shapely', 'pandas', 'pyproj', 'Fiona', 'pytz',
@@ -28,11 +30,17 @@ setup(
             'sharedstreets-read-file = sharedstreets.read:main',
             'sharedstreets-get-tile = sharedstreets.tile:main',
             'sharedstreets-debug-webapp = sharedstreets.webapp:main',
+            'sharedstreets-webapp = sharedstreets.server:main',
+            'sharedstreets-render-pyramid = sharedstreets.pyramid:main',
+            'sharedstreets-import-store = sharedstreets.store:main',
+            'sharedstreets-benchmark = sharedstreets.benchmark:main',
         ]
     },
+    python_requires = '>=3.5',
     install_requires = base_requirements,
     extras_require = {
         'webserver': webserver_requirements,
         'dataframe': dataframe_requirements,
+        'speedups': speedups_requirements,
         },
 )
@@ -0,0 +1,280 @@
+import os, gc, sys, json, time, random, shutil, argparse, platform, tempfile, tracemalloc, logging
+import ModestMaps.Core
+from . import tile, mvt, tests, sharedstreets_pb2
+
+logger = logging.getLogger(__name__)
+
+# Format of saved results, changed when their structure changes
+RESULTS_VERSION = 1
+
+# Upstream DATA_ZOOM tile holding fixture and synthetic data
+DATA_X, DATA_Y = 656, 1582
+
+# Default number of synthetic geometries, similar to a dense urban tile
+SYNTHETIC_GEOMETRIES = 10000
+
+# Default number of timed runs of each stage
+REPEAT = 5
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(samples, percent):
+    ''' Return a percentile of a list of numbers with linear interpolation.
+    '''
+    samples = sorted(samples)
+    position = (len(samples) - 1) * percent / 100.
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+def _random_id(rand):
+    return '{:032x}'.format(rand.getrandbits(128))
+
+def make_synthetic_tile(dirname, geometries=SYNTHETIC_GEOMETRIES, seed=0):
+    ''' Write linked upstream layers for a dense synthetic tile to a directory.
+
+        Geometries are short random walks of 2-24 points within the DATA_ZOOM
+        tile, with two references, metadata, and end intersections shared
+        by neighboring geometries as in real street networks.
+
+        Return dictionary of layer names to object counts.
+    '''
+    rand = random.Random(seed)
+    coord = ModestMaps.Core.Coordinate(DATA_Y, DATA_X, tile.DATA_ZOOM)
+    northwest, southeast = tile.OSM.coordinateLocation(coord), tile.OSM.coordinateLocation(coord.down().right())
+    messages = {layer: [] for layer in tile.LAYERS}
+    intersections = []
+
+    def random_intersection():
+        if intersections and rand.random() < .6:
+            return rand.choice(intersections)
+
+        intersection = sharedstreets_pb2.SharedStreetsIntersection(id=_random_id(rand),
+            nodeId=rand.getrandbits(32), lon=rand.uniform(northwest.lon, southeast.lon),
+            lat=rand.uniform(southeast.lat, northwest.lat))
+        intersections.append(intersection)
+
+        return intersection
+
+    for i in range(geometries):
+        start, end = random_intersection(), random_intersection()
+        lonlats = [start.lon, start.lat]
+
+        for j in range(rand.randint(0, 22)):
+            lonlats += [lonlats[-2] + rand.gauss(0, .0002), lonlats[-1] + rand.gauss(0, .0002)]
+
+        lonlats += [end.lon, end.lat]
+        geometry = sharedstreets_pb2.SharedStreetsGeometry(id=_random_id(rand),
+            fromIntersectionId=start.id, toIntersectionId=end.id,
+            forwardReferenceId=_random_id(rand), backReferenceId=_random_id(rand),
+            roadClass=rand.randint(0, 6), lonlats=lonlats)
+        messages['geometry'].append(geometry)
+
+        for (id, first, last) in ((geometry.forwardReferenceId, start, end),
+                                  (geometry.backReferenceId, end, start)):
+            messages['reference'].append(sharedstreets_pb2.SharedStreetsReference(id=id,
+                geometryId=geometry.id, formOfWay=rand.randint(0, 7), locationReferences=[
+                    sharedstreets_pb2.LocationReference(intersectionId=first.id, lon=first.lon,
+                        lat=first.lat, outboundBearing=rand.randint(0, 359),
+                        distanceToNextRef=rand.randint(1000, 50000)),
+                    sharedstreets_pb2.LocationReference(intersectionId=last.id, lon=last.lon,
+                        lat=last.lat, inboundBearing=rand.randint(0, 359)),
+                    ]))
+            first.outboundReferenceIds.append(id)
+            last.inboundReferenceIds.append(id)
+
+        metadata = sharedstreets_pb2.SharedStreetsMetadata(geometryId=geometry.id)
+        metadata.osmMetadata.name = 'Street {}'.format(i)
+        metadata.osmMetadata.waySections.add(wayId=rand.getrandbits(32), roadClass=geometry.roadClass,
+            nodeIds=[rand.getrandbits(32) for k in range(len(lonlats) // 2)])
+        messages['metadata'].append(metadata)
+
+    messages['intersection'] = intersections
+
+    for (layer, objects) in messages.items():
+        path = os.path.join(dirname, '{}-{}-{}.{}.6.pbf'.format(tile.DATA_ZOOM, DATA_X, DATA_Y, layer))
+
+        with open(path, 'wb') as file:
+            for object in objects:
+                data = object.SerializeToString()
+                file.write(mvt.encode_varint(len(data)) + data)
+
+    return {layer: len(objects) for (layer, objects) in messages.items()}
+
+def load_fixture_tile(dirname):
+    ''' Copy bundled fixture layers to a directory, return dictionary of object counts.
+    '''
+    tests.copy_fixture_tile(dirname)
+    counts = {}
+
+    for layer in tile.LAYERS:
+        path = os.path.join(dirname, '{}-{}-{}.{}.6.pbf'.format(tile.DATA_ZOOM, DATA_X, DATA_Y, layer))
+        counts[layer] = len(list(tile.iter_objects(path, tile.data_classes[layer])))
+
+    return counts
+
+def measure(function, repeat=REPEAT):
+    ''' Time repeated calls to a function after one warm-up call.
+
+        Peak memory is measured with tracemalloc in a separate final call,
+        so its overhead does not distort timings. Return a tuple of
+        seconds list, peak bytes, and the last return value.
+    '''
+    function()
+    samples = []
+
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return samples, peak, result
+
+def iter_stages(dirname):
+    ''' Generate (name, function, objects, bytes) for each benchmarked stage.
+
+        Objects and bytes are counted per call, for throughput numbers:
+        upstream objects and bytes for decoding and selecting stages,
+        and rendered objects and output bytes for the others.
+    '''
+    paths = {layer: os.path.join(dirname, '{}-{}-{}.{}.6.pbf'.format(tile.DATA_ZOOM, DATA_X, DATA_Y, layer))
+        for layer in tile.LAYERS}
+    upstream_bytes = sum(os.path.getsize(path) for path in paths.values())
+
+    def decode():
+        return {layer: list(tile.iter_objects(path, tile.data_classes[layer]))
+            for (layer, path) in paths.items()}
+
+    upstream_objects = sum(len(objects) for objects in decode().values())
+    yield 'iter_objects', decode, upstream_objects, upstream_bytes
+
+    child = (tile.DATA_ZOOM + 2, DATA_X * 4 + 1, DATA_Y * 4 + 1)
+
+    yield 'get_tile', lambda: tile.get_tile(tile.DATA_ZOOM, DATA_X, DATA_Y, dirname), \
+        upstream_objects, upstream_bytes
+    yield 'get_tile_child', lambda: tile.get_tile(*child, data_url_template=dirname), \
+        upstream_objects, upstream_bytes
+
+    T = tile.get_tile(tile.DATA_ZOOM, DATA_X, DATA_Y, dirname)
+    rendered = len(T.geometries) + len(T.intersections)
+
+    yield 'make_geojson', lambda: json.dumps(tile.make_geojson(T)), \
+        rendered, len(json.dumps(tile.make_geojson(T)))
+    yield 'iter_geojson', lambda: b''.join(tile.iter_geojson(T)), \
+        rendered, len(b''.join(tile.iter_geojson(T)))
+    yield 'make_mvt', lambda: tile.make_mvt(T, tile.DATA_ZOOM, DATA_X, DATA_Y), \
+        rendered, len(tile.make_mvt(T, tile.DATA_ZOOM, DATA_X, DATA_Y))
+
+    try:
+        from . import dataframe
+    except ImportError:
+        logger.warning('Skipping dataframe stage without optional dataframe requirements')
+    else:
+        yield 'make_frames', lambda: dataframe._make_frames(T.intersections.values(), T.geometries.values()), \
+            rendered, None
+
+def run_stage(dataset, name, function, objects, bytes, repeat=REPEAT):
+    ''' Return a dictionary of results for one stage.
+    '''
+    samples, peak, _ = measure(function, repeat)
+    median = percentile(samples, 50)
+
+    seconds = dict(min=min(samples), mean=sum(samples) / len(samples), max=max(samples))
+    seconds.update({'p{}'.format(percent): percentile(samples, percent) for percent in PERCENTILES})
+
+    logger.info('{} {}: {:.2f}ms median, {:.0f} objects/s'.format(dataset, name,
+        median * 1000, objects / median if median else 0))
+
+    return dict(dataset=dataset, stage=name, runs=len(samples), objects=objects, bytes=bytes,
+        seconds=seconds, peak_memory_bytes=peak,
+        objects_per_s=objects / median if median else None,
+        mb_per_s=bytes / median / 1e6 if median and bytes is not None else None)
+
+def _versions():
+    versions = dict(python=platform.python_version())
+
+    for name in ('google.protobuf', 'shapely', 'geopandas', 'pandas', 'numpy'):
+        module = sys.modules.get(name)
+        if module is not None:
+            versions[name] = getattr(module, '__version__', None)
+
+    return versions
+
+def run(geometries=SYNTHETIC_GEOMETRIES, repeat=REPEAT, seed=0, stages=None):
+    ''' Run every stage against fixture and synthetic tiles, return results dictionary.
+
+        stages: Optional collection of stage names to run, default to all.
+    '''
+    results, datasets = [], {}
+    dirname = tempfile.mkdtemp(prefix='sharedstreets-benchmark-')
+
+    try:
+        for (dataset, make) in (('fixture', load_fixture_tile),
+                                ('synthetic', lambda d: make_synthetic_tile(d, geometries, seed))):
+            path = os.path.join(dirname, dataset)
+            os.mkdir(path)
+            datasets[dataset] = dict(objects=make(path), bytes=sum(os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path)))
+
+            for (name, function, objects, bytes) in iter_stages(path):
+                if stages is None or name in stages:
+                    results.append(run_stage(dataset, name, function, objects, bytes, repeat))
+    finally:
+        shutil.rmtree(dirname)
+
+    return dict(version=RESULTS_VERSION, created=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        platform=platform.platform(), versions=_versions(), repeat=repeat, seed=seed,
+        datasets=datasets, results=results)
+
+def compare(baseline, results):
+    ''' Return lines comparing median seconds of two results dictionaries.
+    '''
+    before = {(result['dataset'], result['stage']): result for result in baseline['results']}
+    lines = ['{:<10} {:<15} {:>11} {:>11} {:>7}'.format('dataset', 'stage', 'before ms', 'after ms', 'ratio')]
+
+    for result in results['results']:
+        key = (result['dataset'], result['stage'])
+        if key not in before:
+            continue
+        old, new = before[key]['seconds']['p50'], result['seconds']['p50']
+        lines.append('{:<10} {:<15} {:>11.3f} {:>11.3f} {:>7.2f}'.format(key[0], key[1],
+            old * 1000, new * 1000, new / old if old else float('nan')))
+
+    return lines
+
+parser = argparse.ArgumentParser(description='Benchmark decoding, selecting, and rendering SharedStreets tiles offline')
+parser.add_argument('--output', help='Optional path for JSON results.')
+parser.add_argument('--compare', metavar='BASELINE', help='Optional path of earlier JSON results to compare against.')
+parser.add_argument('--repeat', type=int, default=REPEAT, help='Timed runs of each stage. Default %(default)s.')
+parser.add_argument('--geometries', type=int, default=SYNTHETIC_GEOMETRIES,
+    help='Number of geometries in the synthetic tile. Default %(default)s.')
+parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic tile. Default %(default)s.')
+parser.add_argument('--stage', dest='stages', action='append', help='Stage to run, may be repeated. Default all.')
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
+    results = run(args.geometries, args.repeat, args.seed, args.stages)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print('\n'.join(compare(baseline, results)), file=sys.stderr)
@@ -0,0 +1,386 @@
+import os, glob, json, time, hashlib, logging, tempfile, threading, collections
+
+logger = logging.getLogger(__name__)
+
+# Default upper bound for on-disk tile bodies, in bytes
+DEFAULT_DISK_CACHE_BYTES = 512 * 1024 * 1024
+
+# Fraction of max_bytes a full disk cache is trimmed down to, so that
+# eviction doesn't rescan every record on each following put
+DISK_CACHE_LOW_WATER = 0.9
+
+# Default number of seconds a cached body is used without revalidation
+DEFAULT_DISK_CACHE_MAX_AGE_S = 3600
+
+# Default upper bound for decoded tiles held in memory, in bytes
+DEFAULT_MEMORY_CACHE_BYTES = 256 * 1024 * 1024
+
+# Cached upstream response: content digest, body path, and HTTP validators.
+Entry = collections.namedtuple('Entry', ['url', 'digest', 'path', 'etag', 'last_modified', 'checked'])
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+def _remove_file(path):
+    ''' Remove a file, ignoring one already removed by another cache user.
+    '''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _write_atomic(path, data):
+    ''' Write bytes to a path so concurrent readers never see partial files.
+    '''
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname, exist_ok=True)
+
+    handle, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class DiskCache:
+    ''' Content-addressed on-disk cache of upstream protobuf tile bodies.
+
+        directory: Filesystem path to hold cached bodies, created as needed.
+
+        max_bytes: Size limit for stored bodies. Least-recently used URLs
+            are evicted once a new body pushes the total over this limit,
+            until the total is under DISK_CACHE_LOW_WATER of it.
+
+        max_age: Seconds a cached body is trusted before being revalidated
+            upstream with If-None-Match and If-Modified-Since headers.
+
+        Bodies are stored once per SHA-1 digest under objects/, so tiles with
+        identical content share storage. Each URL gets a small JSON record
+        under urls/ naming its digest and HTTP validators, and the record's
+        modification time tracks when it was last used.
+
+        Instances are safe to share between threads. Files may still vanish
+        under other processes using the same directory, so missing files
+        are treated as cache misses.
+    '''
+    def __init__(self, directory, max_bytes=DEFAULT_DISK_CACHE_BYTES,
+                 max_age=DEFAULT_DISK_CACHE_MAX_AGE_S):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _url_path(self, url):
+        return os.path.join(self.directory, 'urls', _sha1(url.encode('utf8')) + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _remove_object(self, path):
+        ''' Remove a cached body along with any sidecar files named after it.
+        '''
+        _remove_file(path)
+        for sidecar in glob.glob(glob.escape(path) + '.*'):
+            _remove_file(sidecar)
+
+    def get(self, url):
+        ''' Return an Entry for a URL, or None if it's not cached.
+        '''
+        try:
+            with open(self._url_path(url)) as file:
+                record = json.load(file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        path = self._object_path(record['digest'])
+
+        if not os.path.exists(path):
+            return None
+
+        return Entry(url, record['digest'], path, record.get('etag'),
+            record.get('last_modified'), record.get('checked', 0))
+
+    def is_fresh(self, entry):
+        ''' Return True if an entry can be used without upstream revalidation.
+        '''
+        return time.time() - entry.checked < self.max_age
+
+    def request_headers(self, entry):
+        ''' Return conditional HTTP request headers for a cached entry.
+        '''
+        headers = {}
+
+        if entry is None:
+            return headers
+
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+
+        return headers
+
+    def read(self, entry):
+        ''' Return bytes of a cached body and mark its URL as recently used.
+
+            Return None if the body was evicted since get().
+        '''
+        try:
+            with open(entry.path, 'rb') as file:
+                body = file.read()
+        except FileNotFoundError:
+            return None
+
+        self.touch(entry.url)
+        return body
+
+    def touch(self, url):
+        ''' Mark a URL as recently used.
+        '''
+        try:
+            os.utime(self._url_path(url), None)
+        except OSError:
+            pass
+
+    def revalidated(self, entry):
+        ''' Record that an upstream server confirmed a cached entry is current.
+        '''
+        self._write_record(entry.url, entry.digest, entry.etag, entry.last_modified)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        ''' Store a body for a URL with optional HTTP validators.
+        '''
+        digest = _sha1(body)
+        object_path = self._object_path(digest)
+
+        with self._lock:
+            if not os.path.exists(object_path):
+                _write_atomic(object_path, body)
+                if self._total_bytes is not None:
+                    self._total_bytes += len(body)
+
+            self._write_record(url, digest, etag, last_modified)
+
+            if self._get_total_bytes() > self.max_bytes:
+                self._evict()
+
+        return self.get(url)
+
+    def _write_record(self, url, digest, etag, last_modified):
+        record = dict(url=url, digest=digest, etag=etag,
+            last_modified=last_modified, checked=time.time())
+        _write_atomic(self._url_path(url), json.dumps(record).encode('utf8'))
+
+    def _iter_records(self):
+        ''' Generate (path, mtime, record) tuples for every cached URL.
+        '''
+        dirname = os.path.join(self.directory, 'urls')
+
+        if not os.path.exists(dirname):
+            return
+
+        for filename in os.listdir(dirname):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(dirname, filename)
+            try:
+                mtime = os.path.getmtime(path)
+                with open(path) as file:
+                    record = json.load(file)
+            except (IOError, OSError, ValueError):
+                continue
+            else:
+                yield path, mtime, record
+
+    def _iter_objects(self):
+        ''' Generate (path, digest, size) tuples for every cached body.
+        '''
+        dirname = os.path.join(self.directory, 'objects')
+
+        if not os.path.exists(dirname):
+            return
+
+        for prefix in os.listdir(dirname):
+            for digest in os.listdir(os.path.join(dirname, prefix)):
+                if digest.startswith('.') or '.' in digest:
+                    # Skip temporary files and sidecars like index.SUFFIX
+                    continue
+                path = os.path.join(dirname, prefix, digest)
+                try:
+                    yield path, digest, os.path.getsize(path)
+                except FileNotFoundError:
+                    continue
+
+    def _get_total_bytes(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for (_, _, size) in self._iter_objects())
+
+        return self._total_bytes
+
+    def total_bytes(self):
+        ''' Return total size of cached bodies.
+        '''
+        with self._lock:
+            return self._get_total_bytes()
+
+    def evict(self):
+        ''' Remove least-recently used URLs until bodies fit within DISK_CACHE_LOW_WATER of max_bytes.
+        '''
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        low_water = self.max_bytes * DISK_CACHE_LOW_WATER
+        records = sorted(self._iter_records(), key=lambda r: r[1])
+        sizes = {digest: (path, size) for (path, digest, size) in self._iter_objects()}
+        refcounts = collections.Counter(record['digest'] for (_, _, record) in records)
+        total = sum(size for (_, size) in sizes.values())
+
+        # Bodies no longer named by any URL, e.g. after upstream changes
+        for digest in [d for d in sizes if refcounts[d] == 0]:
+            object_path, size = sizes.pop(digest)
+            self._remove_object(object_path)
+            total -= size
+
+        for (url_path, _, record) in records:
+            if total <= low_water:
+                break
+
+            logger.debug('Evicting {} from disk cache'.format(record['url']))
+            _remove_file(url_path)
+
+            digest = record['digest']
+            refcounts[digest] -= 1
+
+            if refcounts[digest] == 0 and digest in sizes:
+                object_path, size = sizes.pop(digest)
+                self._remove_object(object_path)
+                total -= size
+
+        self._total_bytes = total
+
+class MemoryCache:
+    ''' Thread-safe in-process LRU cache bounded by approximate size in bytes.
+
+        max_bytes: Size limit for cached values. Least-recently used values
+            are evicted once a new value pushes the total over this limit.
+
+        Counts of hits, misses, evictions, and coalesced loads are kept
+        for monitoring.
+    '''
+    def __init__(self, max_bytes=DEFAULT_MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits, self.misses, self.evictions, self.coalesced = 0, 0, 0, 0
+        self._values = collections.OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key):
+        ''' Return a cached value and mark it recently used, or None.
+        '''
+        with self._lock:
+            if key not in self._values:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._values.move_to_end(key)
+            value, _ = self._values[key]
+            return value
+
+    def put(self, key, value, size):
+        ''' Store a value with its approximate size in bytes.
+        '''
+        with self._lock:
+            if key in self._values:
+                _, old_size = self._values.pop(key)
+                self.current_bytes -= old_size
+
+            self._values[key] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def resize(self, key, size):
+        ''' Update the size of a cached value that has grown or shrunk, and mark it recently used.
+
+            Values no longer in the cache are ignored.
+        '''
+        with self._lock:
+            if key not in self._values:
+                return
+
+            value, old_size = self._values.pop(key)
+            self._values[key] = (value, size)
+            self.current_bytes += size - old_size
+            self._evict()
+
+    def _evict(self):
+        # Always keep the newest value, even if it alone is too large
+        while self.current_bytes > self.max_bytes and len(self._values) > 1:
+            _, (_, old_size) = self._values.popitem(last=False)
+            self.current_bytes -= old_size
+            self.evictions += 1
+
+    def get_or_load(self, key, load):
+        ''' Return a cached value, loading it at most once for concurrent callers.
+
+            load: Function returning a tuple with a new value and its size.
+                While it runs, other callers for the same key wait for its
+                result instead of loading again. If it raises an exception,
+                waiting callers each try to load in turn.
+        '''
+        value = self.get(key)
+
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    # Another caller loaded this value while we waited
+                    self.hits += 1
+                    self.coalesced += 1
+                    self._values.move_to_end(key)
+                    value, _ = self._values[key]
+                    return value
+
+            try:
+                value, size = load()
+                self.put(key, value, size)
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is key_lock:
+                        del self._loading[key]
+
+        return value
+
+    def clear(self):
+        ''' Remove all cached values and reset counters.
+        '''
+        with self._lock:
+            self._values.clear()
+            self.current_bytes = 0
+            self.hits, self.misses, self.evictions, self.coalesced = 0, 0, 0, 0
+
+    def stats(self):
+        ''' Return a dictionary of cache counters.
+        '''
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+            coalesced=self.coalesced, items=len(self._values), bytes=self.current_bytes,
+            max_bytes=self.max_bytes)
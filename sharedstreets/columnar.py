@@ -0,0 +1,402 @@
+# Compact columnar storage for decoded SharedStreets tiles. ColumnarTile holds
+# the same entities as tile.Tile with ids packed as 16-byte binary digests and
+# numeric fields in typed arrays, exposed through read-only mappings of hex ids
+# to row views named like the protobuf message fields they were built from.
+import abc, array, bisect, itertools, collections.abc
+from . import sharedstreets_pb2
+
+# Size of a binary SharedStreets id, an MD5 digest
+DIGEST_SIZE = 16
+
+# Stand-in for empty ids, such as a missing backReferenceId
+NULL_DIGEST = bytes(DIGEST_SIZE)
+
+def pack_id(id):
+    ''' Return a binary digest for a 32-character hex SharedStreets id.
+    '''
+    if not id:
+        return NULL_DIGEST
+
+    try:
+        digest = bytes.fromhex(id)
+    except ValueError:
+        digest = None
+
+    if digest is None or len(digest) != DIGEST_SIZE:
+        raise ValueError('Not a SharedStreets id: {}'.format(repr(id)))
+
+    return digest
+
+def unpack_id(digest):
+    ''' Return a 32-character hex SharedStreets id for a binary digest.
+    '''
+    return '' if digest == NULL_DIGEST else digest.hex()
+
+class Digests:
+    ''' Sequence of binary ids packed end to end into a single bytes object.
+    '''
+    __slots__ = ('buffer',)
+
+    def __init__(self, ids):
+        self.buffer = b''.join(map(pack_id, ids))
+
+    def __len__(self):
+        return len(self.buffer) // DIGEST_SIZE
+
+    def __getitem__(self, i):
+        return self.buffer[i*DIGEST_SIZE:(i+1)*DIGEST_SIZE]
+
+    def hex(self, i):
+        return unpack_id(self[i])
+
+    def nbytes(self):
+        return len(self.buffer)
+
+class Offsets:
+    ''' Start and end positions of variable-length rows in a flat column.
+    '''
+    __slots__ = ('positions',)
+
+    def __init__(self, lengths):
+        self.positions = array.array('L', [0])
+        self.positions.extend(itertools.accumulate(lengths))
+
+    def __getitem__(self, i):
+        return self.positions[i], self.positions[i+1]
+
+    def nbytes(self):
+        return self.positions.itemsize * len(self.positions)
+
+def _nbytes(*columns):
+    return sum(column.nbytes() if hasattr(column, 'nbytes') else column.itemsize * len(column)
+        for column in columns)
+
+class _SortedIds:
+    ''' Sequence view of a table's digests in sorted order, for bisect.
+    '''
+    __slots__ = ('table',)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table.order)
+
+    def __getitem__(self, i):
+        return self.table.keys[self.table.order[i]]
+
+class _Rows (collections.abc.ValuesView):
+    ''' Values view yielding rows in table order, without looking up keys.
+    '''
+    def __iter__(self):
+        return map(self._mapping.row, range(len(self._mapping)))
+
+class Table (collections.abc.Mapping):
+    ''' Read-only mapping of hex ids to row views, in original order.
+
+        Rows are found by binary search over packed digests, so no
+        per-row Python objects are kept.
+    '''
+    def __init__(self, keys):
+        self.keys = Digests(keys)
+        self.order = array.array('L', sorted(range(len(self.keys)), key=self.keys.__getitem__))
+
+    def index(self, id):
+        ''' Return row number for a hex id, or raise KeyError.
+        '''
+        try:
+            digest = pack_id(id)
+        except (ValueError, TypeError):
+            raise KeyError(id)
+
+        sorted_ids = _SortedIds(self)
+        i = bisect.bisect_left(sorted_ids, digest)
+
+        if not id or i == len(sorted_ids) or sorted_ids[i] != digest:
+            raise KeyError(id)
+
+        return self.order[i]
+
+    def __getitem__(self, id):
+        return self.row(self.index(id))
+
+    def __contains__(self, id):
+        try:
+            self.index(id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return map(self.keys.hex, range(len(self.keys)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def values(self):
+        return _Rows(self)
+
+    def items(self):
+        return zip(self, self.values())
+
+    @abc.abstractmethod
+    def row(self, i):
+        ''' Return a row view for a row number.
+        '''
+
+    def nbytes(self):
+        return _nbytes(self.keys, self.order)
+
+class _Row:
+    ''' Base view of a single table row.
+    '''
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table, self.index = table, index
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.table is other.table and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.id)
+
+    @property
+    def id(self):
+        return self.table.keys.hex(self.index)
+
+class GeometryRow (_Row):
+    ''' Read-only view of a SharedStreetsGeometry.
+    '''
+    __slots__ = ()
+
+    fromIntersectionId = property(lambda self: self.table.fromIntersectionIds.hex(self.index))
+    toIntersectionId = property(lambda self: self.table.toIntersectionIds.hex(self.index))
+    forwardReferenceId = property(lambda self: self.table.forwardReferenceIds.hex(self.index))
+    backReferenceId = property(lambda self: self.table.backReferenceIds.hex(self.index))
+    roadClass = property(lambda self: self.table.roadClasses[self.index])
+
+    @property
+    def lonlats(self):
+        start, end = self.table.offsets[self.index]
+        return memoryview(self.table.lonlats)[start:end]
+
+    def to_message(self):
+        return sharedstreets_pb2.SharedStreetsGeometry(id=self.id,
+            fromIntersectionId=self.fromIntersectionId, toIntersectionId=self.toIntersectionId,
+            forwardReferenceId=self.forwardReferenceId, backReferenceId=self.backReferenceId,
+            roadClass=self.roadClass, lonlats=self.lonlats.tolist())
+
+class GeometryTable (Table):
+    ''' Columns of SharedStreetsGeometry fields, with lonlats in one flat array.
+    '''
+    def __init__(self, geometries):
+        geometries = list(geometries)
+        Table.__init__(self, [geom.id for geom in geometries])
+        self.fromIntersectionIds = Digests(geom.fromIntersectionId for geom in geometries)
+        self.toIntersectionIds = Digests(geom.toIntersectionId for geom in geometries)
+        self.forwardReferenceIds = Digests(geom.forwardReferenceId for geom in geometries)
+        self.backReferenceIds = Digests(geom.backReferenceId for geom in geometries)
+        self.roadClasses = array.array('B', [geom.roadClass for geom in geometries])
+        self.offsets = Offsets(len(geom.lonlats) for geom in geometries)
+        self.lonlats = array.array('d', itertools.chain(*[geom.lonlats for geom in geometries]))
+
+    def row(self, i):
+        return GeometryRow(self, i)
+
+    def nbytes(self):
+        return Table.nbytes(self) + _nbytes(self.fromIntersectionIds, self.toIntersectionIds,
+            self.forwardReferenceIds, self.backReferenceIds, self.roadClasses,
+            self.offsets, self.lonlats)
+
+class IntersectionRow (_Row):
+    ''' Read-only view of a SharedStreetsIntersection.
+    '''
+    __slots__ = ()
+
+    nodeId = property(lambda self: self.table.nodeIds[self.index])
+    lon = property(lambda self: self.table.lons[self.index])
+    lat = property(lambda self: self.table.lats[self.index])
+
+    @property
+    def inboundReferenceIds(self):
+        start, end = self.table.inboundOffsets[self.index]
+        return [self.table.inboundReferenceIds.hex(i) for i in range(start, end)]
+
+    @property
+    def outboundReferenceIds(self):
+        start, end = self.table.outboundOffsets[self.index]
+        return [self.table.outboundReferenceIds.hex(i) for i in range(start, end)]
+
+    def to_message(self):
+        return sharedstreets_pb2.SharedStreetsIntersection(id=self.id, nodeId=self.nodeId,
+            lon=self.lon, lat=self.lat, inboundReferenceIds=self.inboundReferenceIds,
+            outboundReferenceIds=self.outboundReferenceIds)
+
+class IntersectionTable (Table):
+    ''' Columns of SharedStreetsIntersection fields.
+    '''
+    def __init__(self, intersections):
+        intersections = list(intersections)
+        Table.__init__(self, [inter.id for inter in intersections])
+        self.nodeIds = array.array('Q', [inter.nodeId for inter in intersections])
+        self.lons = array.array('d', [inter.lon for inter in intersections])
+        self.lats = array.array('d', [inter.lat for inter in intersections])
+        self.inboundOffsets = Offsets(len(inter.inboundReferenceIds) for inter in intersections)
+        self.inboundReferenceIds = Digests(itertools.chain(*[inter.inboundReferenceIds for inter in intersections]))
+        self.outboundOffsets = Offsets(len(inter.outboundReferenceIds) for inter in intersections)
+        self.outboundReferenceIds = Digests(itertools.chain(*[inter.outboundReferenceIds for inter in intersections]))
+
+    def row(self, i):
+        return IntersectionRow(self, i)
+
+    def nbytes(self):
+        return Table.nbytes(self) + _nbytes(self.nodeIds, self.lons, self.lats,
+            self.inboundOffsets, self.inboundReferenceIds, self.outboundOffsets,
+            self.outboundReferenceIds)
+
+class LocationReferenceRow:
+    ''' Read-only view of a LocationReference within a reference table.
+    '''
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table, self.index = table, index
+
+    intersectionId = property(lambda self: self.table.intersectionIds.hex(self.index))
+    lon = property(lambda self: self.table.lons[self.index])
+    lat = property(lambda self: self.table.lats[self.index])
+    inboundBearing = property(lambda self: self.table.inboundBearings[self.index])
+    outboundBearing = property(lambda self: self.table.outboundBearings[self.index])
+    distanceToNextRef = property(lambda self: self.table.distancesToNextRef[self.index])
+
+    def to_message(self):
+        return sharedstreets_pb2.LocationReference(intersectionId=self.intersectionId,
+            lon=self.lon, lat=self.lat, inboundBearing=self.inboundBearing,
+            outboundBearing=self.outboundBearing, distanceToNextRef=self.distanceToNextRef)
+
+class ReferenceRow (_Row):
+    ''' Read-only view of a SharedStreetsReference.
+    '''
+    __slots__ = ()
+
+    geometryId = property(lambda self: self.table.geometryIds.hex(self.index))
+    formOfWay = property(lambda self: self.table.formsOfWay[self.index])
+
+    @property
+    def locationReferences(self):
+        start, end = self.table.offsets[self.index]
+        return [LocationReferenceRow(self.table, i) for i in range(start, end)]
+
+    def to_message(self):
+        return sharedstreets_pb2.SharedStreetsReference(id=self.id, geometryId=self.geometryId,
+            formOfWay=self.formOfWay, locationReferences=[LR.to_message() for LR in self.locationReferences])
+
+class ReferenceTable (Table):
+    ''' Columns of SharedStreetsReference fields, with location references flattened.
+    '''
+    def __init__(self, references):
+        references = list(references)
+        Table.__init__(self, [ref.id for ref in references])
+        self.geometryIds = Digests(ref.geometryId for ref in references)
+        self.formsOfWay = array.array('B', [ref.formOfWay for ref in references])
+        self.offsets = Offsets(len(ref.locationReferences) for ref in references)
+
+        LRs = list(itertools.chain(*[ref.locationReferences for ref in references]))
+        self.intersectionIds = Digests(LR.intersectionId for LR in LRs)
+        self.lons = array.array('d', [LR.lon for LR in LRs])
+        self.lats = array.array('d', [LR.lat for LR in LRs])
+        self.inboundBearings = array.array('i', [LR.inboundBearing for LR in LRs])
+        self.outboundBearings = array.array('i', [LR.outboundBearing for LR in LRs])
+        self.distancesToNextRef = array.array('i', [LR.distanceToNextRef for LR in LRs])
+
+    def row(self, i):
+        return ReferenceRow(self, i)
+
+    def nbytes(self):
+        return Table.nbytes(self) + _nbytes(self.geometryIds, self.formsOfWay, self.offsets,
+            self.intersectionIds, self.lons, self.lats, self.inboundBearings,
+            self.outboundBearings, self.distancesToNextRef)
+
+class MetadataRow (_Row):
+    ''' Read-only view of a serialized SharedStreetsMetadata.
+
+        The geometryId is read from the table's keys, and other fields are
+        read from a message decoded each time they are accessed.
+    '''
+    __slots__ = ()
+
+    geometryId = property(lambda self: self.table.keys.hex(self.index))
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.geometryId)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in _Row.__slots__:
+            # Unset slots, such as while unpickling, are not message fields
+            raise AttributeError(name)
+
+        return getattr(self.to_message(), name)
+
+    def to_message(self):
+        start, end = self.table.offsets[self.index]
+        metadata = sharedstreets_pb2.SharedStreetsMetadata()
+        metadata.ParseFromString(self.table.messages[start:end])
+        return metadata
+
+class MetadataTable (Table):
+    ''' Serialized SharedStreetsMetadata messages keyed by geometry id.
+
+        Metadata are deeply nested and rarely read, so each row is kept in
+        its compact wire format and decoded only when fields are accessed.
+    '''
+    def __init__(self, metadata):
+        messages = [(meta.geometryId, meta.SerializeToString()) for meta in metadata]
+        Table.__init__(self, [geometryId for (geometryId, _) in messages])
+        self.offsets = Offsets(len(message) for (_, message) in messages)
+        self.messages = b''.join(message for (_, message) in messages)
+
+    def row(self, i):
+        return MetadataRow(self, i)
+
+    def nbytes(self):
+        return Table.nbytes(self) + _nbytes(self.offsets) + len(self.messages)
+
+class ColumnarTile:
+    ''' Compact, read-only alternative to tile.Tile.
+
+        geometries, intersections, references, metadata: Iterables of
+            SharedStreets protobuf objects, or of other ColumnarTile rows.
+
+        envelopes: Optional tile.Envelopes instance for geometries.
+    '''
+    def __init__(self, geometries, intersections, references, metadata, envelopes=None):
+        self.geometries = GeometryTable(geometries)
+        self.intersections = IntersectionTable(intersections)
+        self.references = ReferenceTable(references)
+        self.metadata = MetadataTable(metadata)
+        self.envelopes = envelopes
+
+    @staticmethod
+    def from_tile(tile):
+        ''' Return a new ColumnarTile with the contents of a tile.Tile.
+
+            Envelopes are not carried over, because they refer to the
+            original geometry objects.
+        '''
+        return ColumnarTile(tile.geometries.values(), tile.intersections.values(),
+            tile.references.values(), tile.metadata.values())
+
+    def nbytes(self):
+        ''' Return approximate size of contained columns in bytes.
+        '''
+        size = sum(table.nbytes() for table in (self.geometries,
+            self.intersections, self.references, self.metadata))
+
+        if self.envelopes is not None:
+            size += self.envelopes.nbytes()
+
+        return size
@@ -3,14 +3,44 @@ import functools
 import operator
 import logging
 import collections
+import concurrent.futures
+import time
+import numpy
+import shapely
 import geopandas
 import mercantile
+import ModestMaps.Geo
 from shapely.geometry import box
 from .. import tile
 
+logger = logging.getLogger(__name__)
+
 # Container for dataframes of SharedStreets geometries and intersections.
 Frames = collections.namedtuple('Frames', ['intersections', 'geometries'])
 
+# Number of upstream tiles fetched at once by get_bbox()
+BBOX_CONCURRENCY = 8
+
+# Number of additional attempts for each failed upstream tile
+BBOX_RETRIES = 2
+
+# Seconds to wait before first retry, doubled for each subsequent retry
+BBOX_RETRY_DELAY_S = .5
+
+# Upstream layers used in frames, others are loaded only if accessed
+LAYERS = ('geometry', 'intersection')
+
+class FetchError (IOError):
+    ''' One or more upstream tiles could not be fetched.
+
+        failures: Dictionary of (x, y) DATA_ZOOM tile coordinates to the
+            last exception raised for each failed tile.
+    '''
+    def __init__(self, failures):
+        self.failures = failures
+        IOError.__init__(self, 'Failed to fetch {} tile(s): {}'.format(len(failures),
+            ', '.join('{}/{}/{}'.format(tile.DATA_ZOOM, x, y) for (x, y) in sorted(failures))))
+
 class _Feature:
     ''' Simple implementation of __geo_interface__ for GeoDataFrame.from_features().
     '''
@@ -20,8 +50,14 @@ class _Feature:
             'geometry': {'type': type, 'coordinates': coordinates},
             }
 
-def _make_frames(intersections, geometries, bounds=None):
-    ''' Return a Frames instance for lists of SharedStreets entities.
+# Shapely 2 builds arrays of geometries from arrays of coordinates
+VECTORIZED = hasattr(shapely, 'linestrings') and hasattr(shapely, 'points')
+
+# Coordinate reference system of all frames
+CRS = {'init': 'epsg:4326'}
+
+def _feature_frames(intersections, geometries):
+    ''' Return a pair of GeoDataFrames built one feature at a time.
     '''
     ifeatures = [
         _Feature({
@@ -43,34 +79,141 @@ def _make_frames(intersections, geometries, bounds=None):
         for item in geometries
         ]
 
+    return (geopandas.GeoDataFrame.from_features(ifeatures, crs=CRS),
+        geopandas.GeoDataFrame.from_features(gfeatures, crs=CRS))
+
+def _columnar_frames(intersections, geometries):
+    ''' Return a pair of GeoDataFrames built from whole columns at once.
+
+        Coordinates are copied into flat arrays and converted to points and
+        linestrings in bulk, with no intermediate per-feature dictionaries.
+    '''
+    intersections, geometries = list(intersections), list(geometries)
+
+    lons = numpy.fromiter((item.lon for item in intersections), 'f8', len(intersections))
+    lats = numpy.fromiter((item.lat for item in intersections), 'f8', len(intersections))
+
+    idf = geopandas.GeoDataFrame({
+        'geometry': shapely.points(lons, lats),
+        'id': [item.id for item in intersections],
+        'nodeId': [item.nodeId for item in intersections],
+        'inboundReferenceIds': [list(item.inboundReferenceIds) for item in intersections],
+        'outboundReferenceIds': [list(item.outboundReferenceIds) for item in intersections],
+        }, crs=CRS)
+
+    # Each linestring covers a run of rows in one coordinate array
+    counts = numpy.fromiter((len(item.lonlats) // 2 for item in geometries), numpy.intp, len(geometries))
+    lonlats = numpy.fromiter(itertools.chain.from_iterable(item.lonlats for item in geometries),
+        'f8', int(counts.sum()) * 2)
+    indices = numpy.repeat(numpy.arange(len(geometries)), counts)
+
+    # Geometries with no coordinates stay empty, like in _feature_frames()
+    linestrings = numpy.full(len(geometries), shapely.LineString(), dtype=object)
+
+    if len(lonlats):
+        shapely.linestrings(lonlats.reshape(-1, 2), indices=indices, out=linestrings)
+
+    gdf = geopandas.GeoDataFrame({
+        'geometry': linestrings,
+        'id': [item.id for item in geometries],
+        'roadClass': [item.roadClass for item in geometries],
+        'fromIntersectionId': [item.fromIntersectionId for item in geometries],
+        'toIntersectionId': [item.toIntersectionId for item in geometries],
+        'forwardReferenceId': [item.forwardReferenceId for item in geometries],
+        'backReferenceId': [item.backReferenceId for item in geometries],
+        }, crs=CRS)
+
+    return idf, gdf
+
+def _make_frames(intersections, geometries, bounds=None):
+    ''' Return a Frames instance for lists of SharedStreets entities.
+    '''
     def clip_bbox(gdf):
         if bounds is None:
             return gdf
         index = list(gdf.sindex.intersection(bounds))
         return gdf.iloc[index]
 
-    def make_frame(features):
-        gdf = geopandas.GeoDataFrame.from_features(features, crs={'init': 'epsg:4326'})
+    def index_frame(gdf):
         return gdf.set_index('id', drop=False, verify_integrity=True)
 
-    intersectionsdf = clip_bbox(make_frame(ifeatures))
-    geometriesdf = clip_bbox(make_frame(gfeatures))
+    make_frames = _columnar_frames if VECTORIZED else _feature_frames
+    intersectionsdf, geometriesdf = make_frames(intersections, geometries)
 
-    return Frames(intersectionsdf, geometriesdf)
+    return Frames(clip_bbox(index_frame(intersectionsdf)), clip_bbox(index_frame(geometriesdf)))
 
-def get_bbox(minlon, minlat, maxlon, maxlat, data_url_template=None):
+def _get_tile_retrying(x, y, data_url_template, retries, retry_delay, **kwargs):
+    ''' Get a single tile.Tile instance at DATA_ZOOM, retrying on I/O errors.
+
+        Return a tuple with the Tile or None, and the last exception or None.
+    '''
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+        try:
+            return tile.get_tile(tile.DATA_ZOOM, x, y, data_url_template, **kwargs), None
+        except IOError as error:
+            logger.warning('Attempt {} of {} for tile {}/{}/{} failed: {}'.format(
+                attempt + 1, retries + 1, tile.DATA_ZOOM, x, y, error))
+            last_error = error
+
+    return None, last_error
+
+def get_bbox(minlon, minlat, maxlon, maxlat, data_url_template=None,
+             tile_cache=tile.DATA_TILE_CACHE, max_workers=None, retries=None,
+             retry_delay=None, session=None):
     ''' Get a single Frames instance of SharedStreets entities in an area.
+
+        tile_cache: Optional cache.MemoryCache instance for decoded upstream
+            tiles, default to shared tile.DATA_TILE_CACHE.
+
+        max_workers: Number of upstream tiles to fetch at once, default
+            to BBOX_CONCURRENCY.
+
+        retries, retry_delay: Number of additional attempts for each failed
+            tile and initial seconds between them, default to BBOX_RETRIES
+            and BBOX_RETRY_DELAY_S. FetchError is raised listing every tile
+            that still failed after all retries.
+
+        session: Optional requests.Session for upstream protobuf tiles shared
+            by all workers, default to tile.transport.get_session().
     '''
+    if max_workers is None:
+        max_workers = BBOX_CONCURRENCY
+    if retries is None:
+        retries = BBOX_RETRIES
+    if retry_delay is None:
+        retry_delay = BBOX_RETRY_DELAY_S
+
     bounds = (minlon, minlat, maxlon, maxlat)
     ul = mercantile.tile(minlon, maxlat, tile.DATA_ZOOM)
     lr = mercantile.tile(maxlon, minlat, tile.DATA_ZOOM)
+    xys = list(itertools.product(range(ul.x, lr.x+1), range(ul.y, lr.y+1)))
     
-    tiles = [
-        tile.get_tile(tile.DATA_ZOOM, x, y, data_url_template) for (x, y)
-        in itertools.product(range(ul.x, lr.x+1), range(ul.y, lr.y+1))
-        ]
+    def get_one_tile(xy):
+        return _get_tile_retrying(xy[0], xy[1], data_url_template, retries,
+            retry_delay, tile_cache=tile_cache, session=session, layers=LAYERS)
+    
+    # Results from map() arrive in the same order as tile coordinates
+    with concurrent.futures.ThreadPoolExecutor(max(1, min(max_workers, len(xys)))) as executor:
+        results = list(executor.map(get_one_tile, xys))
+    
+    failures = {xy: error for (xy, (_, error)) in zip(xys, results) if error is not None}
+    
+    if failures:
+        raise FetchError(failures)
+    
+    tiles = [T for (T, _) in results]
+    southwest = ModestMaps.Geo.Location(minlat, minlon)
+    northeast = ModestMaps.Geo.Location(maxlat, maxlon)
+    
+    def nearby_geometries(T):
+        # Use spatial index of whole data tiles to skip distant geometries
+        if isinstance(T.envelopes, tile.Envelopes):
+            return {geom.id: geom for geom in T.envelopes.select(southwest, northeast)}
+        return T.geometries
     
-    all_geometries = functools.reduce(lambda d, t: dict(d, **t.geometries), tiles, {})
+    all_geometries = functools.reduce(lambda d, t: dict(d, **nearby_geometries(t)), tiles, {})
     all_intersections = functools.reduce(lambda d, t: dict(d, **t.intersections), tiles, {})
 
     return _make_frames(all_intersections.values(), all_geometries.values(), bounds)
@@ -78,8 +221,11 @@ def get_bbox(minlon, minlat, maxlon, maxlat, data_url_template=None):
 def get_tile(*args, **kwargs):
     ''' Get a single Frames instance for a tile of SharedStreets entities.
     
-        All arguments are passed to tile.get_tile().
+        All arguments are passed to tile.get_tile(), with tile_cache
+        defaulting to shared tile.DATA_TILE_CACHE and layers to LAYERS.
     '''
+    kwargs.setdefault('tile_cache', tile.DATA_TILE_CACHE)
+    kwargs.setdefault('layers', LAYERS)
     logging.debug('get_tile', args, kwargs)
     T = tile.get_tile(*args, **kwargs)
 
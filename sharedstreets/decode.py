@@ -0,0 +1,230 @@
+# Parallel decoding of SharedStreets protobuf layers. Parsing runs under the GIL,
+# so large layers are split at frame boundaries, copied once into shared memory,
+# and parsed by a pool of processes returning compact columnar tables. Shared
+# memory needs Python 3.8, and older versions always decode in-process.
+import os, time, threading, logging, multiprocessing, concurrent.futures
+import google.protobuf.message
+from . import sharedstreets_pb2, stream, columnar, predicates, stats as _stats
+
+logger = logging.getLogger(__name__)
+
+# Layers smaller than this many bytes are decoded in the calling process
+MIN_PARALLEL_BYTES = 1024**2
+
+# Columnar table classes built by worker processes for each protobuf class
+TABLE_CLASSES = {
+    sharedstreets_pb2.SharedStreetsGeometry: columnar.GeometryTable,
+    sharedstreets_pb2.SharedStreetsIntersection: columnar.IntersectionTable,
+    sharedstreets_pb2.SharedStreetsReference: columnar.ReferenceTable,
+    sharedstreets_pb2.SharedStreetsMetadata: columnar.MetadataTable,
+    }
+
+_executor, _processes, _executor_lock = None, 0, threading.Lock()
+
+def get_shared_memory():
+    ''' Return the multiprocessing.shared_memory module, or None before Python 3.8.
+    '''
+    try:
+        import multiprocessing.shared_memory
+    except ImportError:
+        return None
+
+    return multiprocessing.shared_memory
+
+def start(processes=None):
+    ''' Start a shared pool of decoding processes, default one per CPU.
+
+        Workers are spawned rather than forked, so they are safe to start
+        from threaded servers. Return number of processes, or 0 where
+        shared memory is unavailable and layers are decoded in-process.
+
+        Spawned workers re-import the main module, so scripts must call
+        this under a guard:
+
+            if __name__ == '__main__':
+                sharedstreets.decode.start()
+    '''
+    global _executor, _processes
+
+    if get_shared_memory() is None:
+        logger.warning('Parallel decoding needs Python 3.8 or later, decoding in-process')
+        return 0
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+
+        _executor, _processes = concurrent.futures.ProcessPoolExecutor(processes,
+            mp_context=multiprocessing.get_context('spawn')), processes
+
+    return processes
+
+def stop():
+    ''' Shut down the shared pool of decoding processes, if started.
+    '''
+    global _executor, _processes
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor, _processes = None, 0
+
+def get_executor():
+    ''' Return the shared concurrent.futures.ProcessPoolExecutor, or None.
+    '''
+    return _executor
+
+def iter_parsed(messages, DataClass, stats, predicate=None):
+    ''' Generate parsed objects from message buffers.
+
+        stats: stats.LayerStats instance to count decoded messages and time.
+
+        predicate: Optional object with match_message() and match_object()
+            methods, see tile.iter_objects().
+    '''
+    match_message = predicate.match_message if predicate is not None and predicates.WIRE_SCAN else None
+    match_object = predicate.match_object if predicate is not None and not predicates.WIRE_SCAN else None
+
+    for message in messages:
+        if match_message is not None and not match_message(message):
+            continue
+
+        start = time.perf_counter()
+
+        try:
+            object = DataClass()
+            object.ParseFromString(message)
+        except google.protobuf.message.DecodeError:
+            # Empty tile? Shrug.
+            continue
+        finally:
+            stats.decode_seconds += time.perf_counter() - start
+
+        stats.decoded += 1
+
+        if match_object is None or match_object(object):
+            yield object
+
+def _iter_counted(messages, stats):
+    for message in messages:
+        stats.messages += 1
+        yield message
+
+def split_frames(buffer, parts):
+    ''' Return a list of (start, end) positions of spans holding whole frames.
+
+        Spans are close to len(buffer) / parts bytes each. A truncated frame
+        at the end of the buffer is left in the last span.
+    '''
+    view, spans, start, position = memoryview(buffer), [], 0, 0
+    size = max(1, len(view) // max(1, parts))
+
+    while position < len(view):
+        try:
+            length, frame_start = stream.read_varint(view, position)
+        except IndexError:
+            position = len(view)
+            break
+
+        position = min(frame_start + length, len(view))
+
+        if position - start >= size:
+            spans.append((start, position))
+            start = position
+
+    if start < position:
+        spans.append((start, position))
+
+    return spans
+
+def decode_span(name, start, end, class_name, predicate=None):
+    ''' Return a columnar table and stats.LayerStats for a span of shared memory.
+
+        class_name: Name of a protobuf class in sharedstreets_pb2. Generated
+            classes don't pickle, so workers look them up by name.
+
+        Runs in a worker process, see decode_buffer().
+    '''
+    DataClass = getattr(sharedstreets_pb2, class_name)
+    memory = get_shared_memory().SharedMemory(name=name)
+
+    try:
+        # Copy out the span so no views of shared memory outlive it
+        buffer = bytes(memory.buf[start:end])
+    finally:
+        memory.close()
+
+    stats = _stats.LayerStats()
+    messages = _iter_counted(stream.iter_buffer_frames(buffer), stats)
+    table = TABLE_CLASSES[DataClass](iter_parsed(messages, DataClass, stats, predicate))
+
+    return table, stats
+
+def decode_buffer(buffer, DataClass, stats=None, predicate=None, executor=None):
+    ''' Return a list of objects from a buffer of length-delimited messages.
+
+        stats: Optional stats.LayerStats instance to count messages and time.
+            Decode time is measured in the calling process, so parallel
+            decoding counts elapsed time, not time spent in each worker.
+
+        predicate: Optional object for iter_parsed().
+
+        executor: Optional process pool, default to the one from start().
+
+        With a process pool and a buffer of at least MIN_PARALLEL_BYTES,
+        the buffer is split into one span per process and objects come back
+        as read-only columnar rows, see columnar.ColumnarTile. Otherwise
+        they are protobuf objects parsed in this process.
+    '''
+    if stats is None:
+        stats = _stats.LayerStats()
+
+    if executor is None:
+        executor = get_executor()
+
+    shared_memory = None if executor is None else get_shared_memory()
+
+    if shared_memory is None or not len(buffer) or len(buffer) < MIN_PARALLEL_BYTES:
+        messages = _iter_counted(stream.iter_buffer_frames(buffer), stats)
+        return list(iter_parsed(messages, DataClass, stats, predicate))
+
+    start = time.perf_counter()
+    memory = shared_memory.SharedMemory(create=True, size=len(buffer))
+
+    try:
+        memory.buf[:len(buffer)] = buffer
+        spans = split_frames(buffer, _processes or os.cpu_count() or 1)
+        futures = [executor.submit(decode_span, memory.name, span_start, span_end,
+            DataClass.DESCRIPTOR.name, predicate)
+            for (span_start, span_end) in spans]
+        results = [future.result() for future in futures]
+    finally:
+        memory.close()
+        memory.unlink()
+
+    objects = []
+
+    for (table, span_stats) in results:
+        objects.extend(table.values())
+        stats.messages += span_stats.messages
+        stats.decoded += span_stats.decoded
+
+    stats.decode_seconds += time.perf_counter() - start
+    logger.debug('Decoded {} objects in {} spans'.format(len(objects), len(spans)))
+
+    return objects
+
+def add_decode_arguments(parser):
+    ''' Add parallel decoding option to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--decode-processes', type=int, default=0,
+        help='Number of processes for decoding large upstream layers, 0 to decode in-process. Default %(default)s.')
+
+def decode_from_arguments(args):
+    ''' Start a pool of decoding processes for parsed arguments, if requested.
+    '''
+    if args.decode_processes > 0:
+        start(args.decode_processes)
@@ -0,0 +1,122 @@
+import os, logging, threading
+from . import stream, wire
+
+logger = logging.getLogger(__name__)
+
+# Sidecar index files are named after their layer file with this suffix
+SUFFIX = '.idx'
+
+# First line of every sidecar index file
+HEADER = 'sharedstreets-index 1'
+
+# All SharedStreets layer messages keep their key string in field 1:
+# id for geometries, intersections, and references, geometryId for metadata.
+KEY_FIELD = 1
+
+# Recently used indexes keyed on (path, size, mtime), to skip rereading sidecars
+_recent, _recent_lock, _recent_limit = {}, threading.Lock(), 64
+
+def _file_key(path):
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+def _remember(key, offsets):
+    with _recent_lock:
+        if len(_recent) >= _recent_limit:
+            _recent.clear()
+        _recent[key] = offsets
+
+def read_key(message):
+    ''' Return the key string of a SharedStreets layer message buffer, or None.
+    '''
+    try:
+        return wire.read_string(message, KEY_FIELD)
+    except (IndexError, ValueError):
+        return None
+
+def build_index(buffer):
+    ''' Return a dictionary of keys to (offset, length) of messages in a buffer.
+
+        Offsets point past each varint length prefix to the message itself.
+        Only the first message is indexed for a key found more than once.
+    '''
+    view, position, offsets = memoryview(buffer), 0, {}
+
+    while position < len(view):
+        try:
+            length, offset = stream.read_varint(view, position)
+        except IndexError:
+            break
+
+        if offset + length > len(view):
+            break
+
+        key = read_key(view[offset:offset+length])
+
+        if key is not None and key not in offsets:
+            offsets[key] = (offset, length)
+
+        position = offset + length
+
+    return offsets
+
+def write_index(path, offsets):
+    ''' Write a sidecar index file for a layer file path.
+    '''
+    _, size, mtime_ns = _file_key(path)
+    tmp_path = '{}{}.tmp-{}'.format(path, SUFFIX, os.getpid())
+
+    try:
+        with open(tmp_path, 'w') as file:
+            print(HEADER, size, mtime_ns, file=file)
+            for (key, (offset, length)) in offsets.items():
+                print(key, offset, length, sep='\t', file=file)
+        os.replace(tmp_path, path + SUFFIX)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_index(path):
+    ''' Return a dictionary from the sidecar index for a layer file path.
+
+        Return None if the sidecar is missing or older than the layer file.
+    '''
+    key = _file_key(path)
+
+    if key in _recent:
+        return _recent[key]
+
+    try:
+        with open(path + SUFFIX) as file:
+            header = file.readline().split()
+            if header != HEADER.split() + [str(key[1]), str(key[2])]:
+                return None
+            offsets = {}
+            for line in file:
+                id, offset, length = line.rstrip('\n').split('\t')
+                offsets[id] = (int(offset), int(length))
+    except (IOError, OSError, ValueError):
+        return None
+
+    _remember(key, offsets)
+    return offsets
+
+def get_index(path, buffer):
+    ''' Return a dictionary of keys to (offset, length) for a layer file path.
+
+        buffer: Contents of the layer file, scanned if no current sidecar
+            index exists. A new sidecar is then written next to the file
+            when its directory is writable.
+    '''
+    offsets = read_index(path)
+
+    if offsets is None:
+        logger.debug('Indexing {}'.format(path))
+        offsets = build_index(buffer)
+        try:
+            write_index(path, offsets)
+        except (IOError, OSError) as error:
+            logger.debug('Could not write index for {}: {}'.format(path, error))
+        _remember(_file_key(path), offsets)
+
+    return offsets
@@ -0,0 +1,55 @@
+import os, mmap, logging
+import urllib.parse, urllib.request
+
+logger = logging.getLogger(__name__)
+
+# File names of upstream protobuf tiles within a local directory mirror
+FILENAME_TEMPLATE = '{z}-{x}-{y}.{layer}.6.pbf'
+
+def url_path(url):
+    ''' Return a filesystem path for a file:// URL or plain path, or None.
+    '''
+    if not isinstance(url, str):
+        return None
+
+    parsed = urllib.parse.urlparse(url)
+
+    if parsed.scheme == 'file':
+        return urllib.request.url2pathname(parsed.path)
+
+    if parsed.scheme == '' or (len(parsed.scheme) == 1 and os.name == 'nt'):
+        # Plain path, possibly with a Windows drive letter
+        return url
+
+    return None
+
+def resolve_template(data_url_template):
+    ''' Return a URI template for upstream tiles, expanding directory roots.
+
+        data_url_template: RFC 6570 URI template, or a path to a directory
+            of upstream protobuf tiles named like FILENAME_TEMPLATE.
+    '''
+    path = url_path(data_url_template)
+
+    if path is not None and os.path.isdir(path):
+        return os.path.join(path, FILENAME_TEMPLATE)
+
+    return data_url_template
+
+def map_file(path):
+    ''' Return a read-only memoryview of a memory-mapped file, or None if missing.
+
+        The mapping is closed when the last view referencing it is released.
+    '''
+    try:
+        file = open(path, 'rb')
+    except (IOError, OSError) as error:
+        logger.debug('Could not open {}: {}'.format(path, error))
+        return None
+
+    with file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            return memoryview(b'')
+
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
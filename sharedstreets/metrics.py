@@ -0,0 +1,278 @@
+import math, threading, logging, json, os, glob, uuid
+
+logger = logging.getLogger(__name__)
+
+# Media type of Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# File in a shared metrics directory adding up samples of exited workers
+EXITED_FILENAME = 'exited.json'
+
+# Histogram upper bounds in seconds, from a millisecond to ten seconds
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+def _format_sample(name, labels, value):
+    if labels:
+        name = '{}{{{}}}'.format(name, ','.join('{}="{}"'.format(key, _escape(value))
+            for (key, value) in labels))
+
+    if isinstance(value, float):
+        value = '+Inf' if value == math.inf else repr(value)
+
+    return '{} {}'.format(name, value)
+
+class Counter:
+    ''' Monotonically increasing count, optionally split by label values.
+    '''
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values, self._lock = {}, threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        ''' Return a list of (name, labels, value) tuples.
+        '''
+        with self._lock:
+            return [(self.name, tuple(zip(self.labelnames, key)), value)
+                for (key, value) in sorted(self._values.items())]
+
+class Gauge:
+    ''' Current values read from a function when metrics are rendered.
+
+        function: Returns a number, or a dictionary of label value tuples
+            to numbers when labelnames are given.
+    '''
+    type = 'gauge'
+
+    def __init__(self, name, help, function, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.function = function
+
+    def samples(self):
+        values = self.function()
+
+        if not self.labelnames:
+            return [(self.name, (), values)]
+
+        return [(self.name, tuple(zip(self.labelnames, key)), value)
+            for (key, value) in sorted(values.items())]
+
+class Histogram:
+    ''' Distribution of observed values in cumulative buckets, optionally split by label values.
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf, )
+        self._values, self._lock = {}, threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * len(self.buckets), 0., 0]
+
+            counts, total, count = self._values[key]
+
+            for (i, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+
+            self._values[key][1:] = total + value, count + 1
+
+    def samples(self):
+        samples = []
+
+        with self._lock:
+            for (key, (counts, total, count)) in sorted(self._values.items()):
+                labels, cumulative = tuple(zip(self.labelnames, key)), 0
+
+                for (bound, bucket_count) in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    samples.append((self.name + '_bucket', labels + (('le', le), ), cumulative))
+
+                samples.append((self.name + '_sum', labels, total))
+                samples.append((self.name + '_count', labels, count))
+
+        return samples
+
+class Registry:
+    ''' Collection of metrics rendered together in Prometheus text format.
+
+        directory: Optional directory shared by server worker processes.
+            Each process saves its samples there with save(), and render()
+            sums samples from all processes so counters don't depend on
+            which worker answers a scrape.
+    '''
+    def __init__(self, directory=None):
+        self.metrics, self.directory = [], directory
+        self._path, self._lock, self._stopped = None, threading.Lock(), None
+
+    def register(self, metric):
+        ''' Add a metric and return it.
+        '''
+        self.metrics.append(metric)
+        return metric
+
+    def _get_path(self):
+        # Forked workers start a new file, and a reused process id never
+        # overwrites the counts of an exited worker.
+        pid = os.getpid()
+
+        if self._path is None or self._path[0] != pid:
+            filename = '{}-{}.json'.format(pid, uuid.uuid4().hex)
+            self._path = pid, os.path.join(self.directory, filename)
+
+        return self._path[1]
+
+    def save(self):
+        ''' Write samples of this process to the shared directory, if any.
+        '''
+        if self.directory is None:
+            return
+
+        data = {metric.name: dict(type=metric.type, samples=metric.samples())
+            for metric in self.metrics}
+
+        with self._lock:
+            _write_json(self._get_path(), data)
+
+    def start_saving(self, interval):
+        ''' Call save() every interval seconds from a background thread.
+        '''
+        stopped = self._stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval):
+                try:
+                    self.save()
+                except OSError as error:
+                    logger.warning('Failed to save metrics: {}'.format(error))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_saving(self):
+        ''' Stop saving from a background thread, and save one last time.
+        '''
+        if self._stopped is not None:
+            self._stopped.set()
+            self._stopped = None
+
+        self.save()
+
+    def _samples(self, metric, saved):
+        if saved is None:
+            return metric.samples()
+
+        totals, suffixes = {}, ['', '_bucket', '_sum', '_count']
+
+        for data in saved:
+            for (name, labels, value) in data.get(metric.name, {}).get('samples', []):
+                key = name, tuple(tuple(label) for label in labels)
+                totals[key] = totals.get(key, 0) + value
+
+        def order(item):
+            # By labels other than "le", then histogram buckets by bound, sum, and count
+            (name, labels), _ = item
+            other = [label for label in labels if label[0] != 'le']
+            bounds = [float(value) for (key, value) in labels if key == 'le']
+            return other, suffixes.index(name[len(metric.name):]), bounds
+
+        return [(name, labels, value) for ((name, labels), value) in sorted(totals.items(), key=order)]
+
+    def render(self):
+        ''' Return metrics as a Prometheus text exposition string.
+        '''
+        self.save()
+        saved = None if self.directory is None else list(_iter_saved(self.directory))
+        lines = []
+
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help.replace('\n', ' ')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(_format_sample(*sample) for sample in self._samples(metric, saved))
+
+        return '\n'.join(lines) + '\n'
+
+def _read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        # Merged into EXITED_FILENAME since listing the directory
+        return None
+    except (OSError, ValueError):
+        logger.warning('Skipping unreadable metrics file {}'.format(path))
+        return None
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as file:
+        json.dump(data, file)
+
+    os.replace(path + '.tmp', path)
+
+def _read_exited(directory):
+    return _read_json(os.path.join(directory, EXITED_FILENAME)) or dict(merged=[], metrics={})
+
+def _iter_saved(directory):
+    ''' Generate dictionaries of metric names to saved types and samples.
+    '''
+    # Read worker files before EXITED_FILENAME, which lists files merged into it
+    workers = {os.path.basename(path): _read_json(path)
+        for path in glob.glob(os.path.join(directory, '*-*.json'))}
+    exited = _read_exited(directory)
+
+    yield exited['metrics']
+
+    for (filename, data) in workers.items():
+        if data is not None and filename not in exited['merged']:
+            yield data
+
+def mark_process_dead(directory, pid):
+    ''' Merge samples of an exited worker process into EXITED_FILENAME.
+
+        Counters and histograms of exited workers are added up, so totals
+        never go backwards when a worker restarts, and gauges are dropped.
+        The worker's own file is then removed.
+    '''
+    exited = _read_exited(directory)
+    paths = glob.glob(os.path.join(directory, '{}-*.json'.format(pid)))
+
+    for path in paths:
+        data = _read_json(path) or {}
+
+        for (name, metric) in data.items():
+            if metric['type'] == 'gauge':
+                continue
+
+            totals = {}
+
+            for (sample_name, labels, value) in exited['metrics'].get(name, {}).get('samples', []) + metric['samples']:
+                key = sample_name, tuple(tuple(label) for label in labels)
+                totals[key] = totals.get(key, 0) + value
+
+            exited['metrics'][name] = dict(type=metric['type'],
+                samples=[[sample_name, labels, value] for ((sample_name, labels), value) in totals.items()])
+
+    # Readers skip merged files that still exist, until they are removed
+    exited['merged'] = [filename for filename in exited['merged']
+        if os.path.exists(os.path.join(directory, filename))]
+    exited['merged'].extend(os.path.basename(path) for path in paths)
+    _write_json(os.path.join(directory, EXITED_FILENAME), exited)
+
+    for path in paths:
+        os.remove(path)
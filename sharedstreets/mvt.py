@@ -0,0 +1,214 @@
+# Minimal writer for Mapbox Vector Tiles, version 2.
+# https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+import math, struct
+from .wire import VARINT, FIXED64, LENGTH_DELIMITED
+
+# Default number of integer units across a tile
+DEFAULT_EXTENT = 4096
+
+# Default number of units around a tile kept when clipping
+DEFAULT_BUFFER = 64
+
+POINT, LINESTRING = 1, 2
+MOVE_TO, LINE_TO = 1, 2
+
+# Mercator limit in degrees latitude
+MAX_LATITUDE = 85.0511287798
+
+def encode_varint(value):
+    ''' Return bytes of a non-negative varint.
+    '''
+    out = bytearray()
+
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    out.append(value)
+    return bytes(out)
+
+def zigzag(value):
+    ''' Map a signed integer to an unsigned one for varint encoding.
+    '''
+    return (value << 1) ^ (value >> 63)
+
+def _field(number, wire_type, payload):
+    if wire_type == VARINT:
+        return encode_varint(number << 3 | VARINT) + encode_varint(payload)
+    if wire_type == LENGTH_DELIMITED:
+        return encode_varint(number << 3 | LENGTH_DELIMITED) + encode_varint(len(payload)) + payload
+    if wire_type == FIXED64:
+        return encode_varint(number << 3 | FIXED64) + payload
+
+    raise ValueError('Unsupported wire type {}'.format(wire_type))
+
+def _packed(number, values):
+    return _field(number, LENGTH_DELIMITED, b''.join(map(encode_varint, values)))
+
+def _command(id, count):
+    return (id & 0x7) | (count << 3)
+
+def encode_value(value):
+    ''' Return bytes of a Value message for a property value.
+    '''
+    if isinstance(value, bool):
+        return _field(7, VARINT, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _field(5, VARINT, value)
+    if isinstance(value, int):
+        return _field(6, VARINT, zigzag(value))
+    if isinstance(value, float):
+        return _field(3, FIXED64, struct.pack('<d', value))
+
+    return _field(1, LENGTH_DELIMITED, str(value).encode('utf8'))
+
+def project(zoom, x, y, extent=DEFAULT_EXTENT):
+    ''' Return a function projecting (lon, lat) to float tile extent coordinates.
+    '''
+    scale = 2 ** zoom
+
+    def projection(lon, lat):
+        lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+        column = (lon + 180.) / 360. * scale
+        row = (1. - math.log(math.tan(lat) + 1. / math.cos(lat)) / math.pi) / 2. * scale
+        return (column - x) * extent, (row - y) * extent
+
+    return projection
+
+def _clip_segment(x0, y0, x1, y1, xmin, ymin, xmax, ymax):
+    ''' Clip a segment to a box with Liang-Barsky, return end points or None.
+    '''
+    t0, t1, dx, dy = 0., 1., x1 - x0, y1 - y0
+
+    for (p, q) in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+
+    start = (x0, y0) if t0 == 0 else (x0 + t0 * dx, y0 + t0 * dy)
+    end = (x1, y1) if t1 == 1 else (x0 + t1 * dx, y0 + t1 * dy)
+
+    return start, end
+
+def clip_line(points, xmin, ymin, xmax, ymax):
+    ''' Return a list of parts of a line inside a box, each a list of points.
+    '''
+    parts, part = [], None
+
+    for (p, q) in zip(points[:-1], points[1:]):
+        clipped = _clip_segment(p[0], p[1], q[0], q[1], xmin, ymin, xmax, ymax)
+
+        if clipped is None:
+            part = None
+            continue
+
+        start, end = clipped
+
+        if part is None or part[-1] != start:
+            part = [start]
+            parts.append(part)
+
+        part.append(end)
+
+    return parts
+
+def quantize(points):
+    ''' Round points to integers, dropping consecutive duplicates.
+    '''
+    quantized = []
+
+    for (x, y) in points:
+        point = int(round(x)), int(round(y))
+        if not quantized or quantized[-1] != point:
+            quantized.append(point)
+
+    return quantized
+
+def _encode_geometry(parts, geom_type):
+    ''' Return geometry commands for a list of point lists.
+    '''
+    commands, cx, cy = [], 0, 0
+
+    for part in parts:
+        if geom_type == POINT:
+            commands.append(_command(MOVE_TO, len(part)))
+        for (i, (x, y)) in enumerate(part):
+            if geom_type == LINESTRING and i == 0:
+                commands.append(_command(MOVE_TO, 1))
+            elif geom_type == LINESTRING and i == 1:
+                commands.append(_command(LINE_TO, len(part) - 1))
+            commands.extend((zigzag(x - cx), zigzag(y - cy)))
+            cx, cy = x, y
+
+    return commands
+
+class Layer:
+    ''' Accumulator for features of one vector tile layer.
+
+        Property keys and values are shared by all features in the layer.
+    '''
+    def __init__(self, name, extent=DEFAULT_EXTENT):
+        self.name, self.extent = name, extent
+        self.keys, self.values, self.features = {}, {}, []
+
+    def _tags(self, properties):
+        tags = []
+
+        for (key, value) in properties.items():
+            if value is None:
+                continue
+
+            # Keep 1, 1.0, and True apart while sharing equal values
+            value_key = (type(value), value)
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault(value_key, len(self.values)))
+
+        return tags
+
+    def add_feature(self, geom_type, parts, properties):
+        ''' Add a feature with integer point lists and a dictionary of properties.
+
+            geom_type: POINT or LINESTRING.
+
+            parts: List of lists of (x, y) integer tile extent coordinates.
+        '''
+        self.features.append(b''.join([
+            _packed(2, self._tags(properties)),
+            _field(3, VARINT, geom_type),
+            _packed(4, _encode_geometry(parts, geom_type)),
+            ]))
+
+    def __len__(self):
+        return len(self.features)
+
+    def encode(self):
+        ''' Return bytes of a Layer message.
+        '''
+        keys = sorted(self.keys, key=self.keys.get)
+        values = sorted(self.values, key=self.values.get)
+
+        return b''.join([
+            _field(1, LENGTH_DELIMITED, self.name.encode('utf8')),
+            b''.join(_field(2, LENGTH_DELIMITED, feature) for feature in self.features),
+            b''.join(_field(3, LENGTH_DELIMITED, key.encode('utf8')) for key in keys),
+            b''.join(_field(4, LENGTH_DELIMITED, encode_value(value)) for (_, value) in values),
+            _field(5, VARINT, self.extent),
+            _field(15, VARINT, 2),
+            ])
+
+def encode_tile(layers):
+    ''' Return bytes of a Tile message for a list of Layer instances.
+
+        Empty layers are left out.
+    '''
+    return b''.join(_field(3, LENGTH_DELIMITED, layer.encode()) for layer in layers if len(layer))
@@ -0,0 +1,93 @@
+import sys, array, logging
+import google.protobuf.internal.api_implementation
+from . import sharedstreets_pb2, wire
+
+logger = logging.getLogger(__name__)
+
+# Reading a few fields from wire bytes beats a full parse only when parsing
+# runs in pure Python. Compiled implementations parse faster than we can scan.
+WIRE_SCAN = google.protobuf.internal.api_implementation.Type() == 'python'
+
+_fields = sharedstreets_pb2.SharedStreetsGeometry.DESCRIPTOR.fields_by_name
+ID_FIELD = _fields['id'].number
+ROAD_CLASS_FIELD = _fields['roadClass'].number
+LONLATS_FIELD = _fields['lonlats'].number
+
+def road_class_values(road_classes):
+    ''' Return a set of RoadClass enum values for a collection of names or numbers.
+    '''
+    return {sharedstreets_pb2.RoadClass.Value(road_class)
+        if isinstance(road_class, str) and not road_class.isdigit()
+        else int(road_class) for road_class in road_classes}
+
+class GeometryPredicate:
+    ''' Selects SharedStreets geometries by bbox, road class, and id.
+
+        southwest, northeast: Optional locations of a bbox that geometry
+            bboxes must touch, see tile.is_inside().
+
+        road_classes: Optional collection of RoadClass names or numbers.
+
+        ids: Optional collection of geometry ids.
+
+        Raw messages are checked with match_message() before parsing by
+        reading only the id, roadClass, and lonlats fields, and parsed
+        geometries are checked with match_object().
+    '''
+    def __init__(self, southwest=None, northeast=None, road_classes=None, ids=None):
+        self.bbox = None if southwest is None else (southwest.lon, southwest.lat, northeast.lon, northeast.lat)
+        self.road_classes = None if road_classes is None else road_class_values(road_classes)
+        self.ids = None if ids is None else set(ids)
+
+    def _match(self, id, road_class, lons, lats):
+        if self.ids is not None and id not in self.ids:
+            return False
+
+        if self.road_classes is not None and road_class not in self.road_classes:
+            return False
+
+        if self.bbox is not None:
+            if not lons or not lats:
+                return False
+
+            minlon, minlat, maxlon, maxlat = self.bbox
+
+            if max(lons) < minlon or maxlon < min(lons):
+                return False
+
+            elif max(lats) < minlat or maxlat < min(lats):
+                return False
+
+        return True
+
+    def match_object(self, geometry):
+        ''' Return True if a parsed geometry matches.
+        '''
+        return self._match(geometry.id, geometry.roadClass, geometry.lonlats[0::2], geometry.lonlats[1::2])
+
+    def match_message(self, message):
+        ''' Return True if a raw geometry message buffer matches.
+
+            Malformed messages match, so the parser can decide what to do.
+        '''
+        id, road_class, coords = '', 0, array.array('d')
+
+        try:
+            for (number, wire_type, value) in wire.iter_fields(message):
+                if number == ID_FIELD:
+                    id = bytes(value).decode('utf8')
+                    if self.ids is not None and id not in self.ids:
+                        # Skip the rest of an unwanted message
+                        return False
+                elif number == ROAD_CLASS_FIELD:
+                    road_class = value
+                elif number == LONLATS_FIELD:
+                    # Packed or not, values are little-endian doubles
+                    coords.frombytes(value)
+        except (IndexError, ValueError):
+            return True
+
+        if sys.byteorder == 'big':
+            coords.byteswap()
+
+        return self._match(id, road_class, coords[0::2], coords[1::2])
@@ -0,0 +1,212 @@
+import os, gzip, argparse, tempfile, itertools, logging, multiprocessing, concurrent.futures
+import ModestMaps.Geo
+from . import tile, cache as _cache, store as _store
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('geojson', 'mvt')
+
+# Upstream state of each worker process by its arguments, see _get_worker()
+_workers = {}
+
+def tile_range(minlon, minlat, maxlon, maxlat, zoom):
+    ''' Return ranges of tile columns and rows covering a bbox at a zoom level.
+    '''
+    ul = tile.OSM.locationCoordinate(ModestMaps.Geo.Location(maxlat, minlon)).zoomTo(zoom).container()
+    lr = tile.OSM.locationCoordinate(ModestMaps.Geo.Location(minlat, maxlon)).zoomTo(zoom).container()
+
+    return range(int(ul.column), int(lr.column) + 1), range(int(ul.row), int(lr.row) + 1)
+
+def iter_descendants(data_x, data_y, bbox, min_zoom, max_zoom):
+    ''' Generate (zoom, x, y) tiles within a DATA_ZOOM tile and a bbox.
+    '''
+    for zoom in range(min_zoom, max_zoom + 1):
+        scale = 2 ** (zoom - tile.DATA_ZOOM)
+        columns, rows = tile_range(*bbox, zoom=zoom)
+        columns = range(max(columns.start, data_x * scale), min(columns.stop, (data_x + 1) * scale))
+        rows = range(max(rows.start, data_y * scale), min(rows.stop, (data_y + 1) * scale))
+
+        for (x, y) in itertools.product(columns, rows):
+            yield zoom, x, y
+
+def render(T, zoom, x, y, format, id_length):
+    ''' Return bytes of a tile.Tile instance rendered to GeoJSON or MVT.
+    '''
+    if format == 'geojson':
+        return b''.join(tile.iter_geojson(T, id_length))
+
+    return tile.make_mvt(T, zoom, x, y, id_length)
+
+def _get_worker(args):
+    ''' Return upstream state for parsed arguments, created once in each process.
+    '''
+    key = repr(sorted(vars(args).items()))
+
+    if key not in _workers:
+        _workers[key] = dict(data_url_template=args.data_url_template, cache=tile.cache_from_arguments(args),
+            session=tile.session_from_arguments(args), tile_cache=_cache.MemoryCache())
+
+    return _workers[key]
+
+def render_data_tile(data_x, data_y, bbox, min_zoom, max_zoom, formats, id_length, args):
+    ''' Return a list of (zoom, x, y, format, bytes) tuples below one DATA_ZOOM tile.
+
+        Runs in a worker process, where the DATA_ZOOM tile is decoded once
+        into a private tile cache and reused for every descendant tile.
+
+        args: Parsed arguments with upstream options, see render_pyramid().
+    '''
+    worker = _get_worker(args)
+    tile_cache, rendered = worker['tile_cache'], []
+    tile_cache.clear()
+
+    for (zoom, x, y) in iter_descendants(data_x, data_y, bbox, min_zoom, max_zoom):
+        T = tile.get_tile(zoom, x, y, worker['data_url_template'], cache=worker['cache'],
+            tile_cache=tile_cache, session=worker['session'])
+
+        for format in formats:
+            rendered.append((zoom, x, y, format, render(T, zoom, x, y, format, id_length)))
+
+    return rendered
+
+class DirectoryOutput:
+    ''' Rendered tiles written to {zoom}/{x}/{y}.{format} files in a directory.
+
+        Completed DATA_ZOOM tiles are listed in a progress file for resuming.
+    '''
+    PROGRESS_FILENAME = '.sharedstreets-pyramid-done'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def done(self):
+        ''' Return a set of (x, y) DATA_ZOOM tiles already written.
+        '''
+        try:
+            with open(os.path.join(self.path, self.PROGRESS_FILENAME)) as file:
+                return {tuple(map(int, line.split('/')[1:])) for line in file if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def write(self, data_x, data_y, rendered):
+        ''' Write rendered tiles and mark their DATA_ZOOM tile as done.
+        '''
+        for (zoom, x, y, format, data) in rendered:
+            dirname = os.path.join(self.path, str(zoom), str(x))
+            os.makedirs(dirname, exist_ok=True)
+
+            handle, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+            with os.fdopen(handle, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, os.path.join(dirname, '{}.{}'.format(y, format)))
+
+        with open(os.path.join(self.path, self.PROGRESS_FILENAME), 'a') as file:
+            file.write('{}/{}/{}\n'.format(tile.DATA_ZOOM, data_x, data_y))
+
+    def close(self):
+        pass
+
+class MBTilesOutput:
+    ''' Rendered tiles written to a store.TileStore file, one layer per format.
+
+        MVT data are gzipped as MBTiles readers expect. Completed DATA_ZOOM
+        tiles are recorded in a progress table for resuming.
+    '''
+    def __init__(self, path, formats, bbox, min_zoom, max_zoom):
+        self.store = _store.TileStore(path)
+
+        with self.store.connection() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS pyramid_progress
+                (x INTEGER, y INTEGER, PRIMARY KEY (x, y))''')
+
+        self.store.set_metadata(dict(name='SharedStreets', format='pbf' if 'mvt' in formats else 'json',
+            bounds=','.join(map(str, bbox)), minzoom=min_zoom, maxzoom=max_zoom,
+            type='overlay', version='1'))
+
+    def done(self):
+        return set(self.store.connection().execute('SELECT x, y FROM pyramid_progress'))
+
+    def write(self, data_x, data_y, rendered):
+        ''' Write rendered tiles and then mark their DATA_ZOOM tile done.
+        '''
+        self.store.put_many((zoom, x, y, format, gzip.compress(data) if format == 'mvt' else data)
+            for (zoom, x, y, format, data) in rendered)
+
+        with self.store.connection() as db:
+            db.execute('INSERT OR REPLACE INTO pyramid_progress (x, y) VALUES (?, ?)',
+                (data_x, data_y))
+
+    def close(self):
+        self.store.close()
+
+def render_pyramid(bbox, min_zoom, max_zoom, formats, output, args, processes=None, id_length=32):
+    ''' Render every tile in a bbox and zoom range to an output, skipping done tiles.
+
+        args: Parsed arguments with upstream options, see tile.add_data_arguments(),
+            tile.add_cache_arguments(), and tile.add_session_arguments().
+
+        Return number of DATA_ZOOM tiles rendered.
+    '''
+    if min_zoom < tile.DATA_ZOOM:
+        raise ValueError('Minimum zoom must be at least {}'.format(tile.DATA_ZOOM))
+
+    columns, rows = tile_range(*bbox, zoom=tile.DATA_ZOOM)
+    done = output.done()
+    pending = [xy for xy in itertools.product(columns, rows) if xy not in done]
+
+    logger.info('Rendering {} of {} data tiles'.format(len(pending), len(columns) * len(rows)))
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = {executor.submit(render_data_tile, x, y, bbox, min_zoom, max_zoom,
+            formats, id_length, args): (x, y) for (x, y) in pending}
+
+        for future in concurrent.futures.as_completed(futures):
+            (x, y), rendered = futures[future], future.result()
+            output.write(x, y, rendered)
+            logger.info('Wrote {} tiles below {}/{}/{}'.format(len(rendered), tile.DATA_ZOOM, x, y))
+
+    return len(pending)
+
+parser = argparse.ArgumentParser(description='Render a pyramid of SharedStreets tiles')
+parser.add_argument('minlon', type=float, help='Western edge of area in degrees')
+parser.add_argument('minlat', type=float, help='Southern edge of area in degrees')
+parser.add_argument('maxlon', type=float, help='Eastern edge of area in degrees')
+parser.add_argument('maxlat', type=float, help='Northern edge of area in degrees')
+parser.add_argument('output', help='Output directory, or file path ending in .mbtiles')
+parser.add_argument('--min-zoom', type=int, default=tile.DATA_ZOOM,
+    help='Lowest zoom level to render, at least {}. Default %(default)s.'.format(tile.DATA_ZOOM))
+parser.add_argument('--max-zoom', type=int, default=16, help='Highest zoom level to render. Default %(default)s.')
+parser.add_argument('--format', dest='formats', action='append', choices=FORMATS,
+    help='Output format, may be repeated. Default to both in directories and mvt in MBTiles.')
+parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+    help='Number of worker processes. Default %(default)s.')
+parser.add_argument('--id-length', type=int, default=32, help='Length of SharedStreets ids. Default %(default)s.')
+tile.add_data_arguments(parser)
+tile.add_cache_arguments(parser)
+tile.add_session_arguments(parser)
+
+def main():
+    args = parser.parse_args()
+    bbox = (args.minlon, args.minlat, args.maxlon, args.maxlat)
+    mbtiles = args.output.endswith('.mbtiles')
+
+    if args.min_zoom < tile.DATA_ZOOM or args.max_zoom < args.min_zoom:
+        parser.error('Zoom range must start at {} or higher'.format(tile.DATA_ZOOM))
+
+    if args.formats is None:
+        args.formats = ['mvt'] if mbtiles else list(FORMATS)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    formats = sorted(set(args.formats))
+
+    if mbtiles:
+        output = MBTilesOutput(args.output, formats, bbox, args.min_zoom, args.max_zoom)
+    else:
+        output = DirectoryOutput(args.output)
+
+    try:
+        render_pyramid(bbox, args.min_zoom, args.max_zoom, formats, output, args,
+            args.processes, args.id_length)
+    finally:
+        output.close()
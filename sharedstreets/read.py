@@ -1,7 +1,6 @@
 from __future__ import print_function
 import argparse
-from google.protobuf.internal.decoder import _DecodeVarint32
-from . import sharedstreets_pb2
+from . import sharedstreets_pb2, stream
 
 parser = argparse.ArgumentParser(description='Read sample SharedStreets data')
 parser.add_argument('filename', help='Protobuf filename with SharedStreets data')
@@ -19,16 +18,12 @@ def main():
     ProtobufClass = None
     
     with open(args.filename, 'rb') as file:
-        buffer = file.read()
         n = 0
-        while n < len(buffer):
+        for msg_buf in stream.iter_file_frames(file):
             print('=' * 80)
             print('bytes', n, end=' ')
 
-            msg_len, new_pos = _DecodeVarint32(buffer, n)
-            n = new_pos
-            msg_buf = buffer[n:n+msg_len]
-            n += msg_len
+            n += stream.varint_size(len(msg_buf)) + len(msg_buf)
             
             print('to', n, '--', msg_buf[:12].hex(), '...', msg_buf[-12:].hex())
 
@@ -0,0 +1,87 @@
+import argparse, multiprocessing, tempfile, shutil, logging
+import gunicorn.app.base
+from . import tile, store, metrics, webapp
+
+logger = logging.getLogger(__name__)
+
+# Threads per worker process, each serving one request at a time
+DEFAULT_THREADS = 8
+
+# Seconds between saves of each worker's metrics to the shared directory
+METRICS_SAVE_INTERVAL_S = 10
+
+class Application (gunicorn.app.base.BaseApplication):
+    ''' Gunicorn application serving webapp.app with threaded workers.
+
+        options: Dictionary of Gunicorn settings, such as bind and workers.
+    '''
+    def __init__(self, app, options):
+        self.application, self.options = app, options
+        gunicorn.app.base.BaseApplication.__init__(self)
+
+    def load_config(self):
+        for (key, value) in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+parser = argparse.ArgumentParser(description='Run a production SharedStreets tile webserver')
+parser.add_argument('--bind', default='127.0.0.1:8000', help='Address to listen on. Default %(default)s.')
+parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+    help='Number of worker processes. Default %(default)s.')
+parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+    help='Number of request threads per worker. Default %(default)s.')
+parser.add_argument('--max-age', type=int, default=webapp.CACHE_MAX_AGE_S,
+    help='Seconds that clients may reuse tile responses. Default %(default)s.')
+parser.add_argument('--metrics-directory',
+    help='Directory where worker processes share Prometheus metrics. Default a temporary directory.')
+tile.add_data_arguments(parser)
+tile.add_cache_arguments(parser)
+tile.add_session_arguments(parser)
+store.add_store_arguments(parser)
+webapp.add_bbox_arguments(parser)
+
+def server_options(args):
+    ''' Return a dictionary of Gunicorn settings for parsed arguments.
+
+        Workers share metrics through args.metrics_directory, default to a
+        temporary directory removed by the master process when it exits.
+    '''
+    if args.metrics_directory is None:
+        metrics_directory, remove_directory = tempfile.mkdtemp(prefix='sharedstreets-metrics-'), True
+    else:
+        metrics_directory, remove_directory = args.metrics_directory, False
+
+    # Any worker answering /metrics reports totals of all workers
+    webapp.REGISTRY.directory = metrics_directory
+
+    def post_worker_init(worker):
+        # Saved on a timer and when scraped, never on the request path
+        webapp.REGISTRY.start_saving(METRICS_SAVE_INTERVAL_S)
+
+    def worker_exit(server, worker):
+        webapp.REGISTRY.stop_saving()
+
+    def child_exit(server, worker):
+        metrics.mark_process_dead(metrics_directory, worker.pid)
+
+    def on_exit(server):
+        # Runs only in the master, never in workers exiting on their own
+        if remove_directory:
+            shutil.rmtree(metrics_directory, True)
+
+    # Threaded workers keep serving other requests while upstream tiles download
+    return dict(bind=args.bind, workers=args.workers, threads=args.threads,
+        worker_class='gthread', post_worker_init=post_worker_init, worker_exit=worker_exit,
+        child_exit=child_exit, on_exit=on_exit)
+
+def main():
+    args = parser.parse_args()
+    webapp.configure(args)
+    webapp.app.config['SHAREDSTREETS_MAX_AGE'] = args.max_age
+
+    if args.pool_size < args.threads:
+        logger.warning('Pool size {} is less than {} threads'.format(args.pool_size, args.threads))
+
+    Application(webapp.app, server_options(args)).run()
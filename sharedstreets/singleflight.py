@@ -0,0 +1,178 @@
+import asyncio, threading, itertools, functools, logging, concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+class _Broadcast:
+    ''' Items of an iterable read once and replayed to every reader.
+
+        function: Called on first read to return the iterable, or None.
+
+        Whichever reader first needs an item not yet read pulls it from
+        the iterable, so no thread is dedicated to reading. Items are kept
+        until the broadcast itself is released, so readers arriving late
+        still see every item from the start.
+    '''
+    def __init__(self, function, args, kwargs, on_finish):
+        self._function, self._args, self._kwargs = function, args, kwargs
+        self._iterator, self._on_finish = None, on_finish
+        self._items, self._done, self._error, self._pulling = [], False, None, False
+        self._readers, self._condition = 0, threading.Condition()
+
+    def _get(self, position):
+        ''' Return item at a position, reading it if needed, or raise StopIteration.
+        '''
+        with self._condition:
+            while position == len(self._items) and not self._done and self._pulling:
+                self._condition.wait()
+
+            if position < len(self._items):
+                return self._items[position]
+
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                raise StopIteration()
+
+            self._pulling = True
+
+        try:
+            if self._iterator is None:
+                self._iterator = iter(self._function(*self._args, **self._kwargs) or [])
+            item = next(self._iterator)
+        except BaseException as error:
+            with self._condition:
+                self._done, self._pulling = True, False
+                self._error = None if isinstance(error, StopIteration) else error
+                self._condition.notify_all()
+            self._on_finish(self)
+            raise
+        else:
+            with self._condition:
+                self._items.append(item)
+                self._pulling = False
+                self._condition.notify_all()
+            return item
+
+    def __iter__(self):
+        with self._condition:
+            self._readers += 1
+
+        try:
+            for position in itertools.count():
+                try:
+                    item = self._get(position)
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            with self._condition:
+                self._readers -= 1
+                abandoned = self._readers == 0 and not self._done
+
+            if abandoned:
+                # Nobody is left to finish reading, so later callers start over
+                self._on_finish(self)
+
+class Group:
+    ''' Coalesce concurrent calls with the same key into one in-flight call.
+
+        The first caller for a key runs the function, and callers arriving
+        while it runs wait for the same result or exception instead of
+        running it again. Threads use do() and asyncio tasks use do_async(),
+        and both can wait on a call started by the other. Iterables are
+        shared item by item with share().
+
+        Counts of calls made and calls deduplicated are kept for monitoring.
+    '''
+    def __init__(self):
+        self.calls, self.deduplicated = 0, 0
+        self._futures, self._broadcasts = {}, {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        ''' Return a future for a key, and True if the caller should run it.
+        '''
+        with self._lock:
+            future = self._futures.get(key)
+
+            if future is not None:
+                self.deduplicated += 1
+                logger.debug('Waiting for in-flight call {}'.format(key))
+                return future, False
+
+            future = self._futures[key] = concurrent.futures.Future()
+            self.calls += 1
+            return future, True
+
+    def _run(self, key, future, function, args, kwargs):
+        ''' Run a function and publish its outcome to everyone waiting on future.
+        '''
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as error:
+            self._finish(key)
+            future.set_exception(error)
+        else:
+            self._finish(key)
+            future.set_result(result)
+
+    def _finish(self, key):
+        # Callers arriving after this start a new call with fresh results
+        with self._lock:
+            del self._futures[key]
+
+    def do(self, key, function, *args, **kwargs):
+        ''' Return function(*args, **kwargs), sharing one call per key at a time.
+        '''
+        future, leader = self._join(key)
+
+        if leader:
+            self._run(key, future, function, args, kwargs)
+
+        return future.result()
+
+    async def do_async(self, key, function, *args, **kwargs):
+        ''' Await function(*args, **kwargs), sharing one call per key at a time.
+
+            The blocking function runs in the event loop's default executor,
+            and waiting tasks do not occupy any thread.
+        '''
+        future, leader = self._join(key)
+
+        if leader:
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(None, self._run, key, future, function, args, kwargs)
+
+        return await asyncio.wrap_future(future)
+
+    def share(self, key, function, *args, **kwargs):
+        ''' Return an iterator over function(*args, **kwargs), sharing one iteration per key at a time.
+
+            Callers arriving while the first one is still iterating read the
+            same items as they arrive, starting from the first item.
+        '''
+        with self._lock:
+            broadcast = self._broadcasts.get(key)
+
+            if broadcast is not None:
+                self.deduplicated += 1
+                logger.debug('Joining in-flight iteration {}'.format(key))
+            else:
+                broadcast = self._broadcasts[key] = _Broadcast(function, args, kwargs,
+                    functools.partial(self._finish_broadcast, key))
+                self.calls += 1
+
+            return iter(broadcast)
+
+    def _finish_broadcast(self, key, broadcast):
+        # Callers arriving after this start a new iteration with fresh items
+        with self._lock:
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+
+    def stats(self):
+        ''' Return a dictionary of call counters.
+        '''
+        with self._lock:
+            return dict(calls=self.calls, deduplicated=self.deduplicated,
+                in_flight=len(self._futures) + len(self._broadcasts))
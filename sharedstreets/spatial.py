@@ -0,0 +1,78 @@
+import math, collections
+
+# Target average number of bboxes per grid cell
+CELL_CAPACITY = 4
+
+class GridIndex:
+    ''' Uniform grid spatial index over a sequence of bounding boxes.
+
+        bboxes: Sequence of (minx, miny, maxx, maxy) tuples. Boxes with NaN
+            coordinates are never returned by queries.
+
+        The grid covers the extent of all boxes, with enough cells to hold
+        about CELL_CAPACITY boxes each. Every box is listed in each cell it
+        overlaps, so a query only visits cells overlapping its window.
+    '''
+    __slots__ = ('minx', 'miny', 'cell_width', 'cell_height', 'columns', 'rows', 'cells')
+
+    def __init__(self, bboxes):
+        bboxes = [(i, bbox) for (i, bbox) in enumerate(bboxes) if not any(map(math.isnan, bbox))]
+        self.cells = collections.defaultdict(list)
+
+        if not bboxes:
+            self.minx, self.miny, self.cell_width, self.cell_height = 0, 0, 1, 1
+            self.columns, self.rows = 0, 0
+            return
+
+        self.minx = min(bbox[0] for (_, bbox) in bboxes)
+        self.miny = min(bbox[1] for (_, bbox) in bboxes)
+        maxx = max(bbox[2] for (_, bbox) in bboxes)
+        maxy = max(bbox[3] for (_, bbox) in bboxes)
+
+        size = max(1, int(math.ceil(math.sqrt(len(bboxes) / float(CELL_CAPACITY)))))
+        self.columns, self.rows = size, size
+        self.cell_width = (maxx - self.minx) / size or 1
+        self.cell_height = (maxy - self.miny) / size or 1
+
+        for (i, (minx, miny, maxx, maxy)) in bboxes:
+            columns, rows = self._cell_range(minx, miny, maxx, maxy)
+            for column in columns:
+                for row in rows:
+                    self.cells[(column, row)].append(i)
+
+    def _cell_range(self, minx, miny, maxx, maxy):
+        ''' Return ranges of grid columns and rows overlapping a window.
+        '''
+        def clamp(value, limit):
+            return min(max(value, 0), limit - 1)
+
+        column1 = clamp(int(math.floor((minx - self.minx) / self.cell_width)), self.columns)
+        column2 = clamp(int(math.floor((maxx - self.minx) / self.cell_width)), self.columns)
+        row1 = clamp(int(math.floor((miny - self.miny) / self.cell_height)), self.rows)
+        row2 = clamp(int(math.floor((maxy - self.miny) / self.cell_height)), self.rows)
+
+        return range(column1, column2 + 1), range(row1, row2 + 1)
+
+    def query(self, minx, miny, maxx, maxy):
+        ''' Return a sorted list of candidate box indexes for a window.
+
+            Candidates share a grid cell with the window, and may still need
+            an exact test against their own boxes.
+        '''
+        if not self.cells:
+            return []
+
+        if maxx < self.minx or self.minx + self.columns * self.cell_width < minx:
+            return []
+
+        if maxy < self.miny or self.miny + self.rows * self.cell_height < miny:
+            return []
+
+        columns, rows = self._cell_range(minx, miny, maxx, maxy)
+        candidates = set()
+
+        for column in columns:
+            for row in rows:
+                candidates.update(self.cells.get((column, row), ()))
+
+        return sorted(candidates)
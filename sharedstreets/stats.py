@@ -0,0 +1,93 @@
+import time, collections, logging
+
+logger = logging.getLogger(__name__)
+
+# Functions called with each completed Stats instance, see add_hook()
+_hooks = []
+
+class LayerStats:
+    ''' Counters for one upstream layer of a tile.
+
+        bytes: Number of upstream bytes read, downloaded or from local files.
+
+        fetch_seconds: Time spent requesting and reading upstream bytes.
+
+        decode_seconds: Time spent parsing protobuf messages.
+
+        messages, decoded, kept: Numbers of messages seen in upstream data,
+            parsed into objects, and kept in the resulting tile.
+    '''
+    __slots__ = ('bytes', 'fetch_seconds', 'decode_seconds', 'messages', 'decoded', 'kept')
+
+    def __init__(self):
+        self.bytes, self.fetch_seconds, self.decode_seconds = 0, 0., 0.
+        self.messages, self.decoded, self.kept = 0, 0, 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class Stats:
+    ''' Timings and counters for getting one tile, filled in as it loads.
+
+        Pass an instance to tile.get_tile() or tile.query_bbox() to read it
+        afterwards, or see add_hook() to receive every completed instance.
+
+        layers: Dictionary of layer names to LayerStats instances. Layers
+            shared with a concurrent caller or read from a tile cache are
+            counted only by the caller that loaded them.
+
+        filter_seconds: Time spent selecting geometries inside the bbox.
+
+        join_seconds: Time spent attaching objects to geometries by id,
+            not counting any upstream reads and decoding it triggers.
+
+        seconds: Total time, set when the tile is complete.
+    '''
+    def __init__(self):
+        self.layers = collections.defaultdict(LayerStats)
+        self.filter_seconds, self.join_seconds, self.seconds = 0., 0., 0.
+
+    def io_seconds(self):
+        ''' Return total fetch and decode seconds of all layers so far.
+        '''
+        return sum(layer.fetch_seconds + layer.decode_seconds for layer in list(self.layers.values()))
+
+    def as_dict(self):
+        return dict(layers={name: layer.as_dict() for (name, layer) in self.layers.items()},
+            filter_seconds=self.filter_seconds, join_seconds=self.join_seconds, seconds=self.seconds)
+
+def iter_timed(chunks, layer):
+    ''' Generate chunks from an iterable, adding read time and sizes to a LayerStats.
+    '''
+    chunks = iter(chunks)
+
+    while True:
+        start = time.perf_counter()
+
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            layer.fetch_seconds += time.perf_counter() - start
+
+        layer.bytes += len(chunk)
+        yield chunk
+
+def add_hook(function):
+    ''' Call a function with every completed Stats instance, once if added twice.
+    '''
+    if function not in _hooks:
+        _hooks.append(function)
+
+def remove_hook(function):
+    _hooks.remove(function)
+
+def publish(stats):
+    ''' Pass a completed Stats instance to every hook.
+    '''
+    for function in list(_hooks):
+        try:
+            function(stats)
+        except Exception:
+            logger.exception('Stats hook {} failed'.format(function))
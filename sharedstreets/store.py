@@ -0,0 +1,203 @@
+import os, re, sqlite3, argparse, threading, logging
+import urllib.parse
+from . import local
+
+logger = logging.getLogger(__name__)
+
+# URL scheme of layers in a tile store, used in data URL templates
+SCHEME = 'mbtiles'
+
+# URI template for upstream layers in a tile store at a given path
+URL_TEMPLATE = SCHEME + '://{path}?z={{z}}&x={{x}}&y={{y}}&layer={{layer}}'
+
+# Number of rows written per transaction by put_many()
+BATCH_SIZE = 1000
+
+_stores, _stores_lock = {}, threading.Lock()
+
+class TileStore:
+    ''' SQLite tile store in MBTiles layout, with an added layer column.
+
+        path: Filesystem path of the SQLite file.
+
+        readonly: If true, open an existing file without creating tables.
+
+        Each thread gets its own connection, and every query uses constant
+        SQL so sqlite3 reuses prepared statements from each connection's
+        statement cache. Rows use TMS tile_row numbering as MBTiles does,
+        while methods take OpenStreetMap-style zoom, x, y like get_tile().
+    '''
+    def __init__(self, path, readonly=False):
+        self.path, self.readonly = path, readonly
+        self._local = threading.local()
+
+        if not readonly:
+            with self.connection() as db:
+                db.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+                db.execute('''CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER,
+                    tile_column INTEGER, tile_row INTEGER, layer TEXT, tile_data BLOB,
+                    PRIMARY KEY (zoom_level, tile_column, tile_row, layer))''')
+
+            # Don't hand this connection down to forked server workers
+            self.close()
+
+    def connection(self):
+        ''' Return a sqlite3 connection for the current thread.
+        '''
+        db = getattr(self._local, 'db', None)
+
+        if db is None:
+            if self.readonly:
+                uri = 'file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(self.path)))
+                db = sqlite3.connect(uri, uri=True)
+            else:
+                db = sqlite3.connect(self.path)
+                # Let readers in other threads and processes work during writes
+                db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+
+        return db
+
+    def get(self, zoom, x, y, layer):
+        ''' Return bytes of a stored tile layer, or None if missing.
+        '''
+        row = self.connection().execute('''SELECT tile_data FROM tiles
+            WHERE zoom_level = ? AND tile_column = ? AND tile_row = ? AND layer = ?''',
+            (zoom, x, 2**zoom - 1 - y, layer)).fetchone()
+
+        return None if row is None else row[0]
+
+    def put_many(self, tiles, batch_size=BATCH_SIZE):
+        ''' Store an iterable of (zoom, x, y, layer, bytes) tuples.
+
+            Rows are written in transactions of batch_size rows each.
+            Return number of rows written.
+        '''
+        db, batch, count = self.connection(), [], 0
+
+        def flush():
+            with db:
+                db.executemany('''INSERT OR REPLACE INTO tiles
+                    (zoom_level, tile_column, tile_row, layer, tile_data)
+                    VALUES (?, ?, ?, ?, ?)''', batch)
+
+        for (zoom, x, y, layer, data) in tiles:
+            batch.append((zoom, x, 2**zoom - 1 - y, layer, data))
+
+            if len(batch) >= batch_size:
+                flush()
+                count, batch = count + len(batch), []
+
+        if batch:
+            flush()
+
+        return count + len(batch)
+
+    def put(self, zoom, x, y, layer, data):
+        ''' Store bytes of a single tile layer.
+        '''
+        self.put_many([(zoom, x, y, layer, data)])
+
+    def metadata(self):
+        ''' Return a dictionary of MBTiles metadata.
+        '''
+        return dict(self.connection().execute('SELECT name, value FROM metadata'))
+
+    def set_metadata(self, metadata):
+        ''' Store a dictionary of MBTiles metadata.
+        '''
+        with self.connection() as db:
+            db.executemany('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)',
+                [(name, str(value)) for (name, value) in metadata.items()])
+
+    def close(self):
+        ''' Close the current thread's connection.
+        '''
+        db = getattr(self._local, 'db', None)
+
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+def get_store(path):
+    ''' Return a shared read-only TileStore for a path.
+    '''
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TileStore(path, readonly=True)
+        return _stores[path]
+
+def is_store_path(path):
+    return path is not None and path.endswith('.mbtiles') and os.path.isfile(path)
+
+def store_template(path):
+    ''' Return a data URL template for upstream layers in a tile store.
+    '''
+    return URL_TEMPLATE.format(path=urllib.parse.quote(os.path.abspath(path)))
+
+def parse_url(url):
+    ''' Return (path, zoom, x, y, layer) for a tile store URL, or None.
+    '''
+    if not isinstance(url, str) or not url.startswith(SCHEME + '://'):
+        return None
+
+    parsed = urllib.parse.urlparse(url)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+
+    try:
+        return (urllib.parse.unquote(parsed.path), int(query['z']), int(query['x']),
+            int(query['y']), query['layer'])
+    except (KeyError, ValueError):
+        return None
+
+def read_url(url):
+    ''' Return bytes of a tile layer for a tile store URL, or None.
+    '''
+    path, zoom, x, y, layer = parse_url(url)
+
+    if not os.path.exists(path):
+        logger.debug('Missing tile store {}'.format(path))
+        return None
+
+    return get_store(path).get(zoom, x, y, layer)
+
+def add_store_arguments(parser):
+    ''' Add rendered tile store option to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--tile-store', help='Optional .mbtiles tile store file for rendered tiles.')
+
+def store_from_arguments(args):
+    ''' Return a TileStore instance for parsed arguments, or None.
+    '''
+    if args.tile_store:
+        return TileStore(args.tile_store)
+
+# Names of upstream protobuf files, matching local.FILENAME_TEMPLATE
+_filename_pattern = re.compile(r'^(?P<z>\d+)-(?P<x>\d+)-(?P<y>\d+)\.(?P<layer>\w+)\.6\.pbf$')
+
+def iter_directory(dirname):
+    ''' Generate (zoom, x, y, layer, bytes) tuples for upstream files in a directory.
+    '''
+    for filename in sorted(os.listdir(dirname)):
+        match = _filename_pattern.match(filename)
+
+        if match is None:
+            continue
+
+        with open(os.path.join(dirname, filename), 'rb') as file:
+            data = file.read()
+
+        yield (int(match.group('z')), int(match.group('x')), int(match.group('y')),
+            match.group('layer'), data)
+
+parser = argparse.ArgumentParser(description='Import a directory of upstream SharedStreets tiles into a tile store')
+parser.add_argument('directory', help='Directory of files named like {}'.format(local.FILENAME_TEMPLATE))
+parser.add_argument('output', help='Tile store file path ending in .mbtiles')
+
+def main():
+    args = parser.parse_args()
+    store = TileStore(args.output)
+    store.set_metadata(dict(name='SharedStreets', format='pbf', type='overlay', version='1'))
+    count = store.put_many(iter_directory(args.directory))
+    store.close()
+    print('Imported {} tile layers into {}'.format(count, args.output))
@@ -0,0 +1,103 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default size of chunks read from files and HTTP responses, in bytes
+CHUNK_SIZE = 64 * 1024
+
+def read_varint(buffer, position):
+    ''' Return a varint value and the position that follows it.
+
+        Raise IndexError if the buffer ends before the varint is complete.
+    '''
+    value, shift = 0, 0
+
+    while True:
+        byte = buffer[position]
+        value |= (byte & 0x7f) << shift
+        position += 1
+
+        if not byte & 0x80:
+            return value, position
+
+        shift += 7
+
+def varint_size(value):
+    ''' Return number of bytes needed to encode a varint value.
+    '''
+    size = 1
+
+    while value > 0x7f:
+        value >>= 7
+        size += 1
+
+    return size
+
+def iter_frames(chunks):
+    ''' Generate memoryviews of varint length-delimited messages in a stream.
+
+        chunks: Iterable of bytes-like objects, such as file reads or
+            requests.Response.iter_content(). Frames contained in a single
+            chunk are yielded as zero-copy views of that chunk, and frames
+            spanning chunk boundaries are assembled into a new buffer.
+
+        Only the current chunk and one partial frame are kept in memory.
+        A truncated frame at the end of the stream is logged and skipped.
+    '''
+    # Partial frame carried between chunks, with its length once known
+    pending, pending_length = None, None
+
+    for chunk in chunks:
+        view, position = memoryview(chunk), 0
+
+        # Complete a frame begun in earlier chunks
+        while pending is not None and position < len(view):
+            if pending_length is None:
+                # Frame header is still incomplete, read one byte at a time
+                pending.append(view[position])
+                position += 1
+                try:
+                    length, _ = read_varint(pending, 0)
+                except IndexError:
+                    continue
+                else:
+                    pending, pending_length = bytearray(), length
+
+            taken = min(pending_length - len(pending), len(view) - position)
+            pending += view[position:position+taken]
+            position += taken
+
+            if len(pending) == pending_length:
+                frame, pending, pending_length = pending, None, None
+                yield memoryview(frame)
+
+        # Yield frames contained entirely within this chunk
+        while pending is None and position < len(view):
+            try:
+                length, frame_start = read_varint(view, position)
+            except IndexError:
+                pending = bytearray(view[position:])
+                break
+
+            if frame_start + length > len(view):
+                pending, pending_length = bytearray(view[frame_start:]), length
+                break
+
+            yield view[frame_start:frame_start+length]
+            position = frame_start + length
+
+    if pending is not None:
+        logger.debug('Skipped truncated frame after {} bytes'.format(len(pending)))
+
+def iter_buffer_frames(buffer):
+    ''' Generate memoryviews of varint length-delimited messages in a buffer.
+    '''
+    return iter_frames([buffer])
+
+def iter_file_frames(file, chunk_size=CHUNK_SIZE):
+    ''' Generate memoryviews of varint length-delimited messages in a file.
+
+        file: Binary file-like object with a read() method, such as an open
+            file or the result of socket.makefile('rb').
+    '''
+    return iter_frames(iter(lambda: file.read(chunk_size), b''))
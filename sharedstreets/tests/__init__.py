@@ -0,0 +1,26 @@
+import os, shutil, tempfile
+
+# Bundled upstream protobuf fixtures, one 20180312-{layer}.pbf file per layer
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Layers of fixture files, matching tile.LAYERS
+LAYERS = ('geometry', 'intersection', 'reference', 'metadata')
+
+def copy_fixture_tile(dirname):
+    ''' Copy fixture layers into a directory as upstream z12 tile 656/1582.
+
+        The directory is created if needed and returned. Tests read copies
+        so that sidecar index files are never written beside the fixtures.
+    '''
+    os.makedirs(dirname, exist_ok=True)
+
+    for layer in LAYERS:
+        shutil.copy(os.path.join(DATA_DIR, '20180312-{}.pbf'.format(layer)),
+            os.path.join(dirname, '12-656-1582.{}.6.pbf'.format(layer)))
+
+    return dirname
+
+def make_fixture_directory():
+    ''' Return a new temporary directory holding a copy of the fixture tile.
+    '''
+    return copy_fixture_tile(tempfile.mkdtemp(prefix='sharedstreets-test-'))
@@ -0,0 +1,49 @@
+import unittest, tempfile, shutil
+from .. import tile, benchmark
+
+class TestBenchmark (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_percentile(self):
+
+        self.assertEqual(benchmark.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(benchmark.percentile([1, 2], 50), 1.5)
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4, 5], 99), 4.96)
+        self.assertEqual(benchmark.percentile([7], 90), 7)
+
+    def test_make_synthetic_tile(self):
+
+        counts = benchmark.make_synthetic_tile(self.directory, 100)
+        self.assertEqual(counts['geometry'], 100)
+        self.assertEqual(counts['reference'], 200)
+
+        T = tile.get_tile(tile.DATA_ZOOM, benchmark.DATA_X, benchmark.DATA_Y, self.directory)
+        self.assertEqual(len(T.geometries), 100)
+        self.assertEqual(len(T.references), 200)
+        self.assertEqual(len(T.metadata), 100)
+        self.assertEqual(len(T.intersections), counts['intersection'])
+
+    def test_run(self):
+
+        results = benchmark.run(geometries=20, repeat=2, stages={'iter_objects', 'make_mvt'})
+
+        self.assertEqual([(r['dataset'], r['stage']) for r in results['results']], [
+            ('fixture', 'iter_objects'), ('fixture', 'make_mvt'),
+            ('synthetic', 'iter_objects'), ('synthetic', 'make_mvt')])
+        self.assertEqual(results['datasets']['fixture']['objects']['geometry'], 3)
+
+        result = results['results'][2]
+        self.assertEqual(result['runs'], 2)
+        self.assertEqual(result['objects'], sum(results['datasets']['synthetic']['objects'].values()))
+        self.assertEqual(result['bytes'], results['datasets']['synthetic']['bytes'])
+        self.assertGreater(result['peak_memory_bytes'], 0)
+        self.assertLessEqual(result['seconds']['min'], result['seconds']['p50'])
+
+        lines = benchmark.compare(results, results)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].endswith('1.00'))
@@ -0,0 +1,233 @@
+import unittest, mock, httmock, tempfile, shutil, threading, os, time
+from .. import tile, cache
+from .test_tile import respond_locally
+
+class TestDiskCache (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iter_objects_revalidated(self):
+
+        requests = []
+
+        def respond_etag(url, request):
+            requests.append(request)
+            if request.headers.get('If-None-Match') == '"abc"':
+                return httmock.response(304, b'')
+            response = respond_locally(url, request)
+            response.headers['ETag'] = '"abc"'
+            return response
+
+        C = cache.DiskCache(self.directory, max_age=0)
+
+        with httmock.HTTMock(respond_etag):
+            url = 'http://example.com/20180312-intersection.pbf'
+            i1 = list(tile.iter_objects(url, tile.data_classes['intersection'], C))
+            i2 = list(tile.iter_objects(url, tile.data_classes['intersection'], C))
+
+        self.assertEqual(len(requests), 2)
+        self.assertNotIn('If-None-Match', requests[0].headers)
+        self.assertEqual(requests[1].headers['If-None-Match'], '"abc"')
+        self.assertEqual([i.id for i in i1], [i.id for i in i2])
+        self.assertEqual(len(i2), 3)
+
+    def test_iter_objects_fresh(self):
+
+        requests = []
+
+        def respond_counted(url, request):
+            requests.append(request)
+            return respond_locally(url, request)
+
+        C = cache.DiskCache(self.directory, max_age=60)
+
+        with httmock.HTTMock(respond_counted):
+            url = 'http://example.com/20180312-geometry.pbf'
+            g1 = list(tile.iter_objects(url, tile.data_classes['geometry'], C))
+            g2 = list(tile.iter_objects(url, tile.data_classes['geometry'], C))
+            g3 = list(tile.iter_objects('http://example.com/404.pbf', tile.data_classes['geometry'], C))
+
+        self.assertEqual(len(requests), 2, 'Should request geometry only once')
+        self.assertEqual([g.id for g in g1], [g.id for g in g2])
+        self.assertEqual(len(g3), 0)
+        self.assertIsNone(C.get('http://example.com/404.pbf'))
+
+    def test_content_addressed(self):
+
+        C = cache.DiskCache(self.directory)
+        e1 = C.put('http://example.com/a.pbf', b'same')
+        e2 = C.put('http://example.com/b.pbf', b'same')
+
+        self.assertEqual(e1.path, e2.path)
+        self.assertEqual(C.total_bytes(), 4)
+
+    def test_evict_least_recently_used(self):
+
+        C = cache.DiskCache(self.directory, max_bytes=10)
+        C.put('http://example.com/a.pbf', b'aaaa')
+        C.put('http://example.com/b.pbf', b'bbbb')
+
+        # Make b older than a, then overflow the cache
+        past = time.time() - 60
+        os.utime(C._url_path('http://example.com/b.pbf'), (past, past))
+        C.put('http://example.com/c.pbf', b'cccc')
+
+        self.assertIsNotNone(C.get('http://example.com/a.pbf'))
+        self.assertIsNone(C.get('http://example.com/b.pbf'))
+        self.assertIsNotNone(C.get('http://example.com/c.pbf'))
+        self.assertEqual(C.total_bytes(), 8)
+
+    def test_evict_low_water(self):
+
+        C = cache.DiskCache(self.directory, max_bytes=100)
+
+        for i in range(11):
+            C.put('http://example.com/{}.pbf'.format(i), '{:010d}'.format(i).encode('ascii'))
+
+        # Overflow trims the cache below max_bytes, leaving room for the next put
+        self.assertEqual(C.total_bytes(), 90)
+
+        with mock.patch.object(C, '_iter_records') as iter_records:
+            C.put('http://example.com/new.pbf', b'0123456789')
+
+        self.assertFalse(iter_records.called)
+
+    def test_concurrent_put(self):
+
+        C, errors = cache.DiskCache(self.directory, max_bytes=64), []
+
+        def put_many(n):
+            try:
+                for i in range(50):
+                    C.put('http://example.com/{}-{}.pbf'.format(n, i), '{:04d}{:04d}'.format(n, i).encode('ascii'))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=put_many, args=(n, )) for n in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        self.assertEqual(errors, [])
+        self.assertTrue(C.total_bytes() <= 64)
+        self.assertEqual(C.total_bytes(), sum(size for (_, _, size) in C._iter_objects()))
+
+    def test_read_evicted(self):
+
+        C = cache.DiskCache(self.directory)
+        url = 'http://example.com/20180312-intersection.pbf'
+
+        with httmock.HTTMock(respond_locally):
+            body = tile.fetch_content(url, C)
+            entry = C.get(url)
+            os.remove(entry.path)
+
+            self.assertIsNone(C.read(entry))
+            self.assertEqual(tile.fetch_content(url, C), body)
+
+class TestMemoryCache (unittest.TestCase):
+
+    def test_get_put(self):
+
+        C = cache.MemoryCache(max_bytes=10)
+        self.assertIsNone(C.get('a'))
+
+        C.put('a', 'A', 4)
+        C.put('b', 'B', 4)
+        self.assertEqual(C.get('a'), 'A')
+
+        # b is least recently used and should be evicted
+        C.put('c', 'C', 4)
+        self.assertIsNone(C.get('b'))
+        self.assertEqual(C.get('c'), 'C')
+
+        self.assertEqual(C.stats(), dict(hits=2, misses=2, evictions=1,
+            coalesced=0, items=2, bytes=8, max_bytes=10))
+
+    def test_resize(self):
+
+        C = cache.MemoryCache(max_bytes=10)
+        C.put('a', 'A', 4)
+        C.put('b', 'B', 4)
+
+        # Growing a marks it recently used, and b is evicted to make room
+        C.resize('a', 8)
+        C.resize('gone', 100)
+        self.assertEqual((C.get('a'), C.get('b')), ('A', None))
+        self.assertEqual((C.current_bytes, C.evictions), (8, 1))
+
+    def test_get_or_load_coalesced(self):
+
+        C, calls, started, release = cache.MemoryCache(), [], threading.Event(), threading.Event()
+
+        def load():
+            calls.append(None)
+            started.set()
+            release.wait(5)
+            return 'A', 1
+
+        threads = [threading.Thread(target=C.get_or_load, args=('a', load)) for i in range(4)]
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        # Wait for every thread to miss the cache before loading finishes
+        deadline = time.time() + 5
+        while C.misses < len(threads) and time.time() < deadline:
+            time.sleep(.01)
+
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(C.get_or_load('a', load), 'A')
+        self.assertEqual(C.stats()['coalesced'], 3)
+
+    def test_get_or_load_error(self):
+
+        C = cache.MemoryCache()
+
+        def fail():
+            raise IOError('Nope')
+
+        with self.assertRaises(IOError):
+            C.get_or_load('a', fail)
+
+        self.assertEqual(C.get_or_load('a', lambda: ('A', 1)), 'A')
+        self.assertEqual(C._loading, {})
+
+    def test_get_tile_cached(self):
+
+        requests = []
+
+        def respond_counted(url, request):
+            requests.append(request)
+            return respond_locally(url, request)
+
+        C = cache.MemoryCache()
+        template = 'http://example.com/20180312-{layer}.pbf'
+
+        with httmock.HTTMock(respond_counted):
+            T1 = tile.get_tile(12, 656, 1582, template, tile_cache=C)
+            T2 = tile.get_tile(13, 1313, 3165, template, tile_cache=C)
+            T3 = tile.get_tile(12, 656, 1582, template)
+
+        self.assertEqual(len(requests), 8, 'Should download each layer once per uncached tile')
+        self.assertEqual((C.hits, C.misses), (1, 1))
+        self.assertGreater(C.current_bytes, 0)
+
+        self.assertEqual(set(T1.geometries), set(T3.geometries))
+        self.assertEqual(set(T1.intersections), set(T3.intersections))
+        self.assertEqual(set(T1.references), set(T3.references))
+        self.assertEqual(set(T1.metadata), set(T3.metadata))
+        self.assertLessEqual(set(T2.geometries), set(T1.geometries))
+
+        self.assertEqual(len(T1.geometries), 3)
+        self.assertEqual(set(T2.geometries), {'80a8a7c120332bfb679f877472c9c18d'})
@@ -0,0 +1,80 @@
+import unittest, shutil
+from .. import tile, columnar
+from . import make_fixture_directory
+
+class TestColumnar (unittest.TestCase):
+
+    def setUp(self):
+        directory = make_fixture_directory()
+
+        try:
+            self.tile = tile.get_tile(12, 656, 1582, directory)
+        finally:
+            shutil.rmtree(directory)
+
+        self.columnar = columnar.ColumnarTile.from_tile(self.tile)
+
+    def test_pack_id(self):
+
+        digest = columnar.pack_id('80a8a7c120332bfb679f877472c9c18d')
+        self.assertEqual(len(digest), columnar.DIGEST_SIZE)
+        self.assertEqual(columnar.unpack_id(digest), '80a8a7c120332bfb679f877472c9c18d')
+        self.assertEqual(columnar.unpack_id(columnar.pack_id('')), '')
+
+        with self.assertRaises(ValueError):
+            columnar.pack_id('80a8a7c120332bfb')
+
+        with self.assertRaises(ValueError):
+            columnar.pack_id('not an id')
+
+    def test_round_trip(self):
+
+        for (attr, data_class) in [('geometries', 'geometry'), ('intersections', 'intersection'),
+                                   ('references', 'reference')]:
+            original, packed = getattr(self.tile, attr), getattr(self.columnar, attr)
+            self.assertEqual(list(packed), list(original), attr)
+
+            for (id, object) in original.items():
+                message = packed[id].to_message()
+                self.assertIsInstance(message, tile.data_classes[data_class])
+                self.assertEqual(message, object)
+
+        for (id, metadata) in self.tile.metadata.items():
+            row = self.columnar.metadata[id]
+            self.assertIsInstance(row, columnar.MetadataRow)
+            self.assertEqual(row.geometryId, id)
+            self.assertEqual(row.osmMetadata, metadata.osmMetadata)
+            self.assertEqual(row.to_message(), metadata)
+
+    def test_mapping(self):
+
+        geometries = self.columnar.geometries
+        geometry = geometries['80a8a7c120332bfb679f877472c9c18d']
+
+        self.assertEqual(len(geometries), 3)
+        self.assertIn('80a8a7c120332bfb679f877472c9c18d', geometries)
+        self.assertNotIn('00000000000000000000000000000000', geometries)
+        self.assertNotIn('', geometries)
+        self.assertNotIn(None, geometries)
+        self.assertIsNone(geometries.get('nope'))
+
+        self.assertEqual(geometry.id, '80a8a7c120332bfb679f877472c9c18d')
+        self.assertEqual(list(geometries.values())[1], geometry)
+        self.assertEqual(dict(geometries.items())[geometry.id], geometry)
+        self.assertEqual(list(geometry.lonlats[0::2]),
+            list(self.tile.geometries[geometry.id].lonlats[0::2]))
+
+        with self.assertRaises(TypeError):
+            columnar.Table([])
+
+    def test_tile_compatible(self):
+
+        self.assertEqual(tile.make_geojson(self.columnar), tile.make_geojson(self.tile))
+        self.assertEqual(tile.make_geojson(self.columnar, 12), tile.make_geojson(self.tile, 12))
+        self.assertGreater(self.columnar.nbytes(), 0)
+
+    def test_geojson_truncated_ids(self):
+
+        geojson = tile.make_geojson(self.tile, 12)
+        self.assertEqual(geojson['features'][0]['id'], list(self.tile.geometries)[0][:12])
+        self.assertEqual(tile.make_geojson(self.columnar, 12), geojson)
@@ -1,4 +1,4 @@
-import unittest, mock, collections
+import unittest, mock, httmock, collections
 from .. import dataframe
 
 Geometry = collections.namedtuple('Geometry', ['id', 'roadClass',
@@ -53,3 +53,89 @@ class TestDataframe (unittest.TestCase):
         self.assertEqual(set(frames.geometries.id), {'NlId'})
         self.assertEqual(set(frames.geometries.fromIntersectionId), {'NNNN'})
         self.assertEqual(set(frames.geometries.toIntersectionId), {'dddd'})
+
+    def test_get_bbox_retry(self):
+        
+        attempts = []
+        
+        def get_flaky_tile(zoom, x, y, *args, **kwargs):
+            attempts.append((zoom, x, y))
+            if attempts.count((zoom, x, y)) == 1:
+                raise IOError('Flaky')
+            return mock_tile
+        
+        with mock.patch('sharedstreets.tile.get_tile') as get_tile:
+            get_tile.side_effect = get_flaky_tile
+            frames = dataframe.get_bbox(-0.00051, -0.00030, 0.00039, 0.00032, retry_delay=0)
+        
+        self.assertEqual(len(attempts), 8, 'Should try each of four tiles twice')
+        self.assertEqual(set(frames.geometries.id), {'NlId'})
+
+    def test_get_bbox_failure(self):
+        
+        def get_broken_tile(zoom, x, y, *args, **kwargs):
+            if (x, y) == (2047, 2048):
+                raise IOError('Broken')
+            return mock_tile
+        
+        with mock.patch('sharedstreets.tile.get_tile') as get_tile:
+            get_tile.side_effect = get_broken_tile
+            with self.assertRaises(dataframe.FetchError) as context:
+                dataframe.get_bbox(-0.00051, -0.00030, 0.00039, 0.00032, retries=1, retry_delay=0)
+        
+        self.assertEqual(set(context.exception.failures), {(2047, 2048)})
+        self.assertEqual(len(get_tile.mock_calls), 5, 'Should try broken tile twice')
+
+    def test_get_bbox_http_error(self):
+
+        def respond_unavailable(url, request):
+            return httmock.response(503, b'Slow down')
+
+        with httmock.HTTMock(respond_unavailable):
+            with self.assertRaises(dataframe.FetchError) as context:
+                dataframe.get_bbox(-122.2820, 37.7946, -122.2480, 37.8133, retries=0,
+                    tile_cache=None, data_url_template='http://example.com/{z}-{x}-{y}.{layer}.pbf')
+
+        self.assertEqual(set(context.exception.failures), {(656, 1582), (657, 1582)})
+
+    def test_columnar_frames(self):
+        
+        intersections, geometries = mock_tile.intersections.values(), mock_tile.geometries.values()
+        frames1 = dataframe._columnar_frames(intersections, geometries)
+        frames2 = dataframe._feature_frames(intersections, geometries)
+        
+        for (frame1, frame2) in zip(frames1, frames2):
+            self.assertEqual(list(frame1.columns), list(frame2.columns))
+            self.assertTrue(frame1.geometry.geom_equals_exact(frame2.geometry, 0).all())
+            self.assertEqual(frame1.drop(columns='geometry').to_dict('records'),
+                frame2.drop(columns='geometry').to_dict('records'))
+        
+        self.assertEqual(list(frames1[1].geometry[1].coords), [(-122.2589, 37.8116),
+            (-122.2472, 37.8119), (-122.2468, 37.8068), (-122.2341, 37.8068)])
+        
+        with mock.patch('sharedstreets.dataframe.VECTORIZED', False):
+            frames = dataframe._make_frames(intersections, geometries)
+        
+        self.assertEqual(set(frames.geometries.id), {'NlId', 'Okld'})
+
+    def test_columnar_frames_empty_lonlats(self):
+        
+        geometries = list(mock_tile.geometries.values())
+        geometries.append(Geometry('nada', 'Other', 'NNNN', 'dddd', 'ff', 'bb', []))
+        frames1 = dataframe._columnar_frames([], geometries)
+        frames2 = dataframe._feature_frames([], geometries)
+        
+        self.assertTrue(frames1[1].geometry.geom_equals_exact(frames2[1].geometry, 0).all())
+        self.assertTrue(frames1[1].geometry.iloc[-1].is_empty)
+        self.assertFalse(frames1[1].geometry.iloc[0].is_empty)
+        
+        frames3 = dataframe._columnar_frames([], geometries[-1:])
+        self.assertTrue(frames3[1].geometry.iloc[0].is_empty)
+
+    def test_empty_frames(self):
+        
+        frames = dataframe._make_frames([], [])
+        
+        self.assertEqual(len(frames.intersections), 0)
+        self.assertIn('nodeId', frames.intersections.columns)
+        self.assertEqual(len(frames.geometries), 0)
@@ -0,0 +1,130 @@
+import unittest, mock, tempfile, shutil, os, multiprocessing, concurrent.futures
+from .. import tile, stream, decode, columnar, predicates, benchmark, cache, stats as _stats
+
+def reference_values(reference):
+    # Columnar rows keep values of optional fields but not their presence
+    return reference.id, reference.geometryId, reference.formOfWay, [(LR.intersectionId,
+        LR.lon, LR.lat, LR.inboundBearing, LR.outboundBearing, LR.distanceToNextRef)
+        for LR in reference.locationReferences]
+
+# Parallel decoding needs shared memory from Python 3.8
+PARALLEL = decode.get_shared_memory() is not None
+
+class TestDecode (unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = None if not PARALLEL else concurrent.futures.ProcessPoolExecutor(2,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.executor is not None:
+            cls.executor.shutdown()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+        self.counts = benchmark.make_synthetic_tile(self.directory, 300)
+        self.template = os.path.join(self.directory, '12-{}-{}.{{layer}}.6.pbf'.format(benchmark.DATA_X, benchmark.DATA_Y))
+
+    def tearDown(self):
+        decode.stop()
+        shutil.rmtree(self.directory)
+
+    def read_layer(self, layer):
+        with open(self.template.format(layer=layer), 'rb') as file:
+            return file.read()
+
+    def test_split_frames(self):
+
+        buffer = self.read_layer('geometry')
+        frames = [bytes(frame) for frame in stream.iter_buffer_frames(buffer)]
+
+        for parts in (1, 2, 3, 7, 1000):
+            spans = decode.split_frames(buffer, parts)
+            self.assertEqual(spans[0][0], 0)
+            self.assertEqual(spans[-1][1], len(buffer))
+            self.assertTrue(len(spans) <= parts)
+            self.assertEqual([start for (start, _) in spans[1:]], [end for (_, end) in spans[:-1]])
+
+            split = [bytes(frame) for (start, end) in spans
+                for frame in stream.iter_buffer_frames(buffer[start:end])]
+            self.assertEqual(split, frames, 'Parts {}'.format(parts))
+
+        self.assertEqual(decode.split_frames(b'', 4), [])
+        self.assertEqual(decode.split_frames(buffer[:-1], 4)[-1][1], len(buffer) - 1)
+
+    @unittest.skipUnless(PARALLEL, 'Needs multiprocessing.shared_memory')
+    def test_decode_buffer(self):
+
+        for layer in tile.LAYERS:
+            DataClass, buffer = tile.data_classes[layer], self.read_layer(layer)
+            parsed = decode.decode_buffer(buffer, DataClass)
+            self.assertEqual(len(parsed), self.counts[layer])
+            self.assertTrue(all(isinstance(object, DataClass) for object in parsed))
+
+            stats = _stats.LayerStats()
+
+            with mock.patch('sharedstreets.decode.MIN_PARALLEL_BYTES', 0):
+                rows = decode.decode_buffer(buffer, DataClass, stats, executor=self.executor)
+
+            self.assertEqual((stats.messages, stats.decoded), (len(parsed), len(parsed)))
+
+            if layer == 'reference':
+                self.assertEqual(list(map(reference_values, rows)), list(map(reference_values, parsed)))
+            else:
+                self.assertTrue(all(isinstance(row, columnar._Row) for row in rows))
+                self.assertEqual([row.to_message() for row in rows], parsed)
+
+    @unittest.skipUnless(PARALLEL, 'Needs multiprocessing.shared_memory')
+    def test_decode_buffer_predicate(self):
+
+        buffer, DataClass = self.read_layer('geometry'), tile.data_classes['geometry']
+        predicate = predicates.GeometryPredicate(road_classes=['Residential', 'Service'])
+        expected = [geom for geom in decode.decode_buffer(buffer, DataClass) if predicate.match_object(geom)]
+
+        with mock.patch('sharedstreets.decode.MIN_PARALLEL_BYTES', 0):
+            rows = decode.decode_buffer(buffer, DataClass, predicate=predicate, executor=self.executor)
+
+        self.assertTrue(0 < len(rows) < self.counts['geometry'])
+        self.assertEqual([row.to_message() for row in rows], expected)
+
+    def test_decode_buffer_no_shared_memory(self):
+
+        buffer, DataClass = self.read_layer('geometry'), tile.data_classes['geometry']
+        executor = mock.Mock()
+
+        with mock.patch('sharedstreets.decode.get_shared_memory') as get_shared_memory, \
+             mock.patch('sharedstreets.decode.MIN_PARALLEL_BYTES', 0):
+            get_shared_memory.return_value = None
+            parsed = decode.decode_buffer(buffer, DataClass, executor=executor)
+            self.assertEqual(decode.start(2), 0)
+
+        self.assertEqual(len(parsed), self.counts['geometry'])
+        self.assertTrue(all(isinstance(object, DataClass) for object in parsed))
+        self.assertFalse(executor.submit.called)
+        self.assertIsNone(decode.get_executor())
+
+    @unittest.skipUnless(PARALLEL, 'Needs multiprocessing.shared_memory')
+    def test_get_tile(self):
+
+        args = 14, benchmark.DATA_X * 4 + 1, benchmark.DATA_Y * 4 + 2, self.template
+        expected = tile.make_geojson(tile.get_tile(*args, tile_cache=cache.MemoryCache()))
+
+        self.assertEqual(decode.start(2), 2)
+        self.assertIsNotNone(decode.get_executor())
+        tile_cache, stats = cache.MemoryCache(), _stats.Stats()
+
+        with mock.patch('sharedstreets.decode.MIN_PARALLEL_BYTES', 0):
+            T = tile.get_tile(*args, tile_cache=tile_cache, stats=stats)
+
+        self.assertEqual(tile.make_geojson(T), expected)
+        self.assertTrue(all(isinstance(geom, columnar.GeometryRow) for geom in T.geometries.values()))
+        self.assertEqual(stats.layers['geometry'].decoded, self.counts['geometry'])
+
+        # Cached size counts shared columns once per table
+        self.assertTrue(0 < tile_cache.current_bytes < sum(os.path.getsize(self.template.format(layer=layer))
+            for layer in tile.LAYERS) * 4)
+
+        decode.stop()
+        self.assertIsNone(decode.get_executor())
@@ -0,0 +1,98 @@
+import unittest, mock, httmock, shutil, os
+from .. import tile, index, cache
+from . import make_fixture_directory
+from .test_tile import respond_locally
+
+class TestIndex (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_fixture_directory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def layer_path(self, layer):
+        return os.path.join(self.directory, '12-656-1582.{}.6.pbf'.format(layer))
+
+    def test_build_index(self):
+
+        with open(self.layer_path('intersection'), 'rb') as file:
+            buffer = file.read()
+
+        offsets = index.build_index(buffer)
+        self.assertEqual(set(offsets), {'80ff395c936bb42f328b1eb872174ea9',
+            '81b8be7e93822aa8aec950aec959bfd8', '81966cd8b3352f5b819009bffb0ff6c1'})
+
+        offset, length = offsets['81b8be7e93822aa8aec950aec959bfd8']
+        intersection = tile.data_classes['intersection']()
+        intersection.ParseFromString(buffer[offset:offset+length])
+        self.assertEqual((intersection.lon, intersection.lat), (-122.2730403, 37.8311603))
+
+    def test_get_index_sidecar(self):
+
+        path = self.layer_path('metadata')
+
+        with open(path, 'rb') as file:
+            offsets1 = index.get_index(path, file.read())
+
+        self.assertTrue(os.path.exists(path + index.SUFFIX))
+        self.assertIn('80832506185371acf24df519ce271d31', offsets1)
+
+        with mock.patch('sharedstreets.index.build_index') as build_index:
+            index._recent.clear()
+            offsets2 = index.get_index(path, None)
+
+        self.assertEqual(len(build_index.mock_calls), 0, 'Should read existing sidecar')
+        self.assertEqual(offsets1, offsets2)
+
+    def test_iter_objects_ids(self):
+
+        ids = {'81966cd8b3352f5b819009bffb0ff6c1', 'missing'}
+        intersections = list(tile.iter_objects(self.layer_path('intersection'),
+            tile.data_classes['intersection'], ids=ids))
+
+        self.assertEqual([i.id for i in intersections], ['81966cd8b3352f5b819009bffb0ff6c1'])
+
+        with httmock.HTTMock(respond_locally):
+            intersections = list(tile.iter_objects('http://example.com/20180312-intersection.pbf',
+                tile.data_classes['intersection'], ids=ids))
+
+        self.assertEqual([i.id for i in intersections], ['81966cd8b3352f5b819009bffb0ff6c1'])
+
+    def test_iter_objects_ids_cached(self):
+
+        C = cache.DiskCache(os.path.join(self.directory, 'cache'))
+
+        with httmock.HTTMock(respond_locally):
+            geometries = list(tile.iter_objects('http://example.com/20180312-geometry.pbf',
+                tile.data_classes['geometry'], C, ids={'80a8a7c120332bfb679f877472c9c18d'}))
+
+        entry = C.get('http://example.com/20180312-geometry.pbf')
+        self.assertTrue(os.path.exists(entry.path + index.SUFFIX))
+        self.assertEqual([g.id for g in geometries], ['80a8a7c120332bfb679f877472c9c18d'])
+        self.assertEqual(len(geometries[0].lonlats), 4)
+
+    def test_get_object(self):
+
+        reference = tile.get_object('reference', 'f61c335244e8222f9c31b6eb14fea48a',
+            16, 10509, 25324, self.directory)
+        self.assertEqual(reference.geometryId, '1f624570a89b260bc88e97509be49c96')
+
+        metadata = tile.get_object('metadata', '82b5776e9fcce1c64a431a14bd59b15d',
+            12, 656, 1582, self.directory)
+        self.assertEqual(metadata.osmMetadata.name, 'West MacArthur Boulevard')
+
+        self.assertIsNone(tile.get_object('geometry', 'missing', 12, 656, 1582, self.directory))
+
+    def test_get_tile_indexed(self):
+
+        T1 = tile.get_tile(13, 1313, 3164, self.directory)
+
+        with httmock.HTTMock(respond_locally):
+            T2 = tile.get_tile(13, 1313, 3164, 'http://example.com/20180312-{layer}.pbf')
+
+        self.assertEqual(len(T1.geometries), 2)
+        self.assertEqual(set(T1.geometries), set(T2.geometries))
+        self.assertEqual(set(T1.intersections), set(T2.intersections))
+        self.assertEqual(set(T1.references), set(T2.references))
+        self.assertEqual(set(T1.metadata), set(T2.metadata))
@@ -0,0 +1,144 @@
+import unittest, mock, tempfile, shutil, threading, time, json, os
+from .. import metrics
+
+class TestMetrics (unittest.TestCase):
+
+    def test_render(self):
+
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter('things_total', 'Things seen.', ['kind']))
+        histogram = registry.register(metrics.Histogram('wait_seconds', 'Waits.', buckets=(.1, 1)))
+        registry.register(metrics.Gauge('size', 'Size now.', lambda: 7))
+
+        counter.inc(kind='a "quoted"\nname')
+        counter.inc(2, kind='b')
+        histogram.observe(.05)
+        histogram.observe(.5)
+        histogram.observe(5)
+
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP things_total Things seen.',
+            '# TYPE things_total counter',
+            'things_total{kind="a \\"quoted\\"\\nname"} 1',
+            'things_total{kind="b"} 2',
+            '# HELP wait_seconds Waits.',
+            '# TYPE wait_seconds histogram',
+            'wait_seconds_bucket{le="0.1"} 1',
+            'wait_seconds_bucket{le="1.0"} 2',
+            'wait_seconds_bucket{le="+Inf"} 3',
+            'wait_seconds_sum 5.55',
+            'wait_seconds_count 3',
+            '# HELP size Size now.',
+            '# TYPE size gauge',
+            'size 7',
+            ]) + '\n')
+
+    def make_registry(self, directory):
+
+        registry = metrics.Registry(directory)
+        counter = registry.register(metrics.Counter('things_total', 'Things seen.', ['kind']))
+        histogram = registry.register(metrics.Histogram('wait_seconds', 'Waits.', buckets=(.1, 1)))
+        registry.register(metrics.Gauge('size', 'Size now.', lambda: 7))
+
+        return registry, counter, histogram
+
+    def test_render_directory(self):
+
+        directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+
+        try:
+            with mock.patch('os.getpid') as getpid:
+                getpid.return_value = 101
+                registry1, counter1, histogram1 = self.make_registry(directory)
+                counter1.inc(kind='a')
+                histogram1.observe(.5)
+                registry1.save()
+
+                getpid.return_value = 102
+                registry2, counter2, histogram2 = self.make_registry(directory)
+                counter2.inc(2, kind='a')
+                counter2.inc(kind='b')
+                histogram2.observe(.05)
+                rendered = registry2.render()
+
+                metrics.mark_process_dead(directory, 101)
+                rendered_dead = registry2.render()
+                filenames = sorted(os.listdir(directory))
+
+                # A restarted worker adds to the totals of the one it replaced
+                getpid.return_value = 103
+                registry3, counter3, _ = self.make_registry(directory)
+                counter3.inc(kind='a')
+                registry3.save()
+                metrics.mark_process_dead(directory, 103)
+
+                getpid.return_value = 102
+                rendered_restart = registry2.render()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(rendered, '\n'.join([
+            '# HELP things_total Things seen.',
+            '# TYPE things_total counter',
+            'things_total{kind="a"} 3',
+            'things_total{kind="b"} 1',
+            '# HELP wait_seconds Waits.',
+            '# TYPE wait_seconds histogram',
+            'wait_seconds_bucket{le="0.1"} 1',
+            'wait_seconds_bucket{le="1.0"} 2',
+            'wait_seconds_bucket{le="+Inf"} 2',
+            'wait_seconds_sum 0.55',
+            'wait_seconds_count 2',
+            '# HELP size Size now.',
+            '# TYPE size gauge',
+            'size 14',
+            ]) + '\n')
+
+        self.assertIn('things_total{kind="a"} 3', rendered_dead.split('\n'))
+        self.assertIn('size 7', rendered_dead.split('\n'))
+        self.assertEqual(len(filenames), 2)
+        self.assertIn(metrics.EXITED_FILENAME, filenames)
+        self.assertTrue(filenames[0].startswith('102-'))
+        self.assertIn('things_total{kind="a"} 4', rendered_restart.split('\n'))
+        self.assertIn('wait_seconds_count 2', rendered_restart.split('\n'))
+
+    def test_render_directory_order(self):
+
+        directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+
+        try:
+            registry, _, histogram = self.make_registry(directory)
+            histogram.observe(.5)
+            samples = list(reversed(histogram.samples()))
+
+            with open(os.path.join(directory, '1-a.json'), 'w') as file:
+                json.dump({'wait_seconds': dict(type='histogram', samples=samples)}, file)
+
+            lines = [line for line in registry.render().split('\n') if line.startswith('wait_seconds')]
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(lines, [
+            'wait_seconds_bucket{le="0.1"} 0',
+            'wait_seconds_bucket{le="1.0"} 2',
+            'wait_seconds_bucket{le="+Inf"} 2',
+            'wait_seconds_sum 1.0',
+            'wait_seconds_count 2',
+            ])
+
+    def test_start_saving(self):
+
+        registry = metrics.Registry()
+
+        with mock.patch.object(registry, 'save') as save:
+            saved = threading.Event()
+            save.side_effect = lambda: saved.set()
+            registry.start_saving(.01)
+            self.assertTrue(saved.wait(5))
+
+            registry.stop_saving()
+            time.sleep(.05)
+            calls = len(save.mock_calls)
+            time.sleep(.05)
+
+        self.assertEqual(len(save.mock_calls), calls)
@@ -0,0 +1,111 @@
+import unittest, httmock, json
+from .. import tile, mvt, wire
+from .test_tile import respond_locally
+
+def decode_layers(data):
+    ''' Return a dictionary of layer names to lists of (type, geometry, properties).
+    '''
+    layers = {}
+
+    for (_, _, layer) in wire.iter_fields(data):
+        fields = list(wire.iter_fields(layer))
+        keys = [bytes(value).decode('utf8') for (number, _, value) in fields if number == 3]
+        values = [next(wire.iter_fields(value))[2] for (number, _, value) in fields if number == 4]
+        values = [bytes(value).decode('utf8') if isinstance(value, memoryview) else value for value in values]
+        features = []
+
+        for (number, _, feature) in fields:
+            if number != 2:
+                continue
+            feature = {number: value for (number, _, value) in wire.iter_fields(feature)}
+            tags = list(unpack_varints(feature[2]))
+            properties = {keys[k]: values[v] for (k, v) in zip(tags[0::2], tags[1::2])}
+            features.append((feature[3], list(unpack_varints(feature[4])), properties))
+
+        layers[wire.read_string(layer, 1)] = features
+
+    return layers
+
+def unpack_varints(buffer):
+    position = 0
+    while position < len(buffer):
+        value, position = wire.read_varint(buffer, position)
+        yield value
+
+class TestMVT (unittest.TestCase):
+
+    def test_zigzag(self):
+
+        self.assertEqual([mvt.zigzag(n) for n in (0, -1, 1, -2, 2, 2147483647, -2147483648)],
+            [0, 1, 2, 3, 4, 4294967294, 4294967295])
+
+    def test_clip_line(self):
+
+        line = [(-10, 5), (5, 5), (5, 20), (15, 20), (15, 5), (25, 5)]
+        parts = mvt.clip_line(line, 0, 0, 20, 10)
+        self.assertEqual(parts, [[(0, 5), (5, 5), (5, 10)], [(15, 10), (15, 5), (20, 5)]])
+
+        self.assertEqual(mvt.clip_line([(1, 1), (2, 2), (3, 3)], 0, 0, 10, 10), [[(1, 1), (2, 2), (3, 3)]])
+        self.assertEqual(mvt.clip_line([(-5, -5), (-1, 20)], 0, 0, 10, 10), [])
+        self.assertEqual(mvt.clip_line([(5, 5)], 0, 0, 10, 10), [])
+
+    def test_quantize(self):
+
+        self.assertEqual(mvt.quantize([(0.2, 0.2), (0.4, -0.4), (1.6, 2.5), (-1.5, 3)]),
+            [(0, 0), (2, 2), (-2, 3)])
+
+    def test_project(self):
+
+        projection = mvt.project(12, 656, 1582)
+        self.assertEqual([round(v, 6) for v in projection(-122.34375, 37.85750715625204)], [0, 0])
+        self.assertEqual([round(v, 6) for v in projection(-122.255859375, 37.78808138412046)], [4096, 4096])
+
+    def test_layer(self):
+
+        layer = mvt.Layer('things', 256)
+        layer.add_feature(mvt.LINESTRING, [[(2, 2), (2, 10), (10, 10)], [(20, 20), (25, 20)]], {'name': 'A', 'n': 1})
+        layer.add_feature(mvt.POINT, [[(5, 7)]], {'name': 'A', 'flag': True, 'x': None})
+        layers = decode_layers(mvt.encode_tile([layer, mvt.Layer('empty')]))
+
+        self.assertEqual(list(layers), ['things'])
+        (type1, geometry1, properties1), (type2, geometry2, properties2) = layers['things']
+
+        self.assertEqual(type1, mvt.LINESTRING)
+        self.assertEqual(geometry1, [9, 4, 4, 18, 0, 16, 16, 0, 9, 20, 20, 10, 10, 0])
+        self.assertEqual(properties1, {'name': 'A', 'n': 1})
+
+        self.assertEqual(type2, mvt.POINT)
+        self.assertEqual(geometry2, [9, mvt.zigzag(5), mvt.zigzag(7)])
+        self.assertEqual(properties2, {'name': 'A', 'flag': 1})
+
+    def test_make_mvt(self):
+
+        with httmock.HTTMock(respond_locally):
+            T = tile.Tile(*[{object.id if layer != 'metadata' else object.geometryId: object
+                for object in tile.iter_objects('http://example.com/20180312-{}.pbf'.format(layer),
+                    tile.data_classes[layer])} for layer in tile.LAYERS])
+
+        geojson = tile.make_geojson(T, 12)
+        layers = decode_layers(tile.make_mvt(T, 12, 656, 1582, id_length=12))
+
+        self.assertEqual(sorted(layers), ['geometry', 'intersection'])
+        self.assertEqual(len(layers['geometry']), 3)
+        self.assertEqual(len(layers['intersection']), 3)
+
+        for (_, _, properties) in layers['geometry']:
+            feature = [f for f in geojson['features'] if f['id'] == properties['id']][0]
+            self.assertEqual(properties, feature['properties'])
+
+        for (geom_type, _, properties) in layers['intersection']:
+            feature = [f for f in geojson['features'] if f['id'] == properties['id']][0]
+            self.assertEqual(geom_type, mvt.POINT)
+            self.assertEqual(json.loads(properties['inboundReferenceIds']),
+                feature['properties']['inboundReferenceIds'])
+
+        # Only one geometry is inside the southern tile
+        layers = decode_layers(tile.make_mvt(T, 13, 1313, 3165))
+        self.assertEqual([p['id'] for (_, _, p) in layers['geometry']], ['80a8a7c120332bfb679f877472c9c18d'])
+        self.assertEqual(len(layers['intersection']), 2)
+
+        # Nothing is inside a distant tile
+        self.assertEqual(tile.make_mvt(T, 13, 1300, 3165), b'')
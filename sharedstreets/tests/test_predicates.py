@@ -0,0 +1,76 @@
+import unittest, mock, httmock, shutil, os, ModestMaps.Geo
+from .. import tile, stream, predicates, benchmark, cache
+from . import make_fixture_directory
+from .test_tile import respond_locally
+
+class TestPredicates (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_fixture_directory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_road_class_values(self):
+
+        self.assertEqual(predicates.road_class_values(['Residential', 7, '4']), {5, 7, 4})
+
+        with self.assertRaises(ValueError):
+            predicates.road_class_values(['Footpath'])
+
+    def test_match_message(self):
+
+        dirname = os.path.join(self.directory, 'synthetic')
+        os.mkdir(dirname)
+        benchmark.make_synthetic_tile(dirname, 200)
+
+        with open(os.path.join(dirname, '12-656-1582.geometry.6.pbf'), 'rb') as file:
+            messages = list(stream.iter_frames([file.read()]))
+
+        geometries = list(tile.iter_objects(os.path.join(dirname, '12-656-1582.geometry.6.pbf'),
+            tile.data_classes['geometry']))
+
+        southwest, northeast = ModestMaps.Geo.Location(37.80, -122.30), ModestMaps.Geo.Location(37.82, -122.28)
+        candidates = [
+            predicates.GeometryPredicate(southwest, northeast),
+            predicates.GeometryPredicate(road_classes=['Motorway', 'Residential']),
+            predicates.GeometryPredicate(ids=[geom.id for geom in geometries[::3]]),
+            predicates.GeometryPredicate(southwest, northeast, [1, 2, 3], [geom.id for geom in geometries[::2]]),
+            ]
+
+        for predicate in candidates:
+            matches = [predicate.match_message(message) for message in messages]
+            self.assertEqual(matches, [predicate.match_object(geom) for geom in geometries])
+            self.assertTrue(0 < sum(matches) < len(matches))
+
+        inside = [tile.is_inside(southwest, northeast, geom) for geom in geometries]
+        self.assertEqual(inside, [candidates[0].match_object(geom) for geom in geometries])
+
+        # Malformed messages are left to the parser
+        self.assertTrue(candidates[2].match_message(b'\x0a\xff'))
+
+    def test_get_tile_filters(self):
+
+        url_template = 'http://example.com/20180312-{layer}.pbf'
+        residential = {'80832506185371acf24df519ce271d31'}
+
+        with httmock.HTTMock(respond_locally):
+            T1 = tile.get_tile(12, 656, 1582, url_template, road_classes=['Residential'])
+            T2 = tile.get_tile(12, 656, 1582, url_template, max_workers=1, road_classes=[5])
+            T3 = tile.get_tile(12, 656, 1582, url_template, tile_cache=cache.MemoryCache(),
+                road_classes=['Residential'])
+
+        T4 = tile.get_tile(12, 656, 1582, self.directory, road_classes=['Residential'])
+        T5 = tile.get_tile(12, 656, 1582, self.directory, geometry_ids=residential)
+        T6 = tile.query_bbox(-122.31, 37.79, -122.28, 37.86, self.directory, tile_cache=None,
+            geometry_ids=residential)
+
+        for T in (T1, T2, T3, T4, T5, T6):
+            self.assertEqual(set(T.geometries), residential)
+            self.assertEqual(set(T.metadata), residential)
+
+        with mock.patch('sharedstreets.predicates.WIRE_SCAN', False):
+            T7 = tile.get_tile(12, 656, 1582, self.directory, road_classes=['Service', 'Tertiary'])
+
+        self.assertEqual(len(T7.geometries), 2)
+        self.assertEqual(len(tile.get_tile(12, 656, 1582, self.directory, geometry_ids=[]).geometries), 0)
@@ -0,0 +1,90 @@
+import unittest, tempfile, shutil, sqlite3, gzip, json, os
+from .. import tile, pyramid
+from . import copy_fixture_tile
+
+class TestPyramid (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+        self.data_dir = copy_fixture_tile(os.path.join(self.directory, 'data'))
+
+        # Area inside z12 tile 656/1582, overlapping z13 tiles 1312-1313/3164-3165
+        self.bbox = (-122.31, 37.80, -122.28, 37.83)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse_args(self, output, *options):
+        return pyramid.parser.parse_args([str(v) for v in self.bbox] + [output,
+            '--data-url-template', self.data_dir] + list(options))
+
+    def test_iter_descendants(self):
+
+        tiles = list(pyramid.iter_descendants(656, 1582, self.bbox, 12, 13))
+        self.assertEqual(tiles, [(12, 656, 1582), (13, 1312, 3164), (13, 1312, 3165),
+            (13, 1313, 3164), (13, 1313, 3165)])
+
+        self.assertEqual(list(pyramid.iter_descendants(657, 1582, self.bbox, 12, 13)), [])
+
+    def test_render_data_tile(self):
+
+        self.addCleanup(pyramid._workers.clear)
+        args = self.parse_args(os.path.join(self.directory, 'out'))
+        rendered1 = pyramid.render_data_tile(656, 1582, self.bbox, 12, 13, ['geojson'], 32, args)
+        worker = pyramid._get_worker(args)
+        rendered2 = pyramid.render_data_tile(656, 1582, self.bbox, 12, 13, ['geojson'], 32, args)
+
+        # Worker state is created on first use and reused for the same arguments
+        self.assertIs(pyramid._get_worker(self.parse_args(os.path.join(self.directory, 'out'))), worker)
+        self.assertIsNot(pyramid._get_worker(self.parse_args(os.path.join(self.directory, 'out'),
+            '--id-length', '12')), worker)
+        self.assertEqual(len(rendered1), 5)
+        self.assertEqual(rendered1, rendered2)
+
+    def test_directory(self):
+
+        output_dir = os.path.join(self.directory, 'out')
+        args = self.parse_args(output_dir)
+        output = pyramid.DirectoryOutput(output_dir)
+
+        count = pyramid.render_pyramid(self.bbox, 12, 13, ['geojson', 'mvt'], output, args, 1)
+        self.assertEqual(count, 1)
+
+        with open(os.path.join(output_dir, '13', '1313', '3165.geojson')) as file:
+            geojson = json.load(file)
+
+        self.assertEqual(geojson, tile.make_geojson(tile.get_tile(13, 1313, 3165, self.data_dir)))
+        self.assertTrue(os.path.exists(os.path.join(output_dir, '12', '656', '1582.mvt')))
+        self.assertEqual(output.done(), {(656, 1582)})
+
+        # Resuming skips data tiles already done
+        self.assertEqual(pyramid.render_pyramid(self.bbox, 12, 13, ['geojson'], output, args, 1), 0)
+
+        with self.assertRaises(ValueError):
+            pyramid.render_pyramid(self.bbox, 11, 13, ['geojson'], output, args, 1)
+
+    def test_mbtiles(self):
+
+        path = os.path.join(self.directory, 'out.mbtiles')
+        args = self.parse_args(path)
+        output = pyramid.MBTilesOutput(path, ['geojson', 'mvt'], self.bbox, 12, 13)
+
+        try:
+            pyramid.render_pyramid(self.bbox, 12, 13, ['geojson', 'mvt'], output, args, 1)
+            self.assertEqual(output.done(), {(656, 1582)})
+        finally:
+            output.close()
+
+        db = sqlite3.connect(path)
+        rows = db.execute('SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles WHERE layer = ?', ('mvt', )).fetchall()
+        layers = db.execute('SELECT layer, COUNT(*) FROM tiles GROUP BY layer').fetchall()
+        metadata = dict(db.execute('SELECT name, value FROM metadata'))
+        db.close()
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(layers, [('geojson', 5), ('mvt', 5)])
+        self.assertEqual(metadata['format'], 'pbf')
+
+        data = {(z, x, 2**z - 1 - row): gzip.decompress(data) for (z, x, row, data) in rows}
+        T = tile.get_tile(13, 1313, 3165, self.data_dir)
+        self.assertEqual(data[(13, 1313, 3165)], tile.make_mvt(T, 13, 1313, 3165))
@@ -0,0 +1,53 @@
+import unittest, mock, tempfile, shutil, os
+from .. import webapp, server
+
+class TestServer (unittest.TestCase):
+
+    def tearDown(self):
+        webapp.REGISTRY.directory = None
+
+    def test_options(self):
+
+        args = server.parser.parse_args(['--workers', '2', '--threads', '4'])
+        options = server.server_options(args)
+        directory = webapp.REGISTRY.directory
+
+        self.assertEqual((options['workers'], options['threads']), (2, 4))
+        self.assertEqual(options['worker_class'], 'gthread')
+        self.assertTrue(os.path.isdir(directory))
+
+        application = server.Application(webapp.app, options)
+        self.assertIs(application.cfg.on_exit, options['on_exit'])
+        self.assertIs(application.cfg.child_exit, options['child_exit'])
+
+        # Exiting workers leave the shared directory for the others
+        with mock.patch('sharedstreets.metrics.mark_process_dead') as mark_process_dead:
+            options['child_exit'](None, mock.Mock(pid=101))
+
+        mark_process_dead.assert_called_once_with(directory, 101)
+
+        with mock.patch('sharedstreets.webapp.REGISTRY.start_saving') as start_saving, \
+             mock.patch('sharedstreets.webapp.REGISTRY.stop_saving') as stop_saving:
+            options['post_worker_init'](None)
+            options['worker_exit'](None, None)
+
+        start_saving.assert_called_once_with(server.METRICS_SAVE_INTERVAL_S)
+        stop_saving.assert_called_once_with()
+        self.assertTrue(os.path.isdir(directory))
+
+        options['on_exit'](None)
+        self.assertFalse(os.path.exists(directory))
+
+    def test_options_metrics_directory(self):
+
+        directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+
+        try:
+            args = server.parser.parse_args(['--metrics-directory', directory])
+            options = server.server_options(args)
+            self.assertEqual(webapp.REGISTRY.directory, directory)
+
+            options['on_exit'](None)
+            self.assertTrue(os.path.isdir(directory))
+        finally:
+            shutil.rmtree(directory)
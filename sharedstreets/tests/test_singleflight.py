@@ -0,0 +1,219 @@
+import unittest, mock, asyncio, threading, itertools, time
+from .. import tile, singleflight
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(.01)
+
+def run_coroutine(coroutine):
+    # Same as asyncio.run() from Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+class TestSingleFlight (unittest.TestCase):
+
+    def test_do_threads(self):
+
+        group, calls, release, results = singleflight.Group(), [], threading.Event(), []
+
+        def slow(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+
+        threads = [threading.Thread(target=lambda: results.append(group.do('a', slow, 21)))
+            for i in range(5)]
+
+        for thread in threads:
+            thread.start()
+
+        wait_for(lambda: group.calls + group.deduplicated == len(threads))
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(group.stats(), dict(calls=1, deduplicated=4, in_flight=0))
+
+        # Later calls start over
+        self.assertEqual(group.do('a', slow, 1), 2)
+        self.assertEqual(group.stats()['calls'], 2)
+
+    def test_do_error(self):
+
+        group, release, errors = singleflight.Group(), threading.Event(), []
+
+        def fail():
+            release.wait(5)
+            raise IOError('Nope')
+
+        def call():
+            try:
+                group.do('a', fail)
+            except IOError as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for i in range(3)]
+
+        for thread in threads:
+            thread.start()
+
+        wait_for(lambda: group.calls + group.deduplicated == len(threads))
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(errors), 3)
+        self.assertIs(errors[0], errors[2])
+        self.assertEqual(group.stats()['in_flight'], 0)
+
+    def test_share(self):
+
+        group, calls, pulled = singleflight.Group(), [], []
+
+        def count(stop):
+            calls.append(stop)
+            for i in range(stop):
+                pulled.append(i)
+                yield i
+
+        items1 = group.share('a', count, 3)
+        self.assertEqual(next(items1), 0)
+        self.assertEqual(pulled, [0])
+
+        # A late reader sees every item, reading ahead of the first
+        items2 = group.share('a', count, 5)
+        self.assertEqual(list(items2), [0, 1, 2])
+        self.assertEqual(list(items1), [1, 2])
+        self.assertEqual(calls, [3])
+        self.assertEqual(group.stats(), dict(calls=1, deduplicated=1, in_flight=0))
+
+        # Later calls start over
+        self.assertEqual(list(group.share('a', count, 2)), [0, 1])
+        self.assertEqual(calls, [3, 2])
+
+    def test_share_threads(self):
+
+        group, release, results = singleflight.Group(), threading.Event(), []
+
+        def slow():
+            yield 'x'
+            release.wait(5)
+            yield 'y'
+
+        threads = [threading.Thread(target=lambda: results.append(list(group.share('a', slow))))
+            for i in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        wait_for(lambda: group.calls + group.deduplicated == len(threads))
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, [['x', 'y']] * 4)
+        self.assertEqual(group.stats(), dict(calls=1, deduplicated=3, in_flight=0))
+
+    def test_share_error(self):
+
+        group = singleflight.Group()
+
+        def fail():
+            yield 1
+            raise IOError('Nope')
+
+        items1, items2 = group.share('a', fail), group.share('a', fail)
+        self.assertEqual(next(items1), 1)
+
+        with self.assertRaises(IOError):
+            list(items2)
+
+        with self.assertRaises(IOError):
+            next(items1)
+
+        self.assertEqual(group.stats()['in_flight'], 0)
+
+    def test_share_abandoned(self):
+
+        group = singleflight.Group()
+        items = group.share('a', itertools.count)
+        self.assertEqual(next(items), 0)
+        items.close()
+
+        self.assertEqual(group.stats()['in_flight'], 0)
+        self.assertEqual(next(group.share('a', itertools.count, 5)), 5)
+
+    def test_do_async(self):
+
+        group, calls, release = singleflight.Group(), [], threading.Event()
+
+        def slow(key):
+            calls.append(key)
+            release.wait(5)
+            return key.upper()
+
+        async def run():
+            tasks = [asyncio.ensure_future(group.do_async(key, slow, key)) for key in 'aaab']
+            await asyncio.sleep(0)
+            await asyncio.get_event_loop().run_in_executor(None, release.set)
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(run_coroutine(run()), ['A', 'A', 'A', 'B'])
+        self.assertEqual(sorted(calls), ['a', 'b'])
+        self.assertEqual(group.deduplicated, 2)
+
+    def test_do_async_waits_for_thread(self):
+
+        group, release = singleflight.Group(), threading.Event()
+        thread = threading.Thread(target=group.do, args=('a', lambda: release.wait(5) and 'A'))
+        thread.start()
+        wait_for(lambda: group.calls == 1)
+
+        async def run():
+            task = asyncio.ensure_future(group.do_async('a', lambda: 'B'))
+            await asyncio.sleep(0)
+            release.set()
+            return await task
+
+        self.assertEqual(run_coroutine(run()), 'A')
+        thread.join(5)
+        self.assertEqual(group.deduplicated, 1)
+
+    def test_load_layers_shared(self):
+
+        urls = {layer: 'http://example.com/{}.pbf'.format(layer) for layer in tile.LAYERS}
+        release, results = threading.Event(), []
+
+        def iter_objects(url, DataClass, cache=None, session=None, ids=None, digest=None, stats=None,
+                         predicate=None):
+            release.wait(5)
+            digest.update(url.encode('utf8'))
+            return [url]
+
+        with mock.patch('sharedstreets.tile.LAYER_FLIGHTS', singleflight.Group()) as flights, \
+             mock.patch('sharedstreets.tile.iter_objects', side_effect=iter_objects) as mocked:
+            threads = [threading.Thread(target=lambda: results.append(tile.load_layers(urls)))
+                for i in range(3)]
+
+            for thread in threads:
+                thread.start()
+
+            wait_for(lambda: flights.calls + flights.deduplicated == 3 * len(urls))
+            release.set()
+
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(mocked.mock_calls), 4)
+        self.assertEqual(flights.stats(), dict(calls=4, deduplicated=8, in_flight=0))
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[0]['metadata'], ['http://example.com/metadata.pbf'])
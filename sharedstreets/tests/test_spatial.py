@@ -0,0 +1,64 @@
+import unittest, mock, shutil
+from .. import tile, spatial, cache
+from . import make_fixture_directory
+
+class TestSpatial (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_fixture_directory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_grid_index(self):
+
+        bboxes = [(x, y, x + .5, y + .5) for x in range(10) for y in range(10)]
+        grid = spatial.GridIndex(bboxes + [(float('nan'),) * 4])
+
+        self.assertEqual((grid.columns, grid.rows), (5, 5))
+
+        for window in [(2.2, 3.2, 4.7, 5.1), (-1, -1, 0.1, 0.1), (9.9, 9.9, 20, 20), (0, 0, 10, 10)]:
+            minx, miny, maxx, maxy = window
+            candidates = grid.query(*window)
+            expected = [i for (i, (x1, y1, x2, y2)) in enumerate(bboxes)
+                if x2 >= minx and x1 <= maxx and y2 >= miny and y1 <= maxy]
+            self.assertTrue(set(expected) <= set(candidates), window)
+            self.assertEqual(candidates, sorted(candidates))
+            self.assertNotIn(len(bboxes), candidates)
+
+        self.assertEqual(grid.query(20, 20, 30, 30), [])
+        self.assertEqual(grid.query(-30, 0, -20, 10), [])
+        self.assertLess(len(grid.query(2.2, 3.2, 2.3, 3.3)), 10)
+
+    def test_grid_index_empty(self):
+
+        self.assertEqual(spatial.GridIndex([]).query(0, 0, 1, 1), [])
+        self.assertEqual(spatial.GridIndex([(float('nan'),) * 4]).query(0, 0, 1, 1), [])
+        self.assertEqual(spatial.GridIndex([(1, 1, 1, 1)]).query(0, 0, 1, 1), [0])
+
+    def test_query_bbox(self):
+
+        tile_cache = cache.MemoryCache()
+        T1 = tile.query_bbox(-122.2955, 37.7970, -122.2920, 37.7975, self.directory, tile_cache=tile_cache)
+        T2 = tile.query_bbox(-122.2955, 37.7970, -122.2840, 37.8570, self.directory, tile_cache=tile_cache)
+        T3 = tile.query_bbox(-122.2700, 37.8000, -122.2600, 37.8100, self.directory, tile_cache=None)
+
+        self.assertEqual(set(T1.geometries), {'80a8a7c120332bfb679f877472c9c18d'})
+        self.assertEqual(set(T1.metadata), set(T1.geometries))
+        self.assertIsNone(T1.envelopes)
+
+        self.assertEqual(len(T2.geometries), 3)
+        self.assertIsInstance(T2.envelopes, tile.Envelopes)
+        self.assertEqual(len(T3.geometries), 0)
+        self.assertEqual(tile_cache.stats()['hits'], 1)
+
+    def test_query_bbox_spanning_tiles(self):
+
+        with mock.patch('sharedstreets.tile.get_cached_data_tile') as get_cached_data_tile:
+            get_cached_data_tile.return_value = tile.get_data_tile(
+                dict(z=12, x=656, y=1582), tile.local.resolve_template(self.directory))
+            T = tile.query_bbox(-122.40, 37.79, -122.29, 37.80, self.directory)
+
+        self.assertEqual(get_cached_data_tile.call_count, 2)
+        self.assertEqual([call[0][0]['x'] for call in get_cached_data_tile.call_args_list], [655, 656])
+        self.assertEqual(set(T.geometries), {'80a8a7c120332bfb679f877472c9c18d'})
@@ -0,0 +1,92 @@
+import unittest, mock, shutil, os
+from .. import tile, stats, cache, predicates
+from . import DATA_DIR, make_fixture_directory
+
+class TestStats (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_fixture_directory()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_tile_local(self):
+
+        s = stats.Stats()
+        T = tile.get_tile(13, 1313, 3165, self.directory, stats=s)
+
+        geometry, metadata = s.layers['geometry'], s.layers['metadata']
+        self.assertEqual(geometry.bytes, os.path.getsize(os.path.join(DATA_DIR, '20180312-geometry.pbf')))
+        self.assertGreater(geometry.decode_seconds, 0)
+
+        # Geometries outside the tile are skipped before parsing
+        decoded = 1 if predicates.WIRE_SCAN else 3
+        self.assertEqual((geometry.messages, geometry.decoded, geometry.kept), (3, decoded, 1))
+
+        # Local layers other than geometry are read only for selected ids
+        self.assertEqual((metadata.messages, metadata.decoded, metadata.kept), (1, 1, 1))
+        self.assertLess(metadata.bytes, os.path.getsize(os.path.join(DATA_DIR, '20180312-metadata.pbf')))
+        self.assertEqual(len(T.geometries), 1)
+
+        self.assertGreater(s.filter_seconds, 0)
+        self.assertGreater(s.join_seconds, 0)
+        self.assertGreaterEqual(s.seconds, s.filter_seconds + s.join_seconds + s.io_seconds())
+
+    def test_get_tile_cached(self):
+
+        tile_cache, stats1, stats2 = cache.MemoryCache(), stats.Stats(), stats.Stats()
+        tile.get_tile(13, 1313, 3165, self.directory, tile_cache=tile_cache, stats=stats1)
+        tile.get_tile(13, 1313, 3165, self.directory, tile_cache=tile_cache, stats=stats2)
+
+        self.assertEqual(stats1.layers['reference'].decoded, 3)
+        self.assertEqual(stats2.layers['reference'].decoded, 0)
+        self.assertEqual(stats2.layers['geometry'].kept, 1)
+        self.assertEqual(stats2.io_seconds(), 0)
+
+    def test_get_tile_remote(self):
+
+        def iter_chunks(url, cache=None, session=None):
+            layer = url.split('.')[-3]
+            with open(os.path.join(DATA_DIR, '20180312-{}.pbf'.format(layer)), 'rb') as file:
+                return [file.read()]
+
+        s = stats.Stats()
+
+        with mock.patch('sharedstreets.tile.iter_chunks', side_effect=iter_chunks):
+            tile.get_tile(13, 1313, 3165, 'http://example.com/{z}-{x}-{y}.{layer}.6.pbf', stats=s)
+
+        self.assertEqual(sorted(s.layers), sorted(tile.LAYERS))
+        self.assertEqual(s.layers['reference'].bytes, 563)
+        self.assertEqual(s.layers['reference'].decoded, 3)
+        self.assertEqual(s.layers['reference'].kept, 0)
+
+    def test_hooks(self):
+
+        completed = []
+        stats.add_hook(completed.append)
+
+        try:
+            T = tile.get_tile(12, 656, 1582, self.directory)
+            T = tile.query_bbox(-122.31, 37.80, -122.28, 37.83, self.directory, tile_cache=None)
+        finally:
+            stats.remove_hook(completed.append)
+
+        self.assertEqual(len(completed), 2)
+        self.assertEqual(completed[1].layers['geometry'].kept, len(T.geometries))
+
+        def broken(s):
+            raise ValueError('Nope')
+
+        stats.add_hook(broken)
+
+        try:
+            tile.get_tile(12, 656, 1582, self.directory)
+        finally:
+            stats.remove_hook(broken)
+
+    def test_iter_timed(self):
+
+        layer = stats.LayerStats()
+        self.assertEqual(list(stats.iter_timed([b'abc', b'de'], layer)), [b'abc', b'de'])
+        self.assertEqual(layer.bytes, 5)
+        self.assertGreater(layer.fetch_seconds, 0)
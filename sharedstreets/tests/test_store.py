@@ -0,0 +1,80 @@
+import unittest, tempfile, shutil, sqlite3, threading, os
+from .. import tile, store, cache
+from . import copy_fixture_tile
+
+class TestStore (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sharedstreets-test-')
+        self.data_dir = copy_fixture_tile(os.path.join(self.directory, 'data'))
+
+        self.path = os.path.join(self.directory, 'data.mbtiles')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_put_get(self):
+
+        tile_store = store.TileStore(self.path)
+        count = tile_store.put_many(((12, 656, 1582 + i, 'geometry', b'x' * i) for i in range(5)),
+            batch_size=2)
+
+        self.assertEqual(count, 5)
+        self.assertEqual(tile_store.get(12, 656, 1584, 'geometry'), b'xx')
+        self.assertIsNone(tile_store.get(12, 656, 1584, 'metadata'))
+        self.assertIsNone(tile_store.get(12, 656, 1599, 'geometry'))
+
+        tile_store.put(12, 656, 1584, 'geometry', b'yy')
+        tile_store.set_metadata(dict(name='Test', minzoom=12))
+        self.assertEqual(tile_store.get(12, 656, 1584, 'geometry'), b'yy')
+        self.assertEqual(tile_store.metadata(), dict(name='Test', minzoom='12'))
+        tile_store.close()
+
+        # Rows are numbered from the south as in MBTiles
+        db = sqlite3.connect(self.path)
+        rows = db.execute('SELECT tile_row FROM tiles WHERE tile_data = ?', (b'yy', )).fetchall()
+        db.close()
+        self.assertEqual(rows, [(2**12 - 1 - 1584, )])
+
+        readonly = store.TileStore(self.path, readonly=True)
+        self.assertEqual(readonly.get(12, 656, 1584, 'geometry'), b'yy')
+
+        with self.assertRaises(sqlite3.OperationalError):
+            readonly.put(12, 656, 1584, 'geometry', b'zz')
+
+    def test_connection_per_thread(self):
+
+        tile_store, connections = store.TileStore(self.path), []
+        thread = threading.Thread(target=lambda: connections.append(tile_store.connection()))
+        thread.start()
+        thread.join()
+
+        self.assertIs(tile_store.connection(), tile_store.connection())
+        self.assertIsNot(tile_store.connection(), connections[0])
+
+    def test_parse_url(self):
+
+        template = store.store_template(self.path)
+        url = tile.uritemplate.expand(template, z=12, x=656, y=1582, layer='reference')
+
+        self.assertEqual(store.parse_url(url), (self.path, 12, 656, 1582, 'reference'))
+        self.assertIsNone(store.parse_url('http://example.com/12-656-1582.reference.6.pbf'))
+        self.assertIsNone(store.parse_url('mbtiles:///tmp/data.mbtiles?z=12'))
+
+    def test_get_tile(self):
+
+        tile_store = store.TileStore(self.path)
+        self.assertEqual(tile_store.put_many(store.iter_directory(self.data_dir)), 4)
+
+        expected = tile.make_geojson(tile.get_tile(13, 1313, 3165, self.data_dir))
+
+        for data_url_template in (self.path, tile_store):
+            T = tile.get_tile(13, 1313, 3165, data_url_template)
+            self.assertEqual(tile.make_geojson(T), expected)
+
+        T = tile.get_tile(13, 1313, 3165, self.path, tile_cache=cache.MemoryCache())
+        self.assertEqual(tile.make_geojson(T), expected)
+        self.assertIsNotNone(T.version)
+
+        T = tile.get_tile(12, 656, 1583, self.path)
+        self.assertEqual(len(T.geometries), 0)
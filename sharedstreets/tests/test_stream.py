@@ -0,0 +1,60 @@
+import unittest, mock, httmock, io
+from .. import stream, tile
+from .test_tile import respond_locally
+
+def frame(message):
+    length, header = len(message), bytearray()
+    while length > 0x7f:
+        header.append(length & 0x7f | 0x80)
+        length >>= 7
+    header.append(length)
+    return bytes(header) + message
+
+class TestStream (unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [b'', b'a', b'bc' * 100, b'd' * 20000, b'efg']
+        self.data = b''.join(frame(message) for message in self.messages)
+
+    def test_read_varint(self):
+
+        self.assertEqual(stream.read_varint(b'\x96\x01', 0), (150, 2))
+        self.assertEqual(stream.read_varint(b'\x00\x7f', 1), (127, 2))
+        self.assertRaises(IndexError, stream.read_varint, b'\x96', 0)
+        self.assertEqual(stream.varint_size(150), 2)
+
+    def test_iter_buffer_frames(self):
+
+        frames = list(stream.iter_buffer_frames(self.data))
+        self.assertEqual([bytes(f) for f in frames], self.messages)
+        self.assertTrue(all(f.obj is self.data for f in frames), 'Should not copy frames')
+
+    def test_iter_frames_chunked(self):
+
+        for size in (1, 2, 3, 7, 200, 1000):
+            chunks = [self.data[i:i+size] for i in range(0, len(self.data), size)]
+            frames = stream.iter_frames(chunks)
+            self.assertEqual([bytes(f) for f in frames], self.messages, 'Chunk size {}'.format(size))
+
+    def test_iter_frames_truncated(self):
+
+        frames = stream.iter_frames([self.data[:-1]])
+        self.assertEqual([bytes(f) for f in frames], self.messages[:-1])
+
+    def test_iter_file_frames(self):
+
+        frames = stream.iter_file_frames(io.BytesIO(self.data), 5)
+        self.assertEqual([bytes(f) for f in frames], self.messages)
+
+    @mock.patch('sharedstreets.stream.CHUNK_SIZE', 7)
+    def test_iter_objects_chunked(self):
+
+        with httmock.HTTMock(respond_locally):
+            geometries = tile.iter_objects('http://example.com/20180312-geometry.pbf',
+                tile.data_classes['geometry'])
+            g1, g2, g3 = list(geometries)
+
+        self.assertEqual(g1.id, '80832506185371acf24df519ce271d31')
+        self.assertEqual(len(g1.lonlats), 10)
+        self.assertEqual(g3.id, '82b5776e9fcce1c64a431a14bd59b15d')
+        self.assertEqual(len(g3.lonlats), 16)
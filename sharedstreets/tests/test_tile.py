@@ -1,5 +1,6 @@
-import unittest, mock, httmock, os, posixpath, ModestMaps.Geo
-from .. import tile
+import unittest, mock, httmock, io, json, os, posixpath, threading, time, tempfile, shutil, tracemalloc, ModestMaps.Geo
+from .. import tile, singleflight, decode, stats as _stats
+from . import make_fixture_directory
 
 def respond_locally(url, request):
     path_parts = url.path.split(posixpath.sep)
@@ -220,9 +221,10 @@ class TestTile (unittest.TestCase):
         sw3 = ModestMaps.Geo.Location(37.80554567109770, -122.2763836383820)
         self.assertFalse(tile.is_inside(sw3, ne, geometry))
     
+    @mock.patch('sharedstreets.tile.iter_shared_objects')
     @mock.patch('sharedstreets.tile.iter_objects')
     @mock.patch('uritemplate.expand')
-    def test_get_tile(self, uri_expand, iter_objects):
+    def test_get_tile(self, uri_expand, iter_objects, iter_shared_objects):
     
         everything = mock.Mock()
         everything.id = 'everything'
@@ -230,32 +232,334 @@ class TestTile (unittest.TestCase):
         everything.fromIntersectionId = 'everything'
         everything.lonlats = [-122.27120, 37.80437, -122.27182, 37.80598]
         iter_objects.return_value = [everything, everything]
+        iter_shared_objects.return_value = [everything, everything]
     
         T = tile.get_tile(16, 10509, 25324)
         
-        self.assertEqual(len(uri_expand.mock_calls), 4)
-        for mock_call in uri_expand.mock_calls:
-            self.assertEqual(mock_call[1][0], tile.DATA_URL_TEMPLATE)
+        self.assertEqual(len(uri_expand.call_args_list), 4)
+        for mock_call in uri_expand.call_args_list:
+            self.assertEqual(mock_call[0][0], tile.DATA_URL_TEMPLATE)
         
         self.assertEqual(len(T.geometries), 1)
         self.assertEqual(len(T.intersections), 1)
         self.assertEqual(len(T.references), 1)
         self.assertEqual(len(T.metadata), 1)
     
+    @mock.patch('sharedstreets.tile.iter_shared_objects')
     @mock.patch('sharedstreets.tile.iter_objects')
     @mock.patch('uritemplate.expand')
-    def test_get_tile_alt_url(self, uri_expand, iter_objects):
+    def test_get_tile_alt_url(self, uri_expand, iter_objects, iter_shared_objects):
     
         iter_objects.return_value = []
+        iter_shared_objects.return_value = []
     
         T = tile.get_tile(16, 10509, 25324,
             data_url_template='https://example.com/{z}-{x}-{y}.{layer}.pbf')
         
-        self.assertEqual(len(uri_expand.mock_calls), 4)
-        for mock_call in uri_expand.mock_calls:
-            self.assertEqual(mock_call[1][0], 'https://example.com/{z}-{x}-{y}.{layer}.pbf')
+        self.assertEqual(len(uri_expand.call_args_list), 4)
+        for mock_call in uri_expand.call_args_list:
+            self.assertEqual(mock_call[0][0], 'https://example.com/{z}-{x}-{y}.{layer}.pbf')
         
         self.assertEqual(len(T.geometries), 0)
         self.assertEqual(len(T.intersections), 0)
         self.assertEqual(len(T.references), 0)
         self.assertEqual(len(T.metadata), 0)
+
+    def test_get_tile_concurrent_layers(self):
+    
+        # Every layer request must be in flight at once to pass the barrier
+        barrier = threading.Barrier(4, timeout=5)
+        
+        def respond_together(url, request):
+            barrier.wait()
+            return respond_locally(url, request)
+        
+        with httmock.HTTMock(respond_together):
+            T = tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf')
+        
+        self.assertEqual(len(T.geometries), 3)
+        self.assertEqual(len(T.metadata), 3)
+    
+    def test_get_tile_concurrent_shared(self):
+    
+        release, requested, results = threading.Event(), [], []
+        
+        def respond_later(url, request):
+            requested.append(url.path)
+            release.wait(5)
+            return respond_locally(url, request)
+        
+        def get_tile():
+            results.append(tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf'))
+        
+        with httmock.HTTMock(respond_later), \
+             mock.patch('sharedstreets.tile.LAYER_FLIGHTS', singleflight.Group()) as flights:
+            threads = [threading.Thread(target=get_tile) for i in range(8)]
+            
+            for thread in threads:
+                thread.start()
+            
+            deadline = time.time() + 5
+            while flights.calls + flights.deduplicated < 8 * len(tile.LAYERS) and time.time() < deadline:
+                time.sleep(.01)
+            
+            release.set()
+            
+            for thread in threads:
+                thread.join(5)
+        
+        self.assertEqual(requested.count('/20180312-geometry.pbf'), 1)
+        self.assertEqual(len(requested), len(tile.LAYERS))
+        self.assertEqual([len(T.geometries) for T in results], [3] * 8)
+    
+    def test_iter_shared_objects(self):
+    
+        with open(os.path.join(os.path.dirname(__file__), 'data', '20180312-geometry.pbf'), 'rb') as file:
+            buffer = file.read()
+        
+        pulled, DataClass = [], tile.data_classes['geometry']
+        
+        def iter_chunks(url, cache, session):
+            for (start, end) in decode.split_frames(buffer, 3):
+                pulled.append(start)
+                yield buffer[start:end]
+        
+        with mock.patch('sharedstreets.tile.LAYER_FLIGHTS', singleflight.Group()) as flights, \
+             mock.patch('sharedstreets.tile.iter_chunks', side_effect=iter_chunks) as mocked:
+            objects1 = tile.iter_shared_objects('http://example.com/g.pbf', DataClass)
+            first = next(objects1)
+            
+            # Decoding starts before the whole layer is downloaded
+            self.assertEqual(len(pulled), 1)
+            
+            stats = _stats.LayerStats()
+            objects2 = list(tile.iter_shared_objects('http://example.com/g.pbf', DataClass, stats=stats))
+            objects1 = [first] + list(objects1)
+        
+        self.assertEqual(len(mocked.mock_calls), 1)
+        self.assertEqual(flights.stats()['deduplicated'], 1)
+        self.assertEqual(len(objects1), 3)
+        self.assertEqual(objects1, objects2)
+        self.assertEqual((stats.messages, stats.bytes), (3, 0))
+    
+    @mock.patch('sharedstreets.tile.iter_objects')
+    def test_load_layers_serial(self, iter_objects):
+    
+        iter_objects.return_value = iter([])
+        urls = {'geometry': 'http://example.com/g.pbf', 'metadata': 'http://example.com/m.pbf'}
+        layers = tile.load_layers(urls, max_workers=1)
+        
+        self.assertEqual(set(layers), {'geometry', 'metadata'})
+        self.assertIs(layers['geometry'], iter_objects.return_value)
+        self.assertEqual(len(iter_objects.mock_calls), 2)
+    
+    def test_iter_objects_local_file(self):
+    
+        path = os.path.join(os.path.dirname(__file__), 'data', '20180312-intersection.pbf')
+        
+        for url in (path, 'file://' + path):
+            i1, i2, i3 = list(tile.iter_objects(url, tile.data_classes['intersection']))
+            self.assertEqual(i1.id, '80ff395c936bb42f328b1eb872174ea9')
+            self.assertEqual(i3.id, '81966cd8b3352f5b819009bffb0ff6c1')
+        
+        missing = list(tile.iter_objects(path + '-missing', tile.data_classes['intersection']))
+        self.assertEqual(len(missing), 0)
+    
+    def test_get_tile_local_directory(self):
+    
+        dirname = make_fixture_directory()
+        
+        try:
+            T1 = tile.get_tile(12, 656, 1582, dirname)
+            T2 = tile.get_tile(12, 656, 1582, 'file://' + dirname + '/{z}-{x}-{y}.{layer}.6.pbf')
+        finally:
+            shutil.rmtree(dirname)
+        
+        self.assertEqual(len(T1.geometries), 3)
+        self.assertEqual(len(T1.metadata), 3)
+        self.assertEqual(set(T1.geometries), set(T2.geometries))
+    
+    def test_get_tile_layers(self):
+    
+        requested = []
+        
+        def respond_recording(url, request):
+            requested.append(posixpath.basename(url.path))
+            return respond_locally(url, request)
+        
+        with httmock.HTTMock(respond_recording):
+            T = tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf',
+                layers=['intersection'])
+            
+            self.assertEqual(sorted(requested), ['20180312-geometry.pbf', '20180312-intersection.pbf'])
+            self.assertTrue(T.loaded('intersection'))
+            self.assertFalse(T.loaded('metadata'))
+            self.assertEqual(T.nbytes(), sum(o.ByteSize() for o in T.geometries.values())
+                * tile.DECODED_SIZE_RATIOS['geometry'])
+            
+            self.assertEqual(len(T.metadata), 3)
+            self.assertTrue(T.loaded('metadata'))
+            self.assertEqual(requested[-1], '20180312-metadata.pbf')
+            self.assertEqual(len(T.metadata), 3)
+            self.assertEqual(len(requested), 3)
+        
+        with self.assertRaises(ValueError):
+            tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf', layers=['nope'])
+    
+    def test_get_tile_layers_cached(self):
+    
+        requested, tile_cache = [], tile._cache.MemoryCache()
+        
+        def respond_recording(url, request):
+            requested.append(posixpath.basename(url.path))
+            return respond_locally(url, request)
+        
+        with httmock.HTTMock(respond_recording):
+            T1 = tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf',
+                tile_cache=tile_cache, layers=['geometry'])
+            self.assertEqual(requested, ['20180312-geometry.pbf'])
+            self.assertIsNone(T1.version)
+            geometry_bytes = tile_cache.current_bytes
+            
+            T2 = tile.get_tile(12, 656, 1582, 'http://example.com/20180312-{layer}.pbf',
+                tile_cache=tile_cache)
+            
+            # Layers missing from the cached data tile are loaded once for everyone
+            self.assertEqual(len(T2.metadata), 3)
+            self.assertEqual(len(T1.metadata), 3)
+            self.assertEqual(len(requested), 4)
+            
+            # Layers loaded later are counted against the cache
+            data_tile = tile_cache.get(('http://example.com/20180312-{layer}.pbf', 12, 656, 1582))
+            self.assertTrue(tile_cache.current_bytes > geometry_bytes)
+            self.assertEqual(tile_cache.current_bytes, data_tile.nbytes())
+    
+    def test_get_tile_failed_not_cached(self):
+    
+        failing, tile_cache = {'20180312-metadata.pbf'}, tile._cache.MemoryCache()
+        url_template = 'http://example.com/20180312-{layer}.pbf'
+        
+        def respond_failing(url, request):
+            if posixpath.basename(url.path) in failing:
+                return httmock.response(503, b'Slow down')
+            return respond_locally(url, request)
+        
+        with httmock.HTTMock(respond_failing):
+            with self.assertRaises(IOError):
+                tile.get_tile(12, 656, 1582, url_template, tile_cache=tile_cache)
+            
+            self.assertEqual(len(tile_cache), 0, 'Should not cache a tile with failed layers')
+            
+            # A lazily-loaded layer that fails is tried again on next access
+            T = tile.get_tile(12, 656, 1582, url_template, tile_cache=tile_cache, layers=['geometry'])
+            
+            with self.assertRaises(IOError):
+                T.metadata
+            
+            failing.clear()
+            self.assertEqual(len(T.metadata), 3)
+            self.assertEqual(len(tile.get_tile(12, 656, 1582, url_template, tile_cache=tile_cache).geometries), 3)
+            self.assertEqual(len(tile_cache), 1)
+    
+    def test_nbytes_memory(self):
+    
+        from .. import benchmark
+        dirname = tempfile.mkdtemp(prefix='sharedstreets-test-')
+        
+        try:
+            benchmark.make_synthetic_tile(dirname, 500)
+            tracemalloc.start()
+            T = tile.get_data_tile(dict(z=12, x=656, y=1582), dirname)
+            used, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            shutil.rmtree(dirname)
+        
+        # Estimates should be close to memory actually allocated for the tile
+        self.assertTrue(used / 2 < T.nbytes() < used * 2, (T.nbytes(), used))
+    
+    def test_geometry_bboxes(self):
+    
+        with httmock.HTTMock(respond_locally):
+            geometries = list(tile.iter_objects('http://example.com/20180312-geometry.pbf',
+                tile.data_classes['geometry']))
+        
+        empty = tile.data_classes['geometry']()
+        bboxes = tile.geometry_bboxes(geometries + [empty])
+        
+        for (geometry, bbox) in zip(geometries, bboxes):
+            lons, lats = geometry.lonlats[0::2], geometry.lonlats[1::2]
+            self.assertEqual(list(bbox), [min(lons), min(lats), max(lons), max(lats)])
+        
+        self.assertTrue(all(bboxes[-1] != bboxes[-1]), 'Should be NaN')
+    
+    def test_select_inside(self):
+    
+        with httmock.HTTMock(respond_locally):
+            geometries = list(tile.iter_objects('http://example.com/20180307-geometry.pbf',
+                tile.data_classes['geometry']))
+        
+        ne = ModestMaps.Geo.Location(37.806469, -122.275192)
+        sw = ModestMaps.Geo.Location(37.80355359456757, -122.2787976264954)
+        expected = [g for g in geometries if tile.is_inside(sw, ne, g)]
+        
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(tile.select_inside(sw, ne, geometries), expected)
+        
+        with mock.patch('sharedstreets.tile.numpy', None):
+            self.assertEqual(tile.select_inside(sw, ne, geometries), expected)
+    
+    def test_envelopes(self):
+    
+        with httmock.HTTMock(respond_locally):
+            geometries = list(tile.iter_objects('http://example.com/20180307-geometry.pbf',
+                tile.data_classes['geometry']))
+        
+        ne = ModestMaps.Geo.Location(37.806469, -122.275192)
+        sw1 = ModestMaps.Geo.Location(37.80355359456757, -122.2787976264954)
+        sw2 = ModestMaps.Geo.Location(37.80554567109770, -122.2763836383820)
+        
+        envelopes1 = tile.Envelopes(geometries)
+        
+        with mock.patch('sharedstreets.tile.numpy', None):
+            envelopes2 = tile.Envelopes(geometries)
+            self.assertEqual(envelopes2.select(sw1, ne), [geometries[0]])
+            self.assertEqual(envelopes2.select(sw2, ne), [])
+            self.assertEqual(envelopes2.nbytes(), 3 * 4 * 8)
+        
+        self.assertEqual(len(envelopes1), 3)
+        self.assertEqual(envelopes1.select(sw1, ne), [geometries[0]])
+        self.assertEqual(envelopes1.select(sw2, ne), [])
+        self.assertEqual(envelopes1.nbytes(), 3 * 4 * 8)
+    
+    def test_format_coord(self):
+    
+        for value in (0., 37., -122.5, -122.2951692, 37.80355359456757, 1e-8, -1e-8, 179.99999999):
+            self.assertEqual(float(tile.format_coord(value)), tile.round_coord(value), value)
+        
+        self.assertEqual(tile.format_coord(37.80355359456757), '37.8035536')
+        self.assertEqual(tile.format_coord(37.), '37.0')
+    
+    def test_iter_geojson(self):
+    
+        with httmock.HTTMock(respond_locally):
+            T = tile.Tile(*[{object.id if layer != 'metadata' else object.geometryId: object
+                for object in tile.iter_objects('http://example.com/20180312-{}.pbf'.format(layer),
+                    tile.data_classes[layer])} for layer in tile.LAYERS])
+        
+        for id_length in (32, 12):
+            chunks = list(tile.iter_geojson(T, id_length, chunk_size=256))
+            geojson = json.loads(b''.join(chunks).decode('utf8'))
+            self.assertEqual(geojson, tile.make_geojson(T, id_length))
+            self.assertGreater(len(chunks), 1)
+        
+        self.assertEqual(len(geojson['features']), 6)
+        self.assertEqual(len(geojson['references']), 3)
+        
+        file = io.BytesIO()
+        tile.write_geojson(T, file)
+        self.assertEqual(json.loads(file.getvalue().decode('utf8')), tile.make_geojson(T))
+        
+        empty = tile.Tile({}, {}, {}, {})
+        self.assertEqual(json.loads(b''.join(tile.iter_geojson(empty)).decode('utf8')),
+            tile.make_geojson(empty))
@@ -0,0 +1,91 @@
+import unittest, threading, os, posixpath, http.server, requests
+from .. import tile, transport
+
+class Handler (http.server.BaseHTTPRequestHandler):
+    ''' Stand-in upstream server for files in tests/data, failing on demand.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.client_address)
+
+        if server.failures > 0:
+            server.failures -= 1
+            return self.respond(503, b'Slow down')
+
+        local_path = os.path.join(os.path.dirname(__file__), 'data',
+            posixpath.basename(self.path))
+
+        if not os.path.exists(local_path):
+            return self.respond(404, b'Nope')
+
+        with open(local_path, 'rb') as file:
+            return self.respond(200, file.read())
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestTransport (unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.requests, self.server.failures = [], 0
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+
+        session = transport.make_session()
+        url = self.base_url + '/20180312-intersection.pbf'
+
+        for _ in range(3):
+            i = list(tile.iter_objects(url, tile.data_classes['intersection'], session=session))
+            self.assertEqual(len(i), 3)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(self.server.requests)), 1, 'Should reuse one connection')
+
+    def test_retry_server_errors(self):
+
+        self.server.failures = 2
+        session = transport.make_session(retries=2, backoff_factor=0)
+        url = self.base_url + '/20180312-geometry.pbf'
+        g = list(tile.iter_objects(url, tile.data_classes['geometry'], session=session))
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(g), 3)
+
+    def test_retries_exhausted(self):
+
+        self.server.failures = 5
+        session = transport.make_session(retries=1, backoff_factor=0)
+        url = self.base_url + '/20180312-geometry.pbf'
+
+        with self.assertRaises(requests.HTTPError):
+            list(tile.iter_objects(url, tile.data_classes['geometry'], session=session))
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_get_tile_session(self):
+
+        session = transport.make_session()
+        template = self.base_url + '/20180312-{layer}.pbf'
+        T = tile.get_tile(12, 656, 1582, template, session=session)
+
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(T.geometries), 3)
+
+    def test_default_session(self):
+
+        self.assertIs(transport.get_session(), transport.get_session())
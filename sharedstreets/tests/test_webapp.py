@@ -0,0 +1,173 @@
+import unittest, mock, shutil, gzip, json, os
+from .. import tile, cache, store, webapp, stats as _stats
+from . import make_fixture_directory
+
+class TestWebapp (unittest.TestCase):
+
+    def setUp(self):
+        self.directory = make_fixture_directory()
+
+        webapp.app.config['SHAREDSTREETS_DATA_URL_TEMPLATE'] = self.directory
+        self.tile_cache = mock.patch('sharedstreets.tile.DATA_TILE_CACHE', cache.MemoryCache())
+        self.tile_cache.start()
+        self.client = webapp.app.test_client()
+
+    def tearDown(self):
+        self.tile_cache.stop()
+        webapp.app.config.pop('SHAREDSTREETS_DATA_URL_TEMPLATE')
+        shutil.rmtree(self.directory)
+
+    def test_geojson_gzip(self):
+
+        response1 = self.client.get('/tile/12/656/1582.geojson')
+        response2 = self.client.get('/tile/12/656/1582.geojson', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response1.status_code, 200)
+        self.assertIsNone(response1.headers.get('Content-Encoding'))
+        self.assertEqual(response2.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response2.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(response2.data).decode('utf8')),
+            json.loads(response1.data.decode('utf8')))
+
+        etag1, etag2 = response1.get_etag()[0], response2.get_etag()[0]
+        self.assertEqual(etag2, etag1 + '-gzip')
+        self.assertFalse(response1.get_etag()[1])
+        self.assertEqual(response1.cache_control.max_age, webapp.CACHE_MAX_AGE_S)
+        self.assertTrue(response1.cache_control.public)
+
+    def test_not_modified(self):
+
+        etag = self.client.get('/tile/12/656/1582.mvt').headers['ETag']
+
+        with mock.patch('sharedstreets.tile.make_mvt') as make_mvt:
+            response = self.client.get('/tile/12/656/1582.mvt', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+        self.assertFalse(make_mvt.called)
+
+        etag = self.client.get('/tile/12/656/1582.geojson', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        response = self.client.get('/tile/12/656/1582.geojson',
+            headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        response = self.client.get('/tile/12/656/1583.geojson', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_without_version(self):
+
+        with mock.patch('sharedstreets.webapp.load_tile') as load_tile:
+            load_tile.return_value = tile.Tile({}, {}, {}, {})
+            response1 = self.client.get('/tile/12/656/1582.geojson')
+            response2 = self.client.get('/tile/12/656/1582.geojson',
+                headers={'If-None-Match': response1.headers['ETag']})
+
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(response2.status_code, 304)
+
+    def test_choose_encoding(self):
+
+        with webapp.app.test_request_context(headers={'Accept-Encoding': 'gzip, br'}):
+            accept_encodings = webapp.flask.request.accept_encodings
+
+            with mock.patch('sharedstreets.webapp.brotli', None):
+                self.assertEqual(webapp.choose_encoding(accept_encodings), 'gzip')
+
+            with mock.patch('sharedstreets.webapp.brotli'):
+                self.assertEqual(webapp.choose_encoding(accept_encodings), 'br')
+
+        with webapp.app.test_request_context(headers={'Accept-Encoding': 'identity'}):
+            self.assertIsNone(webapp.choose_encoding(webapp.flask.request.accept_encodings))
+
+    def test_tile_store(self):
+
+        tile_store = store.TileStore(os.path.join(self.directory, 'tiles.mbtiles'))
+        webapp.app.config['SHAREDSTREETS_TILE_STORE'] = tile_store
+
+        try:
+            response1 = self.client.get('/tile/12/656/1582.mvt')
+
+            with mock.patch('sharedstreets.webapp.load_tile') as load_tile:
+                response2 = self.client.get('/tile/12/656/1582.mvt')
+                response3 = self.client.get('/tile/12/656/1582.mvt',
+                    headers={'If-None-Match': response2.headers['ETag']})
+        finally:
+            webapp.app.config.pop('SHAREDSTREETS_TILE_STORE')
+
+        self.assertEqual(response2.data, response1.data)
+        self.assertEqual(response3.status_code, 304)
+        self.assertFalse(load_tile.called)
+        self.assertEqual(gzip.decompress(tile_store.get(12, 656, 1582, 'mvt')), response1.data)
+        self.assertIsNone(tile_store.get(12, 656, 1582, 'geojson'))
+
+    def test_configure(self):
+
+        args = webapp.parser.parse_args(['--data-url-template', self.directory])
+
+        with mock.patch('sharedstreets.stats.add_hook') as add_hook:
+            webapp.configure(args)
+
+        for key in ('SHAREDSTREETS_CACHE', 'SHAREDSTREETS_SESSION', 'SHAREDSTREETS_TILE_STORE',
+                    'SHAREDSTREETS_MAX_BBOX_TILES'):
+            webapp.app.config.pop(key)
+
+        add_hook.assert_called_once_with(webapp.observe_stats)
+
+    def test_bbox(self):
+
+        response = self.client.get('/bbox.geojson?bbox=-122.3000,37.7900,-122.2800,37.8300')
+        features = json.loads(response.data.decode('utf8'))['features']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(features)
+        self.assertEqual(response.mimetype, 'application/json')
+
+    @mock.patch('sharedstreets.tile.query_bbox')
+    def test_bbox_too_large(self, query_bbox):
+
+        response1 = self.client.get('/bbox.geojson?bbox=-180,-85,180,85')
+
+        webapp.app.config['SHAREDSTREETS_MAX_BBOX_TILES'] = 1
+
+        try:
+            response2 = self.client.get('/bbox.geojson?bbox=-122.2820,37.7946,-122.2480,37.8133')
+        finally:
+            webapp.app.config.pop('SHAREDSTREETS_MAX_BBOX_TILES')
+
+        self.assertEqual(response1.status_code, 413)
+        self.assertEqual(response2.status_code, 413)
+        self.assertFalse(query_bbox.called)
+
+    @mock.patch('sharedstreets.tile.query_bbox')
+    def test_bbox_malformed(self, query_bbox):
+
+        for bbox in ('nan,37.79,-122.28,37.86', '-122.28,37.79,inf,37.86', '-122.28,37.79,-122.24',
+                     '-122.24,37.79,-122.28,37.86', '-122.28,37.79,-122.24,95', 'x,y,z,w', ''):
+            response = self.client.get('/bbox.geojson', query_string=dict(bbox=bbox))
+            self.assertEqual(response.status_code, 400, bbox)
+
+        self.assertEqual(self.client.get('/bbox.geojson').status_code, 400)
+        self.assertFalse(query_bbox.called)
+
+    def test_metrics(self):
+
+        _stats.add_hook(webapp.observe_stats)
+        self.addCleanup(_stats.remove_hook, webapp.observe_stats)
+
+        with mock.patch('sharedstreets.webapp.REGISTRY.save') as save:
+            self.client.get('/tile/12/656/1582.mvt')
+
+        # Metrics are saved when scraped, not with every tile
+        self.assertFalse(save.called)
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+
+        lines = response.data.decode('utf8').split('\n')
+        self.assertIn('# TYPE sharedstreets_upstream_fetch_seconds histogram', lines)
+        self.assertIn('sharedstreets_tile_cache{stat="misses"} 1', lines)
+        self.assertTrue([line for line in lines
+            if line.startswith('sharedstreets_upstream_bytes_total{layer="geometry"}')])
@@ -1,7 +1,12 @@
-import argparse, itertools, sys, json, logging
-import ModestMaps.Core, ModestMaps.OpenStreetMap, uritemplate, requests, google.protobuf.message
-from google.protobuf.internal.decoder import _DecodeVarint32
-from . import sharedstreets_pb2
+import argparse, itertools, sys, time, json, threading, array, hashlib, logging, collections, concurrent.futures
+import ModestMaps.Core, ModestMaps.Geo, ModestMaps.OpenStreetMap, uritemplate
+from . import sharedstreets_pb2, transport, stream, local, store, index, spatial, columnar, mvt, singleflight, predicates, decode, cache as _cache, stats as _stats
+
+try:
+    import numpy
+except ImportError:
+    # Vectorized geometry filtering is optional
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +24,170 @@ OSM = ModestMaps.OpenStreetMap.Provider()
 
 UPSTREAM_SHST_REQUEST_TIMEOUT_S = 20
 
+# Maximum number of upstream layers downloaded at once for a single tile
+UPSTREAM_SHST_CONCURRENCY = 4
+
+LAYERS = ('geometry', 'intersection', 'reference', 'metadata')
+
+# Tile attribute names of each layer
+LAYER_ATTRIBUTES = dict(geometry='geometries', intersection='intersections',
+    reference='references', metadata='metadata')
+
+# Approximate ratios of decoded protobuf object memory to wire size for each
+# layer, measured with tracemalloc under the pure-Python protobuf runtime.
+# Nested messages cost the most per wire byte. Compiled runtimes use less,
+# so sizes from Tile.nbytes() err on the large side there.
+DECODED_SIZE_RATIOS = dict(geometry=6, intersection=8, reference=15, metadata=22)
+
+# Decoded upstream tiles shared by webapp and dataframe modules
+DATA_TILE_CACHE = _cache.MemoryCache()
+
+# Shared in-flight upstream layer downloads, keyed on layer URL
+LAYER_FLIGHTS = singleflight.Group()
+
+def _lazy_layer(layer):
+    ''' Return a Tile property for a layer that may be loaded on first access.
+    '''
+    def get(self):
+        objects, loaded = self._layers[layer], False
+
+        if callable(objects):
+            with self._lock:
+                objects = self._layers[layer]
+                if callable(objects):
+                    objects = self._layers[layer] = objects()
+                    loaded = True
+
+        if loaded and self.on_load is not None:
+            self.on_load(layer)
+
+        return objects
+
+    def set(self, objects):
+        self._layers[layer] = objects
+
+    return property(get, set)
+
 class Tile:
     ''' Container for dicts of SharedStreets geometries, intersections, references, and metadata.
+
+        intersections, references, metadata: Dictionaries of objects, or
+            functions returning one to be called once on first access.
+
+        envelopes: Optional Envelopes instance for geometries.
+
+        version: Optional string identifying the upstream content of the
+            tile, such as a digest of its protobuf bodies.
+
+        on_load: Optional function called with a layer name after a layer
+            is loaded on first access, such as to update a cached size.
     '''
-    def __init__(self, geometries, intersections, references, metadata):
+    def __init__(self, geometries, intersections, references, metadata, envelopes=None,
+                 version=None):
+        self._layers, self._lock = {}, threading.Lock()
         self.geometries = geometries
         self.intersections = intersections
         self.references = references
         self.metadata = metadata
+        self.envelopes = envelopes
+        self.version = version
+        self.on_load = None
+
+    intersections = _lazy_layer('intersection')
+    references = _lazy_layer('reference')
+    metadata = _lazy_layer('metadata')
+
+    def loaded(self, layer):
+        ''' Return True if a layer has been loaded.
+        '''
+        return not callable(self._layers.get(layer))
+
+    def nbytes(self):
+        ''' Return approximate memory size of contained objects in bytes, not loading any layers.
+
+            Protobuf objects are counted by wire size scaled by DECODED_SIZE_RATIOS.
+        '''
+        size, tables = 0, {}
+
+        for layer in LAYERS:
+            if not self.loaded(layer):
+                continue
+
+            wire_size = 0
+
+            for object in getattr(self, LAYER_ATTRIBUTES[layer]).values():
+                if isinstance(object, columnar._Row):
+                    # Rows from decode.decode_buffer() share their tables' columns
+                    tables[id(object.table)] = object.table
+                else:
+                    wire_size += object.ByteSize()
+
+            size += wire_size * DECODED_SIZE_RATIOS[layer]
+
+        size += sum(table.nbytes() for table in tables.values())
+
+        if self.envelopes is not None:
+            size += self.envelopes.nbytes()
+
+        return size
+
+class Envelopes:
+    ''' Precomputed bounding boxes for a sequence of SharedStreets geometries.
+
+        Bboxes are kept in one array of (minlon, minlat, maxlon, maxlat) rows,
+        a NumPy array when available and array.array otherwise, so selecting
+        geometries never reads their lonlats again. A spatial.GridIndex over
+        the bboxes limits each selection to nearby candidates.
+    '''
+    __slots__ = ('geometries', 'bboxes', 'index')
+
+    def __init__(self, geometries):
+        self.geometries = list(geometries)
+
+        if numpy is not None:
+            self.bboxes = geometry_bboxes(self.geometries)
+        else:
+            self.bboxes = array.array('d')
+            for geom in self.geometries:
+                lons, lats = geom.lonlats[0::2], geom.lonlats[1::2]
+                if lons and lats:
+                    self.bboxes.extend((min(lons), min(lats), max(lons), max(lats)))
+                else:
+                    self.bboxes.extend((float('nan'),) * 4)
+
+        self.index = spatial.GridIndex(self.rows())
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def nbytes(self):
+        ''' Return size of bbox array in bytes.
+        '''
+        return self.bboxes.nbytes if numpy is not None else self.bboxes.itemsize * len(self.bboxes)
+
+    def rows(self):
+        ''' Return a list of (minlon, minlat, maxlon, maxlat) tuples.
+        '''
+        if isinstance(self.bboxes, array.array):
+            b = self.bboxes
+            return [tuple(b[i:i+4]) for i in range(0, len(b), 4)]
+
+        return [tuple(row) for row in self.bboxes.tolist()]
+
+    def select(self, southwest, northeast):
+        ''' Return a list of geometries inside a location pair bbox.
+        '''
+        candidates = self.index.query(southwest.lon, southwest.lat, northeast.lon, northeast.lat)
+
+        if isinstance(self.bboxes, array.array):
+            b = self.bboxes
+            return [self.geometries[i] for i in candidates
+                if b[i*4+2] >= southwest.lon and b[i*4] <= northeast.lon
+                and b[i*4+3] >= southwest.lat and b[i*4+1] <= northeast.lat]
+
+        candidates = numpy.array(candidates, dtype=numpy.intp)
+        inside = bboxes_inside(southwest, northeast, self.bboxes[candidates])
+        return [self.geometries[i] for i in candidates[inside]]
 
 def truncate_id(id):
     ''' Truncate SharedStreets hash to save space.
@@ -38,31 +199,261 @@ def round_coord(float):
     '''
     return round(float, 7)
 
-def iter_objects(url, DataClass):
-    ''' Generate a stream of objects from the protobuf URL.
+def _check_response(response):
+    ''' Return True for a successful response, False for a missing tile, or raise.
+
+        Upstream errors other than HTTP 404 raise requests.HTTPError, an
+        IOError, so callers can retry them instead of seeing an empty tile.
     '''
-    response = requests.get(url, timeout=UPSTREAM_SHST_REQUEST_TIMEOUT_S)
-    position = 0
-    logger.debug('Got {} bytes: {}'.format(len(response.content), repr(response.content[:32])))
+    if response.status_code == 404:
+        logger.debug('Got HTTP 404 for {}'.format(response.url))
+        return False
+
+    response.raise_for_status()
 
     if response.status_code not in range(200, 299):
         logger.debug('Got HTTP {}'.format(response.status_code))
-        return
+        return False
+
+    return True
+
+def fetch_content(url, cache=None, session=None):
+    ''' Return bytes of the protobuf URL, or None for a missing tile.
+
+        Raise requests.HTTPError for other unsuccessful responses.
+
+        cache: Optional cache.DiskCache instance. Fresh cached bodies are
+            returned without a request, stale ones are revalidated upstream.
+
+        session: Optional requests.Session to use for HTTP, such as one from
+            transport.make_session(). Default to transport.get_session().
+    '''
+    if session is None:
+        session = transport.get_session()
+
+    entry = None if cache is None else cache.get(url)
+
+    if entry is not None and cache.is_fresh(entry):
+        logger.debug('Using cached {}'.format(url))
+        body = cache.read(entry)
+
+        if body is not None:
+            return body
+
+        # Evicted by another cache user since get()
+        entry = None
+
+    headers = {} if cache is None else cache.request_headers(entry)
+    response = session.get(url, headers=headers, timeout=UPSTREAM_SHST_REQUEST_TIMEOUT_S)
+    logger.debug('Got {} bytes: {}'.format(len(response.content), repr(response.content[:32])))
+
+    if response.status_code == 304 and entry is not None:
+        logger.debug('Revalidated cached {}'.format(url))
+        cache.revalidated(entry)
+        body = cache.read(entry)
+
+        if body is not None:
+            return body
+
+        # Evicted since get(), so request the whole body again
+        response = session.get(url, timeout=UPSTREAM_SHST_REQUEST_TIMEOUT_S)
+
+    if not _check_response(response):
+        return None
+
+    if cache is not None:
+        cache.put(url, response.content, response.headers.get('ETag'),
+            response.headers.get('Last-Modified'))
 
-    while position < len(response.content):
-        message_length, new_position = _DecodeVarint32(response.content, position)
-        position = new_position
-        message = response.content[position:position+message_length]
-        position += message_length
+    return response.content
 
+def iter_chunks(url, cache=None, session=None):
+    ''' Return an iterable of byte chunks from the protobuf URL, or None if missing.
+
+        Local file:// URLs and plain paths are memory-mapped and returned
+        whole without copying, and store.SCHEME URLs are read whole from a
+        tile store. Without a cache HTTP responses are streamed in
+        stream.CHUNK_SIZE pieces instead of being held in memory,
+        otherwise see fetch_content().
+    '''
+    if store.parse_url(url) is not None:
+        data = store.read_url(url)
+        return None if data is None else [data]
+
+    path = local.url_path(url)
+
+    if path is not None:
+        buffer = local.map_file(path)
+        return None if buffer is None else [buffer]
+
+    if cache is not None:
+        content = fetch_content(url, cache, session)
+        return None if content is None else [content]
+
+    if session is None:
+        session = transport.get_session()
+
+    response = session.get(url, timeout=UPSTREAM_SHST_REQUEST_TIMEOUT_S, stream=True)
+
+    try:
+        if not _check_response(response):
+            response.close()
+            return None
+    except IOError:
+        response.close()
+        raise
+
+    def iter_response():
         try:
-            object = DataClass()
-            object.ParseFromString(message)
-        except google.protobuf.message.DecodeError:
-            # Empty tile? Shrug.
-            continue
-        else:
-            yield object
+            for chunk in response.iter_content(stream.CHUNK_SIZE):
+                yield chunk
+        finally:
+            response.close()
+
+    return iter_response()
+
+def local_path(url, cache=None, session=None):
+    ''' Return a local file path for the protobuf URL, or None.
+
+        Remote URLs have a path only with a cache.DiskCache instance, and
+        are downloaded into the cache if needed.
+    '''
+    path = local.url_path(url)
+
+    if path is None and cache is not None and fetch_content(url, cache, session) is not None:
+        entry = cache.get(url)
+        path = None if entry is None else entry.path
+
+    return path
+
+def _iter_hashed(chunks, digest):
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+def iter_objects(url, DataClass, cache=None, session=None, ids=None, digest=None, stats=None,
+                 predicate=None):
+    ''' Generate a stream of objects from the protobuf URL.
+
+        cache, session: Optional cache and requests.Session, see fetch_content().
+
+        digest: Optional hashlib object updated with every byte read, when
+            all objects are read without selecting ids.
+
+        ids: Optional set of keys to select, matching geometryId for metadata
+            and id for other objects. Local files and disk-cached bodies are
+            read through a sidecar offset index built on first use, see
+            index.get_index(). Other messages are skipped unparsed if their
+            keys don't match.
+
+        stats: Optional stats.LayerStats instance to count bytes, messages,
+            and fetch and decode time.
+
+        predicate: Optional object with match_message() and match_object()
+            methods, such as predicates.GeometryPredicate. Messages are
+            checked before parsing when predicates.WIRE_SCAN is true, and
+            objects after parsing otherwise.
+    '''
+    if stats is None:
+        stats = _stats.LayerStats()
+
+    start = time.perf_counter()
+    path = None if ids is None else local_path(url, cache, session)
+
+    if path is not None:
+        buffer = local.map_file(path)
+
+        if buffer is None:
+            stats.fetch_seconds += time.perf_counter() - start
+            return
+
+        offsets = index.get_index(path, buffer)
+        spans = sorted(offsets[id] for id in ids if id in offsets)
+        messages = (buffer[offset:offset+length] for (offset, length) in spans)
+        stats.bytes += sum(length for (offset, length) in spans)
+        stats.fetch_seconds += time.perf_counter() - start
+
+    else:
+        chunks = iter_chunks(url, cache, session)
+        stats.fetch_seconds += time.perf_counter() - start
+
+        if chunks is None:
+            return
+
+        chunks = _stats.iter_timed(chunks, stats)
+
+        if digest is not None and ids is None:
+            chunks = _iter_hashed(chunks, digest)
+
+        messages = stream.iter_frames(chunks)
+
+    def iter_messages():
+        # Indexed spans are already selected, but streamed messages need checking
+        check_keys = ids is not None and path is None
+
+        for message in messages:
+            stats.messages += 1
+
+            if check_keys and index.read_key(message) not in ids:
+                continue
+
+            yield message
+
+    yield from decode.iter_parsed(iter_messages(), DataClass, stats, predicate)
+
+def _iter_layer_chunks(url, cache, session, stats):
+    start = time.perf_counter()
+    chunks = iter_chunks(url, cache, session)
+    stats.fetch_seconds += time.perf_counter() - start
+
+    if chunks is not None:
+        yield from _stats.iter_timed(chunks, stats)
+
+def iter_shared_objects(url, DataClass, cache=None, session=None, digest=None, stats=None,
+                        predicate=None):
+    ''' Generate a stream of objects from the protobuf URL, sharing its download.
+
+        Concurrent callers for one URL read the same upstream chunks through
+        LAYER_FLIGHTS, and each decodes them as they arrive with its own
+        predicate. Bytes and fetch time are counted only in the stats of the
+        caller that started the download. See iter_objects() for arguments.
+    '''
+    if stats is None:
+        stats = _stats.LayerStats()
+
+    chunks = LAYER_FLIGHTS.share((url, 'chunks'), _iter_layer_chunks, url, cache, session, stats)
+
+    if digest is not None:
+        chunks = _iter_hashed(chunks, digest)
+
+    def iter_messages():
+        for message in stream.iter_frames(chunks):
+            stats.messages += 1
+            yield message
+
+    yield from decode.iter_parsed(iter_messages(), DataClass, stats, predicate)
+
+def get_object(layer, id, zoom, x, y, data_url_template=None, cache=None, session=None):
+    ''' Get a single SharedStreets object by id, or None if it's not found.
+
+        layer: One of "geometry", "intersection", "reference", or "metadata".
+
+        id: Object id, or geometryId for metadata.
+
+        zoom, x, y: Web mercator coordinates of any tile containing the object.
+
+        See get_tile() for other arguments. Only the requested message is
+        decoded from local files and disk-cached bodies.
+    '''
+    if data_url_template is None:
+        data_url_template = DATA_URL_TEMPLATE
+
+    url = expand_layer_urls(data_url_template, data_tile_zxy(zoom, x, y))[layer]
+
+    for object in iter_objects(url, data_classes[layer], cache, session, {id}):
+        return object
+
+    return None
 
 def is_inside(southwest, northeast, geometry):
     ''' Return True if the geometry bbox is inside a location pair bbox.
@@ -78,7 +469,473 @@ def is_inside(southwest, northeast, geometry):
 
     return True
 
-def get_tile(zoom, x, y, data_url_template=None):
+def geometry_bboxes(geometries):
+    ''' Return an array of (minlon, minlat, maxlon, maxlat) rows for geometries.
+
+        geometries: Sequence of SharedStreets geometries. All coordinates are
+            copied into one flat NumPy array and each envelope is computed in
+            a single vectorized pass. Geometries without coordinates get NaN.
+    '''
+    counts = numpy.fromiter((len(geom.lonlats) for geom in geometries), numpy.intp, len(geometries))
+    coords = numpy.fromiter(itertools.chain.from_iterable(geom.lonlats for geom in geometries),
+        numpy.float64, int(counts.sum()))
+
+    # Offsets of each geometry's first point among lons and lats
+    points = counts // 2
+    starts = numpy.cumsum(points) - points
+    lons, lats = coords[0::2], coords[1::2]
+
+    bboxes = numpy.full((len(geometries), 4), numpy.nan)
+    nonempty = points > 0
+
+    if nonempty.any():
+        nonempty_starts = starts[nonempty]
+        bboxes[nonempty, 0] = numpy.minimum.reduceat(lons, nonempty_starts)
+        bboxes[nonempty, 1] = numpy.minimum.reduceat(lats, nonempty_starts)
+        bboxes[nonempty, 2] = numpy.maximum.reduceat(lons, nonempty_starts)
+        bboxes[nonempty, 3] = numpy.maximum.reduceat(lats, nonempty_starts)
+
+    return bboxes
+
+def bboxes_inside(southwest, northeast, bboxes):
+    ''' Return a boolean array of geometry bboxes inside a location pair bbox.
+
+        bboxes: Array of rows from geometry_bboxes().
+    '''
+    return ((bboxes[:,2] >= southwest.lon) & (bboxes[:,0] <= northeast.lon)
+        & (bboxes[:,3] >= southwest.lat) & (bboxes[:,1] <= northeast.lat))
+
+def select_inside(southwest, northeast, geometries):
+    ''' Return a list of geometries inside a location pair bbox.
+
+        Uses vectorized geometry_bboxes() when NumPy is available, and
+        is_inside() for each geometry otherwise.
+    '''
+    geometries = list(geometries)
+
+    if numpy is None or not geometries:
+        return [geom for geom in geometries if is_inside(southwest, northeast, geom)]
+
+    inside = bboxes_inside(southwest, northeast, geometry_bboxes(geometries))
+    return [geom for (geom, keep) in zip(geometries, inside) if keep]
+
+def select_objects(southwest, northeast, geometries, intersections, references, metadata,
+                   stats=None, layers=LAYERS):
+    ''' Get a Tile instance with geometries inside a location pair bbox.
+
+        geometries: Iterable of SharedStreets geometries to filter.
+
+        stats: Optional stats.Stats instance to time filtering and joins.
+
+        See attach_objects() for other arguments.
+    '''
+    if stats is None:
+        stats = _stats.Stats()
+
+    geometries = list(geometries)
+
+    start = time.perf_counter()
+    geometries = select_inside(southwest, northeast, geometries)
+    stats.filter_seconds += time.perf_counter() - start
+
+    return _timed_attach(stats, geometries, intersections, references, metadata, layers)
+
+def _timed_attach(stats, *args):
+    ''' Return attach_objects(*args), adding its time without upstream reads to stats.
+    '''
+    start, io_seconds = time.perf_counter(), stats.io_seconds()
+    T = attach_objects(*args)
+    stats.join_seconds += time.perf_counter() - start - (stats.io_seconds() - io_seconds)
+
+    return T
+
+def _finish_stats(stats, T, start):
+    ''' Record kept objects and total time for a complete tile, and publish stats.
+    '''
+    for layer in LAYERS:
+        if T.loaded(layer):
+            stats.layers[layer].kept = len(getattr(T, LAYER_ATTRIBUTES[layer]))
+
+    stats.seconds = time.perf_counter() - start
+    _stats.publish(stats)
+
+def select_layers(layers):
+    ''' Return a tuple of layer names in LAYERS order, always including geometry.
+
+        layers: Collection of layer names, or None for all layers.
+    '''
+    if layers is None:
+        return LAYERS
+
+    unknown = set(layers) - set(LAYERS)
+
+    if unknown:
+        raise ValueError('Unknown layers: {}'.format(', '.join(sorted(unknown))))
+
+    return tuple(layer for layer in LAYERS if layer in layers or layer == 'geometry')
+
+def attach_objects(geometries, intersections, references, metadata, layers=LAYERS):
+    ''' Get a Tile instance with geometries and the objects attached to them.
+
+        geometries, intersections, references, metadata: Iterables of
+            SharedStreets objects, consumed one after another in this order.
+
+            Intersections, references, and metadata may instead be functions
+            accepting a set of wanted keys and returning an iterable. They are
+            called with ids of intersections and references named by
+            geometries, and with ids of geometries, respectively.
+
+        layers: Names of layers to attach now, see select_layers(). Others
+            are attached on first access to the returned tile's attributes.
+    '''
+    geometries = {geom.id: geom for geom in geometries}
+
+    logger.debug('{} geometries'.format(len(geometries)))
+
+    def attach_intersections():
+        # Get intersections attached to one of the filtered geometries
+        intersection_ids = {id for id in itertools.chain(*[(geom.fromIntersectionId,
+            geom.toIntersectionId) for geom in geometries.values()])}
+        objects = intersections(intersection_ids) if callable(intersections) else intersections
+        attached = {inter.id: inter for inter in objects if inter.id in intersection_ids}
+        logger.debug('{} intersections'.format(len(attached)))
+        return attached
+
+    def attach_references():
+        # Get references attached to one of the filtered geometries
+        objects = references({id for id in itertools.chain(*[(geom.forwardReferenceId,
+            geom.backReferenceId) for geom in geometries.values()]) if id}) \
+            if callable(references) else references
+        attached = {ref.id: ref for ref in objects if ref.geometryId in geometries}
+        logger.debug('{} references'.format(len(attached)))
+        return attached
+
+    def attach_metadata():
+        # Get metadata attached to one of the filtered geometries
+        objects = metadata(set(geometries)) if callable(metadata) else metadata
+        attached = {md.geometryId: md for md in objects if md.geometryId in geometries}
+        logger.debug('{} metadata'.format(len(attached)))
+        return attached
+
+    return Tile(geometries, *[attach() if layer in layers else attach for (layer, attach)
+        in zip(LAYERS[1:], (attach_intersections, attach_references, attach_metadata))])
+
+def data_tile_zxy(zoom, x, y):
+    ''' Get a dictionary with z, x, and y of the DATA_ZOOM tile containing a tile.
+    '''
+    data_coord = ModestMaps.Core.Coordinate(y, x, zoom).zoomTo(DATA_ZOOM).container()
+    return dict(z=int(data_coord.zoom), x=int(data_coord.column), y=int(data_coord.row))
+
+def expand_layer_urls(data_url_template, data_zxy):
+    ''' Get a dictionary of layer names to upstream protobuf URLs.
+    '''
+    if isinstance(data_url_template, store.TileStore):
+        data_url_template = store.store_template(data_url_template.path)
+    elif store.is_store_path(local.url_path(data_url_template)):
+        data_url_template = store.store_template(local.url_path(data_url_template))
+
+    data_url_template = local.resolve_template(data_url_template)
+    return {layer: uritemplate.expand(data_url_template, layer=layer, **data_zxy)
+        for layer in LAYERS}
+
+def read_layer(url, cache=None, session=None, stats=None):
+    ''' Return whole bytes of the protobuf URL or None if missing, and a SHA-1 digest.
+    '''
+    digest = hashlib.sha1()
+
+    if stats is None:
+        stats = _stats.LayerStats()
+
+    start = time.perf_counter()
+    chunks = iter_chunks(url, cache, session)
+    stats.fetch_seconds += time.perf_counter() - start
+
+    if chunks is None:
+        return None, digest.hexdigest()
+
+    chunks = list(_stats.iter_timed(chunks, stats))
+    buffer = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+    digest.update(buffer)
+
+    return buffer, digest.hexdigest()
+
+def load_layer(url, DataClass, cache=None, session=None, stats=None, predicate=None):
+    ''' Return a list of objects from the protobuf URL and a SHA-1 digest of its bytes.
+
+        With a pool of decoding processes from decode.start(), the layer is
+        read whole and decoded with decode.decode_buffer() instead, so large
+        layers come back as columnar rows.
+    '''
+    if decode.get_executor() is None:
+        digest = hashlib.sha1()
+        objects = list(iter_objects(url, DataClass, cache, session, digest=digest, stats=stats,
+            predicate=predicate))
+        return objects, digest.hexdigest()
+
+    buffer, digest = read_layer(url, cache, session, stats)
+
+    if buffer is None:
+        return [], digest
+
+    return decode.decode_buffer(buffer, DataClass, stats, predicate), digest
+
+def load_layers(urls, cache=None, max_workers=None, session=None, digests=None, stats=None,
+                predicates=None):
+    ''' Get a dictionary of layer names to iterables of SharedStreets objects.
+
+        urls: Dictionary of layer names to upstream protobuf URLs.
+
+        cache: Optional cache.DiskCache instance for upstream protobuf tiles.
+
+        max_workers: Number of layers to download at once, default to
+            UPSTREAM_SHST_CONCURRENCY. Layers are downloaded and decoded in
+            a thread pool and returned as lists, and concurrent callers for
+            the same URL share one download through LAYER_FLIGHTS. With a
+            value of 1 they are returned instead as lazy generators to be
+            consumed in turn.
+
+        session: Optional requests.Session shared by all downloads.
+
+        digests: Optional dictionary of layer names to hashlib objects,
+            updated with the SHA-1 hex digest of each layer's upstream bytes
+            once it has been read.
+
+        stats: Optional stats.Stats instance to count upstream reads. Layers
+            shared with a concurrent caller are counted only by that caller.
+
+        predicates: Optional dictionary of layer names to predicates for
+            iter_objects(). Concurrent callers share the upstream stream of
+            filtered layers, and each decodes only its own matching objects
+            while it downloads, see iter_shared_objects().
+    '''
+    if max_workers is None:
+        max_workers = UPSTREAM_SHST_CONCURRENCY
+
+    if digests is None:
+        digests = {}
+
+    if predicates is None:
+        predicates = {}
+
+    # Create each layer's counters here, not in worker threads
+    layer_stats = {layer: None if stats is None else stats.layers[layer] for layer in urls}
+
+    if max_workers <= 1:
+        def iter_layer(layer, url):
+            digest = hashlib.sha1()
+            yield from iter_objects(url, data_classes[layer], cache, session,
+                digest=digest, stats=layer_stats[layer], predicate=predicates.get(layer))
+            digests[layer].update(digest.hexdigest().encode('ascii'))
+
+        return {layer: iter_layer(layer, url) if layer in digests
+            else iter_objects(url, data_classes[layer], cache, session, stats=layer_stats[layer],
+                predicate=predicates.get(layer))
+            for (layer, url) in urls.items()}
+
+    def load_shared_layer(layer):
+        if layer in predicates:
+            digest = hashlib.sha1()
+            objects = list(iter_shared_objects(urls[layer], data_classes[layer], cache, session,
+                digest, layer_stats[layer], predicates[layer]))
+            digest = digest.hexdigest()
+        else:
+            objects, digest = LAYER_FLIGHTS.do(urls[layer], load_layer, urls[layer],
+                data_classes[layer], cache, session, layer_stats[layer])
+
+        if layer in digests:
+            digests[layer].update(digest.encode('ascii'))
+
+        return objects
+
+    with concurrent.futures.ThreadPoolExecutor(min(max_workers, len(urls))) as executor:
+        futures = {layer: executor.submit(load_shared_layer, layer) for layer in urls}
+        return {layer: future.result() for (layer, future) in futures.items()}
+
+def get_data_tile(data_zxy, data_url_template, cache=None, max_workers=None, session=None,
+                  stats=None, layers=None):
+    ''' Get a complete Tile instance for a single upstream DATA_ZOOM tile.
+
+        data_zxy: Dictionary with z, x, and y of upstream tile.
+
+        data_url_template: RFC 6570 URI template for upstream protobuf tiles.
+
+        cache: Optional cache.DiskCache instance for upstream protobuf tiles.
+
+        max_workers: Number of layers to download at once, see load_layers().
+
+        session: Optional requests.Session for upstream protobuf tiles.
+
+        stats: Optional stats.Stats instance to count upstream reads.
+
+        layers: Optional names of layers to load now, see select_layers().
+            Others are loaded on first access to the returned tile.
+
+        The returned tile's version is a SHA-1 digest of its upstream bodies,
+        or None if some layers were not loaded up front.
+    '''
+    layers = select_layers(layers)
+    urls = expand_layer_urls(data_url_template, data_zxy)
+    digests = {layer: hashlib.sha1() for layer in layers}
+    loaded = load_layers({layer: urls[layer] for layer in layers}, cache,
+        max_workers, session, digests, stats)
+
+    def keyed(layer, objects):
+        if layer == 'metadata':
+            return {md.geometryId: md for md in objects}
+        return {object.id: object for object in objects}
+
+    def load_later(layer):
+        def load():
+            objects, _ = LAYER_FLIGHTS.do(urls[layer], load_layer, urls[layer],
+                data_classes[layer], cache, session)
+            return keyed(layer, objects)
+        return load
+
+    values = [keyed(layer, loaded[layer]) if layer in loaded else load_later(layer) for layer in LAYERS]
+
+    if len(layers) == len(LAYERS):
+        version = hashlib.sha1(' '.join(digests[layer].hexdigest() for layer in LAYERS).encode('ascii')).hexdigest()
+    else:
+        version = None
+
+    return Tile(*values, envelopes=Envelopes(values[0].values()), version=version)
+
+def get_cached_data_tile(data_zxy, data_url_template, tile_cache, cache=None,
+                         max_workers=None, session=None, stats=None, layers=None):
+    ''' Get a complete Tile instance for a single upstream DATA_ZOOM tile.
+
+        Decoded tiles are kept in tile_cache, a cache.MemoryCache instance,
+        and loaded only once at a time. A cached tile loaded with fewer layers
+        loads the rest on first access. See get_data_tile() for other arguments.
+
+        Upstream errors raise instead of loading an empty layer, so tiles
+        with failed layers are never cached, and a lazily-loaded layer that
+        fails is tried again on its next access.
+    '''
+    key = (data_url_template, data_zxy['z'], data_zxy['x'], data_zxy['y'])
+
+    def load():
+        data_tile = get_data_tile(data_zxy, data_url_template, cache, max_workers, session,
+            stats, layers)
+
+        # Layers loaded later grow the tile, so count them against the cache
+        data_tile.on_load = lambda layer: tile_cache.resize(key, data_tile.nbytes())
+
+        return data_tile, data_tile.nbytes()
+
+    # Concurrent callers for one data tile share a single upstream fetch
+    return tile_cache.get_or_load(key, load)
+
+def select_data_tiles(data_tiles, southwest, northeast, stats=None, layers=LAYERS, predicate=None):
+    ''' Get a Tile instance with geometries inside a location pair bbox.
+
+        data_tiles: List of complete Tile instances from get_data_tile().
+
+        stats: Optional stats.Stats instance to time filtering and joins.
+
+        layers: Names of layers to attach now, see attach_objects().
+
+        predicate: Optional predicates.GeometryPredicate for selected geometries.
+
+        Geometries are selected by spatial index and attached objects are
+        looked up by id, so only objects near the bbox are visited.
+    '''
+    def lookup(layer):
+        def select(ids):
+            # Layers of data tiles are read here, loading them if needed
+            objects = collections.ChainMap(*[getattr(T, LAYER_ATTRIBUTES[layer]) for T in data_tiles])
+            return [objects[id] for id in sorted(ids) if id in objects]
+        return select
+
+    if stats is None:
+        stats = _stats.Stats()
+
+    start = time.perf_counter()
+    geometries = list(itertools.chain(*[T.envelopes.select(southwest, northeast) for T in data_tiles]))
+
+    if predicate is not None:
+        geometries = [geom for geom in geometries if predicate.match_object(geom)]
+    stats.filter_seconds += time.perf_counter() - start
+
+    T = _timed_attach(stats, geometries, lookup('intersection'), lookup('reference'),
+        lookup('metadata'), layers)
+
+    versions = [T.version for T in data_tiles]
+
+    if None not in versions:
+        T.version = versions[0] if len(versions) == 1 \
+            else hashlib.sha1(' '.join(versions).encode('ascii')).hexdigest()
+
+    if len(data_tiles) == 1 and len(T.geometries) == len(data_tiles[0].envelopes):
+        # Every geometry was selected, so the index still applies
+        T.envelopes = data_tiles[0].envelopes
+
+    return T
+
+def data_tile_ranges(minlon, minlat, maxlon, maxlat):
+    ''' Return ranges of DATA_ZOOM tile columns and rows covering a bbox.
+
+        Latitudes are clamped to the extent of Web Mercator tiles.
+    '''
+    minlat, maxlat = [max(-mvt.MAX_LATITUDE, min(mvt.MAX_LATITUDE, lat)) for lat in (minlat, maxlat)]
+    ul = OSM.locationCoordinate(ModestMaps.Geo.Location(maxlat, minlon)).zoomTo(DATA_ZOOM).container()
+    lr = OSM.locationCoordinate(ModestMaps.Geo.Location(minlat, maxlon)).zoomTo(DATA_ZOOM).container()
+    last = 2**DATA_ZOOM - 1
+
+    return (range(max(0, int(ul.column)), min(last, int(lr.column)) + 1),
+        range(max(0, int(ul.row)), min(last, int(lr.row)) + 1))
+
+def query_bbox(minlon, minlat, maxlon, maxlat, data_url_template=None, cache=None,
+               tile_cache=DATA_TILE_CACHE, max_workers=None, session=None, stats=None,
+               layers=None, road_classes=None, geometry_ids=None):
+    ''' Get a single Tile instance for an arbitrary area.
+
+        minlon, minlat, maxlon, maxlat: Bounding box in WGS84 degrees.
+
+        tile_cache: Optional cache.MemoryCache instance for decoded upstream
+            tiles, default to shared DATA_TILE_CACHE. Each cached data tile
+            keeps its spatial index for later queries.
+
+        See get_tile() for other arguments.
+    '''
+    if data_url_template is None:
+        data_url_template = DATA_URL_TEMPLATE
+
+    if stats is None:
+        stats = _stats.Stats()
+
+    layers = select_layers(layers)
+    start = time.perf_counter()
+    southwest = ModestMaps.Geo.Location(minlat, minlon)
+    northeast = ModestMaps.Geo.Location(maxlat, maxlon)
+    data_tiles = []
+
+    for (x, y) in itertools.product(*data_tile_ranges(minlon, minlat, maxlon, maxlat)):
+        data_zxy = dict(z=DATA_ZOOM, x=x, y=y)
+        if tile_cache is None:
+            data_tiles.append(get_data_tile(data_zxy, data_url_template, cache, max_workers,
+                session, stats, layers))
+        else:
+            data_tiles.append(get_cached_data_tile(data_zxy, data_url_template, tile_cache,
+                cache, max_workers, session, stats, layers))
+
+    T = select_data_tiles(data_tiles, southwest, northeast, stats, layers,
+        _object_predicate(road_classes, geometry_ids))
+    _finish_stats(stats, T, start)
+
+    return T
+
+def _object_predicate(road_classes, geometry_ids):
+    ''' Return a GeometryPredicate for filters other than bbox, or None without any.
+    '''
+    if road_classes is None and geometry_ids is None:
+        return None
+
+    return predicates.GeometryPredicate(road_classes=road_classes, ids=geometry_ids)
+
+def get_tile(zoom, x, y, data_url_template=None, cache=None, tile_cache=None,
+             max_workers=None, session=None, stats=None, layers=None, road_classes=None,
+             geometry_ids=None):
     ''' Get a single Tile instance.
 
         zoom, x, y: Web mercator tile coordinates using OpenStreetMap convention.
@@ -89,10 +946,55 @@ def get_tile(zoom, x, y, data_url_template=None):
             with z, x, y, and layer expressions. Default to DATA_URL_TEMPLATE.
 
             https://tools.ietf.org/html/rfc6570#section-2.2)
+
+            Templates with file:// URLs or plain paths read memory-mapped
+            local files, and a directory of files named like
+            local.FILENAME_TEMPLATE may be given in place of a template.
+            A store.TileStore instance or path to its .mbtiles file reads
+            upstream layers from SQLite instead.
+
+        cache: Optional cache.DiskCache instance for upstream protobuf tiles,
+            keyed on expanded data_url_template URLs.
+
+        tile_cache: Optional cache.MemoryCache instance for decoded upstream
+            tiles, such as DATA_TILE_CACHE. Tiles at zoom levels above
+            DATA_ZOOM are then filtered from memory when possible.
+
+        max_workers: Number of upstream layers to download at once, default
+            to UPSTREAM_SHST_CONCURRENCY. Use 1 to download one at a time.
+
+        session: Optional requests.Session for upstream protobuf tiles, such
+            as one from transport.make_session(). Default to a shared session
+            with connection pooling and retries from transport.get_session().
+
+        stats: Optional stats.Stats instance, filled in with upstream bytes,
+            per-layer fetch and decode times, message counts, and filter and
+            join times. Completed stats are also passed to stats.add_hook()
+            functions.
+
+        layers: Optional names of layers to load now, from LAYERS and
+            always including geometry. Attributes of other layers are
+            fetched and decoded on first access, so callers needing only
+            geometries and intersections skip references and metadata.
+
+        road_classes: Optional collection of RoadClass names or numbers,
+            such as "Residential" or 5, to keep only matching geometries.
+
+        geometry_ids: Optional collection of geometry ids to keep.
+
+        Upstream geometries outside the tile or not matching filters are
+        skipped before parsing where possible, see predicates.WIRE_SCAN.
     '''
     if data_url_template is None:
         data_url_template = DATA_URL_TEMPLATE
 
+    if stats is None:
+        stats = _stats.Stats()
+
+    layers = select_layers(layers)
+
+    start = time.perf_counter()
+
     # Define lat/lon for filtered area
     tile_coord = ModestMaps.Core.Coordinate(y, x, zoom)
     data_coord = tile_coord.zoomTo(DATA_ZOOM).container()
@@ -102,55 +1004,86 @@ def get_tile(zoom, x, y, data_url_template=None):
 
     logger.debug((tile_coord, data_coord, tile_sw, tile_ne))
 
-    # Filter geometries within the selected tile
-    geom_data_url = uritemplate.expand(data_url_template, layer='geometry', **data_zxy)
-    geometries = {geom.id: geom for geom in iter_objects(geom_data_url,
-        data_classes['geometry']) if is_inside(tile_sw, tile_ne, geom)}
+    if tile_cache is not None:
+        data_tile = get_cached_data_tile(data_zxy, data_url_template, tile_cache,
+            cache, max_workers, session, stats, layers)
 
-    logger.debug('{} geometries'.format(len(geometries)))
+        T = select_data_tiles([data_tile], tile_sw, tile_ne, stats, layers,
+            _object_predicate(road_classes, geometry_ids))
+        _finish_stats(stats, T, start)
+
+        return T
+
+    urls = expand_layer_urls(data_url_template, data_zxy)
+    predicate = predicates.GeometryPredicate(tile_sw, tile_ne, road_classes, geometry_ids)
 
-    # Get intersections attached to one of the filtered geometries
-    inter_data_url = uritemplate.expand(data_url_template, layer='intersection', **data_zxy)
+    if all(local.url_path(url) is not None or store.parse_url(url) is not None
+           for url in urls.values()):
+        # Local files and stores need no download, so decode only objects attached to geometries
+        def select_layer(layer):
+            return lambda ids: iter_objects(urls[layer], data_classes[layer], ids=ids,
+                stats=stats.layers[layer])
 
-    intersection_ids = {id for id in itertools.chain(*[(geom.fromIntersectionId,
-        geom.toIntersectionId) for geom in geometries.values()])}
-    intersections = {inter.id: inter for inter in iter_objects(inter_data_url,
-        data_classes['intersection']) if inter.id in intersection_ids}
+        T = select_objects(tile_sw, tile_ne,
+            iter_objects(urls['geometry'], data_classes['geometry'], ids=geometry_ids,
+                stats=stats.layers['geometry'], predicate=predicate),
+            select_layer('intersection'), select_layer('reference'), select_layer('metadata'),
+            stats, layers)
 
-    logger.debug('{} intersections'.format(len(intersections)))
+    else:
+        # Download selected layers before filtering objects attached to geometries
+        loaded = load_layers({layer: urls[layer] for layer in layers}, cache, max_workers,
+            session, stats=stats, predicates=dict(geometry=predicate))
 
-    # Get references attached to one of the filtered geometries
-    ref_data_url = uritemplate.expand(data_url_template, layer='reference', **data_zxy)
-    references = {ref.id: ref for ref in iter_objects(ref_data_url,
-        data_classes['reference']) if ref.geometryId in geometries}
+        def load_later(layer):
+            if layer in loaded:
+                return loaded[layer]
+            return lambda ids: iter_objects(urls[layer], data_classes[layer], cache, session, ids=ids)
 
-    logger.debug('{} references'.format(len(references)))
+        T = select_objects(tile_sw, tile_ne, loaded['geometry'], load_later('intersection'),
+            load_later('reference'), load_later('metadata'), stats, layers)
+
+    _finish_stats(stats, T, start)
+
+    return T
+
+def geometry_properties(geometry, metadata, id_length):
+    ''' Get a dictionary of feature properties for a geometry.
+
+        id_length: Desired length of SharedStreets ID strings.
+    '''
+    return {
+        'id': geometry.id[:id_length],
+        'forwardReferenceId': geometry.forwardReferenceId[:id_length],
+        'startIntersectionId': geometry.fromIntersectionId[:id_length],
+        'backReferenceId': geometry.backReferenceId[:id_length],
+        'endIntersectionId': geometry.toIntersectionId[:id_length],
+        'roadClass': geometry.roadClass,
+        'osmName': str(metadata.osmMetadata.name),
+        }
 
-    # Get metadata attached to one of the filtered geometries
-    md_data_url = uritemplate.expand(data_url_template, layer='metadata', **data_zxy)
-    metadata = {md.geometryId: md for md in iter_objects(md_data_url,
-        data_classes['metadata']) if md.geometryId in geometries}
+def intersection_properties(intersection, id_length):
+    ''' Get a dictionary of feature properties for an intersection.
 
-    logger.debug('{} metadata'.format(len(metadata)))
+        id_length: Desired length of SharedStreets ID strings.
+    '''
+    return {
+        'id': intersection.id[:id_length],
 
-    return Tile(geometries, intersections, references, metadata)
+        'inboundReferenceIds': [id[:id_length] for id in intersection.inboundReferenceIds],
+        'outboundReferenceIds': [id[:id_length] for id in intersection.outboundReferenceIds],
+        }
 
 def geometry_feature(geometry, metadata, id_length):
     '''
     '''
+    properties = geometry_properties(geometry, metadata, id_length)
+
     return {
         'type': 'Feature',
         'role': 'SharedStreets:Geometry',
-        'id': geometry.id[:id_length],
-        'properties': {
-            'id': geometry.id[:id_length],
-            'forwardReferenceId': geometry.forwardReferenceId[:id_length],
-            'startIntersectionId': geometry.fromIntersectionId[:id_length],
-            'backReferenceId': geometry.backReferenceId[:id_length],
-            'endIntersectionId': geometry.toIntersectionId[:id_length],
-            'roadClass': geometry.roadClass,
-            'osmName': str(metadata.osmMetadata.name),
-            },
+        'id': properties['id'],
+        'properties': properties,
         'geometry': {
             'type': 'LineString',
             'coordinates': [[x, y] for (x, y) in zip(
@@ -164,16 +1097,13 @@ def geometry_feature(geometry, metadata, id_length):
 def intersection_feature(intersection, id_length):
     '''
     '''
+    properties = intersection_properties(intersection, id_length)
+
     return {
         'type': 'Feature',
         'role': 'SharedStreets:Intersection',
-        'id': intersection.id[:id_length],
-        'properties': {
-            'id': intersection.id[:id_length],
-
-            'inboundReferenceIds': [id[:id_length] for id in intersection.inboundReferenceIds],
-            'outboundReferenceIds': [id[:id_length] for id in intersection.outboundReferenceIds],
-            },
+        'id': properties['id'],
+        'properties': properties,
         'geometry': {
             'type': 'Point',
             'coordinates': [round_coord(intersection.lon), round_coord(intersection.lat)]
@@ -236,12 +1166,185 @@ def make_geojson(tile, id_length=32):
 
     return geojson
 
+def format_coord(float):
+    ''' Format a latitude or longitude to appropriate length for JSON.
+
+        Same value as round_coord(), without a round trip through float repr.
+    '''
+    text = '%.7f' % float
+
+    if '.' in text:
+        text = text.rstrip('0')
+        if text.endswith('.'):
+            text += '0'
+
+    return text
+
+def _geometry_json(geometry, metadata, id_length):
+    ''' Return GeoJSON text for a geometry feature, see geometry_feature().
+    '''
+    properties, lonlats = geometry_properties(geometry, metadata, id_length), geometry.lonlats
+    coordinates = ', '.join('[{}, {}]'.format(format_coord(lonlats[i]), format_coord(lonlats[i+1]))
+        for i in range(0, len(lonlats) - 1, 2))
+
+    return ('{{"type": "Feature", "role": "SharedStreets:Geometry", "id": {}, "properties": {}, '
+        '"geometry": {{"type": "LineString", "coordinates": [{}]}}}}').format(
+        json.dumps(properties['id']), json.dumps(properties), coordinates)
+
+def _intersection_json(intersection, id_length):
+    ''' Return GeoJSON text for an intersection feature, see intersection_feature().
+    '''
+    properties = intersection_properties(intersection, id_length)
+
+    return ('{{"type": "Feature", "role": "SharedStreets:Intersection", "id": {}, "properties": {}, '
+        '"geometry": {{"type": "Point", "coordinates": [{}, {}]}}}}').format(
+        json.dumps(properties['id']), json.dumps(properties), format_coord(intersection.lon),
+        format_coord(intersection.lat))
+
+def iter_geojson(tile, id_length=32, chunk_size=stream.CHUNK_SIZE):
+    ''' Generate chunks of UTF-8 GeoJSON bytes for a geographic tile.
+
+        Produces the same FeatureCollection as make_geojson() one feature at
+        a time, so the whole document is never held in memory.
+
+        chunk_size: Approximate size of yielded chunks in bytes.
+    '''
+    def iter_texts():
+        yield '{"type": "FeatureCollection", "features": ['
+
+        features = itertools.chain(
+            (_geometry_json(geometry, tile.metadata[geometry.id], id_length)
+                for geometry in tile.geometries.values()),
+            (_intersection_json(intersection, id_length)
+                for intersection in tile.intersections.values()),
+            )
+
+        for (i, text) in enumerate(features):
+            yield text if i == 0 else ', ' + text
+
+        yield '], "references": ['
+
+        for (i, reference) in enumerate(tile.references.values()):
+            text = json.dumps(reference_feature(reference, id_length))
+            yield text if i == 0 else ', ' + text
+
+        yield ']}'
+
+    buffer, size = [], 0
+
+    for text in iter_texts():
+        data = text.encode('utf8')
+        buffer.append(data)
+        size += len(data)
+
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+
+    yield b''.join(buffer)
+
+def write_geojson(tile, file, id_length=32):
+    ''' Write GeoJSON for a geographic tile incrementally to a binary file.
+    '''
+    for chunk in iter_geojson(tile, id_length):
+        file.write(chunk)
+
+
+def make_mvt(tile, zoom, x, y, id_length=32, extent=mvt.DEFAULT_EXTENT, buffer=mvt.DEFAULT_BUFFER):
+    ''' Get Mapbox Vector Tile bytes for a geographic tile.
+
+        tile: Tile instance with lists of SharedStreets entities.
+
+        zoom, x, y: Coordinate of the tile, used to project lonlats.
+
+        id_length: Desired length of SharedStreets ID strings, see make_geojson().
+
+        extent, buffer: Number of integer units across the tile, and around
+            its edges where geometries are kept when clipping.
+
+        Geometries and intersections are written to layers "geometry" and
+        "intersection", with the same properties as GeoJSON features. Lists
+        of ids are written as JSON strings, because MVT has no list values.
+    '''
+    projection = mvt.project(zoom, x, y, extent)
+    xmin, ymin, xmax, ymax = -buffer, -buffer, extent + buffer, extent + buffer
+    geometry_layer = mvt.Layer('geometry', extent)
+    intersection_layer = mvt.Layer('intersection', extent)
+
+    for geometry in tile.geometries.values():
+        lonlats = geometry.lonlats
+        points = [projection(lonlats[i], lonlats[i+1]) for i in range(0, len(lonlats) - 1, 2)]
+        parts = [mvt.quantize(part) for part in mvt.clip_line(points, xmin, ymin, xmax, ymax)]
+        parts = [part for part in parts if len(part) > 1]
+
+        if parts:
+            properties = geometry_properties(geometry, tile.metadata[geometry.id], id_length)
+            geometry_layer.add_feature(mvt.LINESTRING, parts, properties)
+
+    for intersection in tile.intersections.values():
+        px, py = projection(intersection.lon, intersection.lat)
+
+        if xmin <= px <= xmax and ymin <= py <= ymax:
+            properties = intersection_properties(intersection, id_length)
+            for key in ('inboundReferenceIds', 'outboundReferenceIds'):
+                properties[key] = json.dumps(properties[key])
+            intersection_layer.add_feature(mvt.POINT, [mvt.quantize([(px, py)])], properties)
+
+    return mvt.encode_tile([geometry_layer, intersection_layer])
+
 parser = argparse.ArgumentParser(description='Download a tile of SharedStreets data')
 parser.add_argument('zoom', type=int, help='Tile zoom')
 parser.add_argument('x', type=int, help='Tile X coordinate')
 parser.add_argument('y', type=int, help='Tile Y coordinate')
+parser.add_argument('--road-class', dest='road_classes', action='append',
+    help='Keep only geometries of a road class such as Residential, may be repeated.')
+parser.add_argument('--geometry-id', dest='geometry_ids', action='append',
+    help='Keep only a geometry id, may be repeated.')
+
+def add_cache_arguments(parser):
+    ''' Add disk cache options to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--cache-dir', help='Directory for cached upstream protobuf tiles')
+    parser.add_argument('--cache-size', type=int, default=_cache.DEFAULT_DISK_CACHE_BYTES // 1024**2,
+        help='Upper size limit for cached upstream protobuf tiles in megabytes. Default %(default)s.')
+
+def cache_from_arguments(args):
+    ''' Return a cache.DiskCache instance for parsed arguments, or None.
+    '''
+    if args.cache_dir is None:
+        return None
+
+    return _cache.DiskCache(args.cache_dir, args.cache_size * 1024**2)
+
+def add_session_arguments(parser):
+    ''' Add upstream connection options to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--pool-size', type=int, default=transport.DEFAULT_POOL_SIZE,
+        help='Kept-alive connections per upstream host. Default %(default)s.')
+    parser.add_argument('--retries', type=int, default=transport.DEFAULT_RETRIES,
+        help='Retries for failed upstream requests. Default %(default)s.')
+
+def session_from_arguments(args):
+    ''' Return a requests.Session instance for parsed arguments.
+    '''
+    return transport.make_session(pool_size=args.pool_size, retries=args.retries)
+
+def add_data_arguments(parser):
+    ''' Add upstream data location option to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--data-url-template', default=DATA_URL_TEMPLATE,
+        help='URI template, local directory, or .mbtiles tile store for upstream protobuf tiles. Default {}.'.format(DATA_URL_TEMPLATE))
+
+add_data_arguments(parser)
+add_cache_arguments(parser)
+add_session_arguments(parser)
+decode.add_decode_arguments(parser)
 
 def main():
     args = parser.parse_args()
-    geojson = make_geojson(get_tile(args.zoom, args.x, args.y), id_length=32)
-    print(json.dumps(geojson, indent=2))
+    cache, session = cache_from_arguments(args), session_from_arguments(args)
+    decode.decode_from_arguments(args)
+    T = get_tile(args.zoom, args.x, args.y, args.data_url_template, cache=cache, session=session,
+        road_classes=args.road_classes, geometry_ids=args.geometry_ids)
+    write_geojson(T, sys.stdout.buffer, id_length=32)
+    sys.stdout.buffer.write(b'\n')
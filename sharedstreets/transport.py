@@ -0,0 +1,56 @@
+import threading, logging
+import requests, requests.adapters, urllib3.util.retry
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of kept-alive connections per upstream host
+DEFAULT_POOL_SIZE = 16
+
+# Number of retries for connection errors, timeouts, and RETRY_STATUSES
+DEFAULT_RETRIES = 3
+
+# Retries wait {backoff factor} * 2 ** ({retry number} - 1) seconds
+DEFAULT_BACKOFF_FACTOR = .5
+
+# Upstream HTTP statuses worth retrying
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_default_session, _default_session_lock = None, threading.Lock()
+
+def make_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR):
+    ''' Get a new requests.Session for upstream protobuf tiles.
+
+        pool_size: Number of kept-alive connections per upstream host, which
+            should be at least the number of threads sharing the session.
+
+        retries: Number of times to retry connection errors, timeouts, and
+            HTTP responses with status codes in RETRY_STATUSES.
+
+        backoff_factor: Exponential backoff between retries, in seconds.
+    '''
+    retry = urllib3.util.retry.Retry(total=retries, connect=retries, read=retries,
+        status=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+        raise_on_status=False)
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+        pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+def get_session():
+    ''' Get a shared default requests.Session, creating it on first use.
+    '''
+    global _default_session
+
+    with _default_session_lock:
+        if _default_session is None:
+            logger.debug('Creating default upstream session')
+            _default_session = make_session()
+
+    return _default_session
@@ -1,19 +1,287 @@
-import flask, flask_cors, argparse
-from . import tile
+import flask, flask_cors, argparse, hashlib, gzip, zlib, math
+from . import tile, store, metrics, stats as _stats
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Seconds that browsers and proxies may reuse a tile response
+CACHE_MAX_AGE_S = 3600
+
+# Change when response formats change, to invalidate client caches
+RENDER_VERSION = '1'
+
+# Smallest buffered response worth compressing, in bytes
+MIN_COMPRESS_BYTES = 512
+
+# Most upstream data tiles read for one bbox request, each read in turn
+MAX_BBOX_TILES = 16
 
 app = flask.Flask(__name__)
 flask_cors.CORS(app)
 
+# Metrics of this process, shared with other workers when REGISTRY.directory is set,
+# and counting tiles once configure() is called
+REGISTRY = metrics.Registry()
+
+TILE_SECONDS = REGISTRY.register(metrics.Histogram('sharedstreets_tile_seconds',
+    'Time to get one tile from upstream data, before rendering.'))
+FETCH_SECONDS = REGISTRY.register(metrics.Histogram('sharedstreets_upstream_fetch_seconds',
+    'Time to request and read one upstream layer.', ['layer']))
+DECODE_SECONDS = REGISTRY.register(metrics.Histogram('sharedstreets_decode_seconds',
+    'Time to parse protobuf messages of one upstream layer.', ['layer']))
+FILTER_SECONDS = REGISTRY.register(metrics.Histogram('sharedstreets_filter_seconds',
+    'Time to select geometries inside one tile.'))
+JOIN_SECONDS = REGISTRY.register(metrics.Histogram('sharedstreets_join_seconds',
+    'Time to attach objects to selected geometries by id.'))
+UPSTREAM_BYTES = REGISTRY.register(metrics.Counter('sharedstreets_upstream_bytes_total',
+    'Upstream bytes read.', ['layer']))
+MESSAGES = REGISTRY.register(metrics.Counter('sharedstreets_messages_total',
+    'Upstream protobuf messages seen.', ['layer']))
+DECODED = REGISTRY.register(metrics.Counter('sharedstreets_messages_decoded_total',
+    'Upstream protobuf messages parsed into objects.', ['layer']))
+KEPT = REGISTRY.register(metrics.Counter('sharedstreets_objects_kept_total',
+    'Objects kept in tiles.', ['layer']))
+REGISTRY.register(metrics.Gauge('sharedstreets_tile_cache', 'Counters of the decoded data tile cache.',
+    lambda: {(name, ): value for (name, value) in tile.DATA_TILE_CACHE.stats().items()}, ['stat']))
+REGISTRY.register(metrics.Gauge('sharedstreets_layer_flights', 'Counters of shared upstream layer loads.',
+    lambda: {(name, ): value for (name, value) in tile.LAYER_FLIGHTS.stats().items()}, ['stat']))
+
+def observe_stats(stats):
+    ''' Add a completed stats.Stats instance to metrics.
+    '''
+    TILE_SECONDS.observe(stats.seconds)
+    FILTER_SECONDS.observe(stats.filter_seconds)
+    JOIN_SECONDS.observe(stats.join_seconds)
+
+    for (layer, layer_stats) in stats.layers.items():
+        if layer_stats.fetch_seconds:
+            # Layers read from the tile cache took no upstream time
+            FETCH_SECONDS.observe(layer_stats.fetch_seconds, layer=layer)
+            DECODE_SECONDS.observe(layer_stats.decode_seconds, layer=layer)
+
+        UPSTREAM_BYTES.inc(layer_stats.bytes, layer=layer)
+        MESSAGES.inc(layer_stats.messages, layer=layer)
+        DECODED.inc(layer_stats.decoded, layer=layer)
+        KEPT.inc(layer_stats.kept, layer=layer)
+
 @app.route('/')
 def get_index():
     return 'YO'
 
+def load_tile(zoom, x, y):
+    ''' Get a tile.Tile instance using upstream options from app.config.
+    '''
+    return tile.get_tile(zoom, x, y, app.config.get('SHAREDSTREETS_DATA_URL_TEMPLATE'),
+        cache=app.config.get('SHAREDSTREETS_CACHE'), tile_cache=tile.DATA_TILE_CACHE,
+        session=app.config.get('SHAREDSTREETS_SESSION'))
+
+def tile_response(version, render, mimetype):
+    ''' Get a cacheable flask.Response for a rendered tile.
+
+        version: Upstream version of the tile, or None.
+
+        render: Function returning an iterable of response body bytes.
+
+        The strong ETag combines the tile's upstream version with the request
+        URL, so a matching If-None-Match gets 304 Not Modified before any
+        rendering. Tiles without a version are rendered to compute it.
+    '''
+    if version is None:
+        body = b''.join(render())
+        etag = hashlib.sha1(body).hexdigest()
+    else:
+        body = None
+        etag = hashlib.sha1(' '.join((RENDER_VERSION, version,
+            flask.request.full_path)).encode('utf8')).hexdigest()
+
+    # Clients revalidate with the ETag of the encoding they were sent
+    encoding = choose_encoding(flask.request.accept_encodings)
+    etags = [etag] if encoding is None else ['{}-{}'.format(etag, encoding), etag]
+    matches = [etag for etag in etags if flask.request.if_none_match.contains(etag)]
+
+    if matches:
+        response = flask.Response(status=304)
+        response.set_etag(matches[0])
+    else:
+        response = flask.Response(render() if body is None else body, mimetype=mimetype)
+        response.set_etag(etag)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config.get('SHAREDSTREETS_MAX_AGE', CACHE_MAX_AGE_S)
+
+    return response
+
+def stored_tile_response(zoom, x, y, format, render, mimetype):
+    ''' Get a flask.Response for a tile, read from or written to a tile store.
+
+        render: Function of a tile.Tile instance returning an iterable of bytes.
+
+        With a store.TileStore in app.config, rendered tiles are kept in a
+        layer named for their format, gzipped for MVT like pyramid output,
+        and stored tiles are served without loading upstream data.
+    '''
+    tile_store = app.config.get('SHAREDSTREETS_TILE_STORE')
+
+    if tile_store is None:
+        T = load_tile(zoom, x, y)
+        return tile_response(T.version, lambda: render(T), mimetype)
+
+    data = tile_store.get(zoom, x, y, format)
+
+    if data is None:
+        data = b''.join(render(load_tile(zoom, x, y)))
+        tile_store.put(zoom, x, y, format, gzip.compress(data) if format == 'mvt' else data)
+    elif format == 'mvt':
+        data = gzip.decompress(data)
+
+    return tile_response(None, lambda: [data], mimetype)
+
 @app.route('/tile/<int:zoom>/<int:x>/<int:y>.geojson')
 def get_tile(zoom, x, y):
-    return flask.jsonify(tile.make_geojson(tile.get_tile(zoom, x, y)))
+    return stored_tile_response(zoom, x, y, 'geojson', tile.iter_geojson, 'application/json')
+
+@app.route('/tile/<int:zoom>/<int:x>/<int:y>.mvt')
+@app.route('/tile/<int:zoom>/<int:x>/<int:y>.pbf')
+def get_tile_mvt(zoom, x, y):
+    return stored_tile_response(zoom, x, y, 'mvt', lambda T: [tile.make_mvt(T, zoom, x, y)],
+        'application/vnd.mapbox-vector-tile')
+
+def parse_bbox(value):
+    ''' Return minlon, minlat, maxlon, maxlat from a "minlon,minlat,maxlon,maxlat" string.
+
+        Raise ValueError unless there are four finite numbers, in order and
+        within longitude and latitude ranges.
+    '''
+    minlon, minlat, maxlon, maxlat = bbox = [float(part) for part in value.split(',')]
+
+    if not all(map(math.isfinite, bbox)):
+        raise ValueError('Bbox values must be finite: {}'.format(value))
+
+    if not (-180 <= minlon < maxlon <= 180 and -90 <= minlat < maxlat <= 90):
+        raise ValueError('Bbox out of order or range: {}'.format(value))
+
+    return bbox
+
+@app.route('/bbox.geojson')
+def get_bbox():
+    ''' Get GeoJSON for a "bbox=minlon,minlat,maxlon,maxlat" query argument.
+
+        Bboxes covering more than SHAREDSTREETS_MAX_BBOX_TILES upstream data
+        tiles in app.config, default MAX_BBOX_TILES, get 413 Payload Too Large.
+    '''
+    try:
+        minlon, minlat, maxlon, maxlat = parse_bbox(flask.request.args['bbox'])
+    except (KeyError, ValueError):
+        flask.abort(400)
+
+    columns, rows = tile.data_tile_ranges(minlon, minlat, maxlon, maxlat)
+    max_tiles = app.config.get('SHAREDSTREETS_MAX_BBOX_TILES', MAX_BBOX_TILES)
+
+    if len(columns) * len(rows) > max_tiles:
+        flask.abort(413, 'Bbox covers {} data tiles, more than {}'.format(len(columns) * len(rows), max_tiles))
+
+    T = tile.query_bbox(minlon, minlat, maxlon, maxlat,
+        app.config.get('SHAREDSTREETS_DATA_URL_TEMPLATE'),
+        cache=app.config.get('SHAREDSTREETS_CACHE'), tile_cache=tile.DATA_TILE_CACHE,
+        session=app.config.get('SHAREDSTREETS_SESSION'))
+
+    return tile_response(T.version, lambda: tile.iter_geojson(T), 'application/json')
+
+@app.route('/metrics')
+def get_metrics():
+    ''' Get Prometheus metrics for this process.
+
+        With a shared REGISTRY.directory, metrics are summed across all
+        server worker processes, see server.main().
+    '''
+    return flask.Response(REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def choose_encoding(accept_encodings):
+    ''' Return "br", "gzip", or None for a werkzeug Accept-Encoding header.
+    '''
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accept_encodings[encoding] > 0:
+            return encoding
+
+    return None
+
+def iter_compressed(chunks, encoding):
+    ''' Generate compressed bytes for an iterable of chunks.
+    '''
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        compress, flush = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, flush = compressor.compress, compressor.flush
+
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+
+    yield flush()
+
+@app.after_request
+def compress_response(response):
+    ''' Compress successful responses with brotli or gzip when clients accept it.
+    '''
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(flask.request.accept_encodings)
+
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(b''.join(iter_compressed([data], encoding)))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+
+    if etag is not None:
+        # Each encoding is a distinct representation with its own strong ETag
+        response.set_etag('{}-{}'.format(etag, encoding), weak)
+
+    return response
 
 parser = argparse.ArgumentParser(description='Run a local SharedStreets tile webserver')
+tile.add_data_arguments(parser)
+tile.add_cache_arguments(parser)
+tile.add_session_arguments(parser)
+store.add_store_arguments(parser)
+
+def add_bbox_arguments(parser):
+    ''' Add bbox request limit option to an argparse.ArgumentParser.
+    '''
+    parser.add_argument('--max-bbox-tiles', type=int, default=MAX_BBOX_TILES,
+        help='Most upstream data tiles one /bbox.geojson request may read. Default %(default)s.')
+
+add_bbox_arguments(parser)
+
+def configure(args):
+    ''' Set upstream options in app.config from parsed arguments, and start metrics.
+    '''
+    _stats.add_hook(observe_stats)
+    app.config['SHAREDSTREETS_DATA_URL_TEMPLATE'] = args.data_url_template
+    app.config['SHAREDSTREETS_CACHE'] = tile.cache_from_arguments(args)
+    app.config['SHAREDSTREETS_SESSION'] = tile.session_from_arguments(args)
+    app.config['SHAREDSTREETS_TILE_STORE'] = store.store_from_arguments(args)
+    app.config['SHAREDSTREETS_MAX_BBOX_TILES'] = args.max_bbox_tiles
 
 def main():
-    parser.parse_args()
+    args = parser.parse_args()
+    configure(args)
     app.run(debug=True)    
@@ -0,0 +1,40 @@
+# Minimal reader for protobuf wire format, to inspect messages without parsing.
+# https://developers.google.com/protocol-buffers/docs/encoding
+from .stream import read_varint
+
+VARINT, FIXED64, LENGTH_DELIMITED, START_GROUP, END_GROUP, FIXED32 = 0, 1, 2, 3, 4, 5
+
+def iter_fields(message):
+    ''' Generate (field number, wire type, value) tuples from a message buffer.
+
+        Varint values are integers, and all others are memoryview slices of
+        the message with raw field contents.
+    '''
+    view, position = memoryview(message), 0
+
+    while position < len(view):
+        tag, position = read_varint(view, position)
+        field_number, wire_type = tag >> 3, tag & 0x07
+
+        if wire_type == VARINT:
+            value, position = read_varint(view, position)
+        elif wire_type == FIXED64:
+            value, position = view[position:position+8], position + 8
+        elif wire_type == LENGTH_DELIMITED:
+            length, position = read_varint(view, position)
+            value, position = view[position:position+length], position + length
+        elif wire_type == FIXED32:
+            value, position = view[position:position+4], position + 4
+        else:
+            raise ValueError('Unsupported wire type {}'.format(wire_type))
+
+        yield field_number, wire_type, value
+
+def read_string(message, field_number):
+    ''' Return the first string value of a field in a message buffer, or None.
+    '''
+    for (number, wire_type, value) in iter_fields(message):
+        if number == field_number and wire_type == LENGTH_DELIMITED:
+            return bytes(value).decode('utf8')
+
+    return None